@@ -0,0 +1,179 @@
+"""
+Admission control for the inference stage.
+
+model.predict is the slow step of an upload. Without a bound, a traffic
+spike queues requests behind it until gunicorn's timeout kills the
+worker. AdmissionController lets INFERENCE_CONCURRENCY requests per
+process run inference at once and up to INFERENCE_QUEUE_DEPTH wait for a
+slot. A request beyond that, or one that would wait longer than
+INFERENCE_QUEUE_TIMEOUT, is shed with Overloaded, which the routes turn
+into 503 with a Retry-After estimated from recent inference times.
+
+check_upload rejects oversized uploads from the byte size and the image
+header (PIL reads the dimensions without decoding), before anything is
+saved or decoded.
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from PIL import Image
+
+# Requests running model inference at once in one process
+INFERENCE_CONCURRENCY = int(os.getenv('INFERENCE_CONCURRENCY', '1'))
+# Requests allowed to wait for an inference slot
+INFERENCE_QUEUE_DEPTH = int(os.getenv('INFERENCE_QUEUE_DEPTH', '4'))
+# Longest wait for a slot (seconds), well inside gunicorn's 120s timeout
+INFERENCE_QUEUE_TIMEOUT = float(os.getenv('INFERENCE_QUEUE_TIMEOUT', '10'))
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(16 * 1024 * 1024)))
+MAX_UPLOAD_PIXELS = int(os.getenv('MAX_UPLOAD_PIXELS', str(40_000_000)))
+# Weight of the latest inference in the moving average used for Retry-After
+DURATION_SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    """The inference queue is full, or a slot did not free up in time"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Server is busy ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class UploadRejected(Exception):
+    """An upload is too large or not an image"""
+
+    def __init__(self, message, status=413):
+        super().__init__(message)
+        self.status = status
+
+
+class AdmissionController:
+    """Bounded inference concurrency with a bounded wait queue"""
+
+    def __init__(self, max_concurrent=INFERENCE_CONCURRENCY, max_queue=INFERENCE_QUEUE_DEPTH,
+                 queue_timeout=INFERENCE_QUEUE_TIMEOUT, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_UPLOAD_PIXELS):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "timeout": 0}
+        self.rejected = {"too_large": 0, "too_many_pixels": 0, "not_an_image": 0}
+        # Moving average of inference time, for Retry-After
+        self.average_duration = 1.0
+
+    def retry_after(self):
+        """Seconds until a slot is likely to be free (call with the condition held)"""
+        waves = (self.queued + self.in_flight) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(waves * self.average_duration))
+
+    def _shed(self, reason):
+        self.shed[reason] += 1
+        return Overloaded(reason, self.retry_after())
+
+    def acquire(self):
+        """
+        Take an inference slot, waiting in the queue if there is room
+
+        Raises:
+            Overloaded: The queue is full or the wait timed out
+        """
+        with self.condition:
+            if self.in_flight >= self.max_concurrent or self.queued:
+                if self.queued >= self.max_queue:
+                    raise self._shed("queue_full")
+                self.queued += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self.in_flight >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise self._shed("timeout")
+                        self.condition.wait(remaining)
+                finally:
+                    self.queued -= 1
+            self.in_flight += 1
+            self.admitted += 1
+
+    def release(self, duration=None):
+        """Free a slot, recording how long inference took"""
+        with self.condition:
+            self.in_flight -= 1
+            if duration is not None:
+                self.average_duration += DURATION_SMOOTHING * (duration - self.average_duration)
+            self.condition.notify()
+
+    @contextmanager
+    def slot(self):
+        """Hold an inference slot for the duration of a with block"""
+        self.acquire()
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - began)
+
+    def accepting(self):
+        """Whether a new request would get a slot or a place in the queue right now"""
+        with self.condition:
+            return self.in_flight < self.max_concurrent or self.queued < self.max_queue
+
+    def overloaded(self):
+        """Overloaded error for a request turned away before it queues"""
+        with self.condition:
+            return self._shed("queue_full")
+
+    def check_upload(self, file):
+        """
+        Reject an upload by byte size and header dimensions, without decoding it
+
+        Args:
+            file (FileStorage): Uploaded file (its stream must be seekable)
+
+        Raises:
+            UploadRejected: The file is too large, has too many pixels or is not an image
+        """
+        stream = file.stream
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        if size > self.max_bytes:
+            self.reject("too_large")
+            raise UploadRejected(f"Upload is {size} bytes, the limit is {self.max_bytes}")
+
+        try:
+            # Parses the header only; pixel data is read on load()
+            width, height = Image.open(stream).size
+        except Image.DecompressionBombError:
+            width, height = math.inf, 1
+        except Exception:
+            self.reject("not_an_image")
+            raise UploadRejected("Upload is not a readable image", 400)
+        finally:
+            stream.seek(0)
+        if width * height > self.max_pixels:
+            self.reject("too_many_pixels")
+            raise UploadRejected(f"Image has more than {self.max_pixels} pixels")
+
+    def reject(self, reason):
+        """Count an upload turned away before inference"""
+        with self.condition:
+            self.rejected[reason] += 1
+
+    def stats(self):
+        """Queue depth, in-flight inferences and shed/rejected counts"""
+        with self.condition:
+            return {"in_flight": self.in_flight, "queued": self.queued, "max_concurrent": self.max_concurrent,
+                    "max_queue": self.max_queue, "admitted": self.admitted, "shed": dict(self.shed),
+                    "rejected": dict(self.rejected),
+                    "average_inference_ms": round(self.average_duration * 1000, 1)}
+
+
+admission = AdmissionController()
@@ -1,34 +1,46 @@
 import numpy as np
-import pickle as pkl
 import tensorflow as tf
-from tensorflow.keras.applications.resnet50 import ResNet50, preprocess_input
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.layers import GlobalMaxPool2D
-from sklearn.neighbors import NearestNeighbors
 import os
 import re
-import io
 import json
-from numpy.linalg import norm
-from flask import Flask, request, jsonify, send_from_directory, send_file, make_response
+import signal
+import uuid
+from image_loader import load_image
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import cloudinary_utils as cloud
 import time
-from datetime import datetime
+import threading
 from flask_swagger_ui import get_swaggerui_blueprint
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+from image_variants import variant_cache, parse_variant_args, VariantError, VARIANT_CACHE_CONTROL
+import http_cache
+import contact_sheet
+from dedup import SELF_MATCH_DISTANCE
+from query_cache import query_cache
+from admission import admission, Overloaded, UploadRejected
+from werkzeug.exceptions import RequestEntityTooLarge
+from backbones import active_backbone as backbone
+from search_index import IndexHandle, SearchIndex, load_search_index
+from shard_search import ShardsUnavailable
+import catalogue_delta
+from catalogue_delta import StaleLog, compact, encode_features, mutate
+from categories import category_article_types, get_category_from_filename
+from colour_index import colour_histogram
 
 # Import authentication and database modules
 from auth import create_user, authenticate_user, generate_token, get_user_by_id
-from middleware import auth_required
+from middleware import auth_required, admin_required
 from models import save_uploaded_image, get_user_images, get_image_by_id, delete_image
+from profiles import get_taste
+import database
+from write_buffer import write_buffer
 
-# Import PDF generation library (PyFPDF which doesn't have additional dependencies)
-try:
-    from fpdf import FPDF
-except ImportError:
-    print("FPDF library not installed. PDF reports will not be available.")
-    print("To install: pip install fpdf")
+# PDF report generation (PyFPDF templates with a rendered-report cache)
+from reports import generate_pdf_report, stream_bytes
+from report_jobs import report_jobs
 
 # Load environment variables
 load_dotenv()
@@ -54,79 +66,60 @@ swaggerui_blueprint = get_swaggerui_blueprint(
 
 app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
-try:
-    Image_features = pkl.load(open("Images_features.pkl", "rb"))
-    filenames = pkl.load(open("filenames.pkl", "rb"))
+# Refuse request bodies well past the upload limit before parsing them (multipart headers need some slack)
+app.config['MAX_CONTENT_LENGTH'] = admission.max_bytes + 64 * 1024
+
+# "exact" (brute-force NearestNeighbors), "binary" (binary_index.py) or "sharded" (shard_search.py)
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'exact')
 
-    model = ResNet50(weights="imagenet", include_top=False, input_shape=(224, 224, 3))
-    model.trainable = False
-    model = tf.keras.models.Sequential([model, GlobalMaxPool2D()])
+def load_index():
+    """The feature store of the configured backbone (BACKBONE, see backbones.py), loaded and validated"""
+    index = load_search_index(backbone, SEARCH_MODE)
+    # A reload can bring the first usable index to a worker that started without one
+    ensure_model(index)
+    return index
 
-    neighbors = NearestNeighbors(n_neighbors=6, algorithm="brute", metric="euclidean")
-    neighbors.fit(Image_features)
+def ensure_model(index):
+    """Build the feature extractor once an index to search is loaded"""
+    global model
+    if model is None and index.neighbors is not None:
+        try:
+            model = backbone.build()
+            print(f"Extracting features with {backbone.version}")
+        except Exception as e:
+            print(f"Warning: Could not load ML models: {e}")
+
+# Built only with an index, so the cheap fallback tiers still work without the model
+model = None
+try:
+    index_handle = IndexHandle(load_index())
 except Exception as e:
-    print(f"Warning: Could not load ML models: {e}")
+    print(f"Warning: Could not load the catalogue index: {e}")
     print("Fashion recommendation functionality may be limited")
     
-    # Create dummy data for testing
-    Image_features = []
-    filenames = []
-    model = None
-    neighbors = None
-
-# Define fashion categories (mapping patterns in filenames to categories)
-category_patterns = {
-    "tshirt": "T-Shirt",
-    "shirt": "Shirt",
-    "jeans": "Jeans",
-    "trouser": "Trousers",
-    "pant": "Pants",
-    "dress": "Dress",
-    "skirt": "Skirt",
-    "jacket": "Jacket",
-    "coat": "Coat",
-    "sweater": "Sweater",
-    "hoodie": "Hoodie",
-    "shorts": "Shorts",
-    "top": "Top",
-    "blouse": "Blouse",
-    "formal": "Formal Wear",
-    "casual": "Casual Wear",
-    "shoe": "Shoes",
-    "sneaker": "Sneakers",
-    "boot": "Boots",
-    "sandal": "Sandals",
-    "accessory": "Accessories",
-    "bag": "Bags",
-    "handbag": "Handbags",
-    "hat": "Hats",
-    "scarf": "Scarves",
-    "watch": "Watches",
-    "jewelry": "Jewelry"
-}
-
-def get_category_from_filename(filename):
-    """Extract category from filename"""
-    filename_lower = filename.lower()
-    
-    # Default category if none is found
-    category = "Fashion Item"
-    
-    for pattern, cat_name in category_patterns.items():
-        if pattern in filename_lower:
-            category = cat_name
-            break
-            
-    return category
+    # Serve an empty index until a reload brings a valid one
+    index_handle = IndexHandle(SearchIndex([], []))
+
+# Cached recommendations came from the index being replaced
+index_handle.on_swap.append(lambda index: query_cache.clear())
+
+def reload_on_signal(signum, frame):
+    index_handle.reload(load_index)
+
+# Reload the index in place: SIGHUP, POST /api/admin/reload-index, or INDEX_WATCH_INTERVAL
+try:
+    signal.signal(signal.SIGHUP, reload_on_signal)
+except (AttributeError, ValueError):
+    # No SIGHUP on Windows; signals can only be handled from the main thread
+    pass
+index_handle.watch(backbone, load_index)
+# Apply catalogue items added or removed through other workers (catalogue_delta.py)
+catalogue_delta.follow(index_handle, backbone, load_index, on_change=query_cache.clear)
 
 def extract_features_from_images(image_path, model):
-    img = image.load_img(image_path, target_size=(224, 224))
-    img_array = image.img_to_array(img)
-    img_expand_dim = np.expand_dims(img_array, axis=0)
-    img_preprocess = preprocess_input(img_expand_dim)
-    result = model.predict(img_preprocess, verbose=0).flatten()
-    norm_result = result / norm(result)
-    return norm_result
+    # Decodes JPEGs at reduced scale and applies EXIF orientation
+    img_array = load_image(image_path, backbone.target_size)
+    return backbone.extract(model, img_array)
 
 def calculate_confidence(distance):
     """Convert distance to confidence score (0-100%)"""
@@ -135,67 +128,13 @@ def calculate_confidence(distance):
     # Max confidence is 100%, min is around 50%
     return max(50, round(100 * np.exp(-distance * 0.5)))
 
-def generate_pdf_report(recommendations, category, style):
-    """Generate a PDF report for the style analysis"""
-    try:
-        # Create PDF instance
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # Set font and styling
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, "Fashion Style Analysis Report", 0, 1, "C")
-        
-        # Add date
-        pdf.set_font("Arial", "", 12)
-        pdf.cell(0, 10, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M')}", 0, 1, "C")
-        
-        # Add uploaded image info
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, "Analyzed Item", 0, 1)
-        pdf.set_font("Arial", "", 12)
-        pdf.cell(0, 10, f"Category: {category}", 0, 1)
-        pdf.cell(0, 10, f"Detected Style: {style}", 0, 1)
-        
-        # Add recommendations
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 15, "Recommended Similar Items", 0, 1)
-        
-        pdf.set_font("Arial", "", 12)
-        for i, rec in enumerate(recommendations):
-            pdf.cell(0, 10, f"{i+1}. {rec['category']} (Confidence: {rec['confidence']}%)", 0, 1)
-        
-        # Add styling tips
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 15, "Style Tips", 0, 1)
-        
-        pdf.set_font("Arial", "", 12)
-        pdf.cell(0, 10, f"1. {category} items work well with complementary accessories.", 0, 1)
-        pdf.cell(0, 10, f"2. Consider pairing with similar styled items for a cohesive look.", 0, 1)
-        pdf.cell(0, 10, f"3. This style works well for both casual and formal occasions.", 0, 1)
-        
-        # Add footer
-        pdf.set_y(-20)
-        pdf.set_font("Arial", "I", 10)
-        pdf.cell(0, 10, "Fashion Recommendation System - www.fashionrec.ai", 0, 0, "C")
-        
-        # Get the PDF as bytes
-        pdf_output = io.BytesIO()
-        pdf.output(pdf_output)
-        pdf_output.seek(0)
-        
-        return pdf_output
-    except Exception as e:
-        print(f"Error generating PDF: {e}")
-        return None
-
 @app.route('/swagger.json')
 def swagger_json():
     """Serve the swagger definition file"""
     # Get the absolute path to the current directory
     current_dir = os.path.dirname(os.path.abspath(__file__))
     swagger_path = os.path.join(current_dir, 'swagger.json')
-    return send_file(swagger_path, mimetype='application/json')
+    return http_cache.send_cached_file(swagger_path, http_cache.REVALIDATE, mimetype='application/json')
 
 @app.route("/", methods=["GET"])
 def index():
@@ -298,108 +237,397 @@ def get_me():
         print(f"Error in get_me route: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/upload", methods=["POST"])
-@auth_required
-def upload_file():
-    try:
-        if "file" not in request.files:
-            return jsonify({"error": "No file uploaded"}), 400
-        file = request.files["file"]
-        if file.filename == "":
-            return jsonify({"error": "No file selected"}), 400
-        
-        # Create uploads directory if it doesn't exist
-        os.makedirs("uploads", exist_ok=True)
+def upload_path_for(original_filename, timestamp):
+    """Unique local path for an upload (timestamp plus a random suffix, so uploads in the same second don't collide)"""
+    file_parts = os.path.splitext(original_filename)
+    return os.path.join("uploads", f"upload_{timestamp}_{uuid.uuid4().hex[:8]}{file_parts[1]}")
+
+def save_upload(file):
+    """
+    Save an uploaded file under uploads/ with a unique name
+
+    Args:
+        file (FileStorage): File from request.files
+
+    Returns:
+        tuple: (original filename, local path, timestamp)
+    """
+    # Create uploads directory if it doesn't exist
+    os.makedirs("uploads", exist_ok=True)
+    
+    timestamp = int(time.time())
+    original_filename = file.filename
+    
+    # Save temporarily to process with the model
+    upload_path = upload_path_for(original_filename, timestamp)
+    file.save(upload_path)
+    
+    print(f"File saved locally at: {upload_path}")
+    return original_filename, upload_path, timestamp
+
+# Upper bound of ?limit= for personal recommendations
+MAX_PERSONAL_RECOMMENDATIONS = 50
+# Answer from cheap signals when the model is missing or shed, instead of returning nothing or 503
+DEGRADED_RECOMMENDATIONS = os.getenv('DEGRADED_RECOMMENDATIONS', 'true').lower() != 'false'
+# Distance reported for category-only recommendations (the lowest confidence)
+CATEGORY_DISTANCE = 2.0
+
+# Recommendations served per tier, for /api/metrics
+tier_counts = {}
+tier_counts_lock = threading.Lock()
+
+def recommendation(filename, distance):
+    """Recommendation dict of a catalogue file at a distance from the query"""
+    filename = os.path.basename(filename)
+    return {
+        "filename": filename,
+        "category": get_category_from_filename(filename),
+        "confidence": calculate_confidence(distance)
+    }
+
+def nearest_items(index, features, count=5, exclude_query=False):
+    """
+    Catalogue items nearest to a feature vector, one per near-duplicate cluster,
+    including items added online (catalogue_delta.py)
+    
+    Args:
+        index (SearchIndex): Index leased from index_handle
+        features (array): Normalised feature vector
+        count (int, optional): Number of items. Defaults to 5.
+        exclude_query (bool, optional): Leave out the catalogue item the query is
+            (a near-duplicate of), if any. Defaults to False.
         
-        # Generate a unique filename with timestamp to avoid collisions
-        timestamp = int(time.time())
-        original_filename = file.filename
-        file_parts = os.path.splitext(original_filename)
-        sanitized_filename = f"upload_{timestamp}{file_parts[1]}"
+    Returns:
+        list: Recommendation dicts with filename, category and confidence
+    """
+    recommendations = []
+    fetch = count + 1 if exclude_query else count
+    
+    # Prepare recommendations with additional data
+    for distance, filename in index.search(features, fetch):
+        if exclude_query and distance <= SELF_MATCH_DISTANCE:
+            exclude_query = False
+            continue
+        recommendations.append(recommendation(filename, distance))
+    
+    return recommendations[:count]
+
+def catalogue_copy_recommendations(index, upload_path):
+    """
+    Precomputed recommendations when the upload is a copy of a catalogue image
+    
+    Returns:
+        tuple: (recommendations, embedding of the catalogue item), or None
+    """
+    if index.catalogue_matcher is None:
+        return None
+    match = index.catalogue_matcher.match(upload_path)
+    if match is None:
+        return None
+    row, distance = match
+    precomputed = index.catalogue_matcher.recommendations(row)
+    # A removed or replaced item's image is no longer the catalogue's
+    if precomputed is None or index.is_removed(row):
+        return None
+    
+    print(f"Upload matches catalogue item {os.path.basename(index.filenames[row])} (pHash distance {distance}), skipping the model")
+    rows, distances = precomputed
+    recommendations = [recommendation(index.filenames[i], d) for i, d in zip(rows, distances)
+                       if not index.is_removed(i)]
+    return recommendations, np.asarray(index.features[row], dtype=np.float32)
+
+def category_positions(index, category):
+    """Positions in index.index_filenames of the catalogue items matching an upload category, or None"""
+    matches = [index.article_positions[t] for t in category_article_types.get(category, [])
+               if t in index.article_positions]
+    if not matches:
+        return None
+    positions = np.sort(np.concatenate(matches))
+    return np.array([p for p in positions if not index.is_removed(index.rows[p])], dtype=np.int64)
+
+def degraded_available():
+    """Whether any cheap tier can answer without the model"""
+    index = index_handle.current
+    return DEGRADED_RECOMMENDATIONS and (index.colour_index is not None or bool(index.article_positions))
+
+def degraded_recommendations(index, upload_path, category=None, count=5):
+    """
+    Recommendations from cheap signals, for when the model can't be used
+    
+    Nearest colour histograms, within the upload's category when styles.csv
+    knows it, or else items of that category.
+    
+    Args:
+        index (SearchIndex): Index leased from index_handle
+        upload_path (str): Uploaded image
+        category (str, optional): Category from the upload's filename. Defaults to None.
+        count (int, optional): Number of items. Defaults to 5.
         
-        # Save temporarily to process with the model
-        upload_path = os.path.join("uploads", sanitized_filename)
-        file.save(upload_path)
+    Returns:
+        tuple: (recommendations, tier), or ([], "none") if no tier can answer
+    """
+    if not DEGRADED_RECOMMENDATIONS:
+        return [], "none"
+    positions = category_positions(index, category)
+    if positions is not None and len(positions) < count:
+        positions = None
+    
+    if index.colour_index is not None:
+        try:
+            # Items added online have no histogram until colour_index.py is re-run
+            fetch = count + len(index.delta.state.removed)
+            rows, distances = index.colour_index.search(colour_histogram(upload_path), fetch, positions)
+            return [recommendation(index.filenames[row], d) for row, d in zip(rows, distances)
+                    if not index.is_removed(row)][:count], "colour"
+        except Exception as e:
+            print(f"Could not compute the colour histogram of {upload_path}: {e}")
+    
+    if positions is not None:
+        return [recommendation(index.index_filenames[p], CATEGORY_DISTANCE) for p in positions[:count]], "category"
+    return [], "none"
+
+def count_tier(tier):
+    with tier_counts_lock:
+        tier_counts[tier] = tier_counts.get(tier, 0) + 1
+    return tier
+
+def find_recommendations(upload_path, category=None, shed=False):
+    """
+    Nearest catalogue items for an uploaded image, from the best tier available
+    
+    Tiers, in order: "catalogue_copy" (the upload is a copy of a catalogue
+    image, answered from the pHash index), "query_cache" or "cnn" (backbone
+    features), then, when the model is missing or shed under load,
+    "colour" and "category" (see degraded_recommendations). "none" means
+    nothing could answer.
+    
+    Args:
+        upload_path (str): Uploaded image
+        category (str, optional): Category from the upload's filename, for the category tier. Defaults to None.
+        shed (bool, optional): Skip the model as if admission control had shed the request. Defaults to False.
+    
+    Returns:
+        tuple: (recommendations, embedding of the upload or None, tier)
+    
+    Raises:
+        Overloaded: The model is overloaded and no cheap tier can answer
+        ShardsUnavailable: No search shard answered and no cheap tier can answer
+    """
+    # Requests that started before a reload finish on the index they began with
+    with index_handle.lease() as index:
+        copy_of_catalogue = catalogue_copy_recommendations(index, upload_path)
+        if copy_of_catalogue is not None:
+            return (*copy_of_catalogue, count_tier("catalogue_copy"))
         
-        print(f"File saved locally at: {upload_path}")
+        if model is not None and index.neighbors is not None:
+            try:
+                if shed:
+                    raise admission.overloaded()
+                # Raises Overloaded when too many requests are already waiting for the model
+                with admission.slot():
+                    input_img_features = extract_features_from_images(upload_path, model)
+                    # The same garment photographed again lands next to a cached query
+                    recommendations = query_cache.get(input_img_features)
+                    tier = "query_cache"
+                    if recommendations is None:
+                        recommendations = nearest_items(index, input_img_features, 5, exclude_query=True)
+                        # Results from an index swapped out meanwhile would outlive it in the cache
+                        if index is index_handle.current:
+                            query_cache.put(input_img_features, recommendations)
+                        tier = "cnn"
+                return recommendations, input_img_features, count_tier(tier)
+            except (Overloaded, ShardsUnavailable) as e:
+                recommendations, tier = degraded_recommendations(index, upload_path, category)
+                if not recommendations:
+                    raise
+                print(f"CNN tier unavailable ({e.reason}), answering from the {tier} tier")
+                return recommendations, None, count_tier(tier)
         
-        # Extract features for recommendation (skip if model isn't loaded)
-        recommendations = []
+        recommendations, tier = degraded_recommendations(index, upload_path, category)
+        return recommendations, None, count_tier(tier)
+
+def upload_to_cdn(upload_path, user_id):
+    """Upload to Cloudinary, returning its URL or the local /uploads URL on failure"""
+    public_id = os.path.splitext(os.path.basename(upload_path))[0]
+    
+    # Default to local URL in case Cloudinary fails
+    image_url = f"/uploads/{os.path.basename(upload_path)}"
+    
+    try:
+        print(f"Attempting Cloudinary upload for user {user_id}")
+        cloudinary_upload = cloud.upload_image(
+            upload_path, 
+            public_id=public_id,
+            user_id=user_id
+        )
         
-        if model is not None and neighbors is not None:
-            input_img_features = extract_features_from_images(upload_path, model)
-            distances, indices = neighbors.kneighbors([input_img_features])
+        # Only use Cloudinary URL if upload was successful (not a fallback)
+        if 'secure_url' in cloudinary_upload and not cloudinary_upload.get('fallback', False):
+            image_url = cloudinary_upload['secure_url']
+            print(f"Using Cloudinary URL: {image_url}")
+        else:
+            print(f"Using local URL as fallback: {image_url}")
             
-            # Prepare recommendations with additional data
-            for i in range(1, min(6, len(indices[0]))):  # Skip the first one as it's usually the same image
-                idx = indices[0][i]
-                filename = os.path.basename(filenames[idx])
-                distance = distances[0][i]
-                confidence = calculate_confidence(distance)
-                category = get_category_from_filename(filename)
-                
-                recommendations.append({
-                    "filename": filename,
-                    "category": category,
-                    "confidence": confidence
-                })
+    except Exception as cloud_error:
+        print(f"Cloudinary upload error: {cloud_error}")
+    
+    return image_url
+
+def store_upload(user_id, original_filename, image_url, uploaded_category, recommendations, timestamp,
+                 embedding=None):
+    """Save the upload to MongoDB, returning its ID (a placeholder if the save fails)"""
+    try:
+        # Save to MongoDB
+        image_data = save_uploaded_image(
+            user_id=user_id,
+            filename=original_filename,  # Store original filename for display
+            image_url=image_url,
+            category=uploaded_category,
+            recommendations=recommendations,
+            embedding=embedding
+        )
+        image_id = image_data["_id"]
+        print(f"Image saved to database with ID: {image_id}")
+    except Exception as db_error:
+        print(f"Database error: {db_error}")
+        # Use a placeholder ID if database save fails
+        image_id = f"temp_id_{timestamp}"
+    
+    return image_id
+
+def overloaded_response(error):
+    """503 response for a request shed by admission control"""
+    response = jsonify({"error": str(error), "reason": error.reason, "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+def get_uploaded_file():
+    """The uploaded file of the request, or an error response"""
+    try:
+        files = request.files
+    except RequestEntityTooLarge:
+        admission.reject("too_large")
+        return None, (jsonify({"error": f"Upload exceeds {admission.max_bytes} bytes"}), 413)
+    if "file" not in files:
+        return None, (jsonify({"error": "No file uploaded"}), 400)
+    file = files["file"]
+    if file.filename == "":
+        return None, (jsonify({"error": "No file selected"}), 400)
+    # Byte size and header dimensions, checked before the file is saved or decoded
+    try:
+        admission.check_upload(file)
+    except UploadRejected as e:
+        return None, (jsonify({"error": str(e)}), e.status)
+    return file, None
+
+@app.route("/upload", methods=["POST"])
+@auth_required
+def upload_file():
+    try:
+        file, error = get_uploaded_file()
+        if error:
+            return error
         
-        # Upload to Cloudinary using our utility module with user_id
-        public_id = f"upload_{timestamp}"
+        original_filename, upload_path, timestamp = save_upload(file)
         user_id = request.user["_id"]
         
-        # Default to local URL in case Cloudinary fails
-        image_url = f"/uploads/{sanitized_filename}"
-        
-        try:
-            print(f"Attempting Cloudinary upload for user {user_id}")
-            cloudinary_upload = cloud.upload_image(
-                upload_path, 
-                public_id=public_id,
-                user_id=user_id
-            )
-            
-            # Only use Cloudinary URL if upload was successful (not a fallback)
-            if 'secure_url' in cloudinary_upload and not cloudinary_upload.get('fallback', False):
-                image_url = cloudinary_upload['secure_url']
-                print(f"Using Cloudinary URL: {image_url}")
-            else:
-                print(f"Using local URL as fallback: {image_url}")
-                
-        except Exception as cloud_error:
-            print(f"Cloudinary upload error: {cloud_error}")
-        
         # Get the category of the uploaded image
         uploaded_category = get_category_from_filename(original_filename)
         
-        try:
-            # Save to MongoDB
-            image_data = save_uploaded_image(
-                user_id=user_id,
-                filename=original_filename,  # Store original filename for display
-                image_url=image_url,
-                category=uploaded_category,
-                recommendations=recommendations
-            )
-            image_id = image_data["_id"]
-            print(f"Image saved to database with ID: {image_id}")
-        except Exception as db_error:
-            print(f"Database error: {db_error}")
-            # Use a placeholder ID if database save fails
-            image_id = f"temp_id_{timestamp}"
+        # Extract features for recommendation (cheaper tiers if the model isn't loaded or is busy)
+        recommendations, embedding, tier = find_recommendations(upload_path, uploaded_category)
+        
+        # Upload to Cloudinary using our utility module with user_id
+        image_url = upload_to_cdn(upload_path, user_id)
+        
+        image_id = store_upload(user_id, original_filename, image_url, uploaded_category, recommendations, timestamp,
+                                embedding)
         
         return jsonify({
             "uploaded_image": original_filename,
             "uploaded_category": uploaded_category,
             "image_url": image_url,
             "recommendations": recommendations,
+            "tier": tier,
+            "contact_sheet": contact_sheet.describe([rec["filename"] for rec in recommendations]),
             "image_id": image_id,
             "status": "success"
         })
+    except Overloaded as e:
+        print(f"Shedding upload: {e}")
+        return overloaded_response(e)
     except Exception as e:
         print(f"Error in upload_file route: {e}")
         return jsonify({"error": str(e)}), 500
 
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/upload/stream", methods=["POST"])
+@auth_required
+def upload_file_stream():
+    """
+    Same as /upload, but streamed as Server-Sent Events
+
+    Events, in order: "recommendations" as soon as the neighbour search is
+    done, "image_url" after the Cloudinary upload, "saved" with the database
+    ID, then "done" with the full /upload response. Failures send "error".
+    """
+    file, error = get_uploaded_file()
+    if error:
+        return error
+    # The status code can't change once the stream starts, so shed up front
+    if not admission.accepting() and not degraded_available():
+        return overloaded_response(admission.overloaded())
+    
+    # Save before streaming starts: the request body is not readable afterwards
+    original_filename, upload_path, timestamp = save_upload(file)
+    user_id = request.user["_id"]
+    
+    def events():
+        try:
+            uploaded_category = get_category_from_filename(original_filename)
+            recommendations, embedding, tier = find_recommendations(upload_path, uploaded_category)
+            sheet = contact_sheet.describe([rec["filename"] for rec in recommendations])
+            yield sse_event("recommendations", {
+                "uploaded_image": original_filename,
+                "uploaded_category": uploaded_category,
+                "recommendations": recommendations,
+                "tier": tier,
+                "contact_sheet": sheet
+            })
+            
+            image_url = upload_to_cdn(upload_path, user_id)
+            yield sse_event("image_url", {"image_url": image_url})
+            
+            image_id = store_upload(user_id, original_filename, image_url, uploaded_category, recommendations, timestamp,
+                                embedding)
+            yield sse_event("saved", {"image_id": image_id})
+            
+            yield sse_event("done", {
+                "uploaded_image": original_filename,
+                "uploaded_category": uploaded_category,
+                "image_url": image_url,
+                "recommendations": recommendations,
+                "tier": tier,
+                "contact_sheet": sheet,
+                "image_id": image_id,
+                "status": "success"
+            })
+        except Overloaded as e:
+            print(f"Shedding streamed upload: {e}")
+            yield sse_event("error", {"error": str(e), "reason": e.reason, "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"Error in upload_file_stream route: {e}")
+            yield sse_event("error", {"error": str(e)})
+    
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies (nginx) from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/images', methods=['GET'])
 @auth_required
 def get_user_uploaded_images():
@@ -459,6 +687,43 @@ def delete_user_image(image_id):
         print(f"Error in delete_user_image route: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/recommend/personal', methods=['GET'])
+@auth_required
+def personal_recommendations():
+    """Recommend from the current user's taste vector (no upload or model inference)"""
+    try:
+        limit = int(request.args.get('limit', 5))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if not 1 <= limit <= MAX_PERSONAL_RECOMMENDATIONS:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PERSONAL_RECOMMENDATIONS}"}), 400
+    
+    try:
+        taste, count = get_taste(request.user["_id"])
+        if taste is None:
+            return jsonify({"error": "No upload history yet", "detail": "Upload an image first"}), 404
+        with index_handle.lease() as index:
+            if index.neighbors is None:
+                return jsonify({"error": "Recommendation index is not loaded"}), 503
+            recommendations = nearest_items(index, taste, limit)
+        
+        return jsonify({
+            "recommendations": recommendations,
+            "contact_sheet": contact_sheet.describe([rec["filename"] for rec in recommendations]),
+            "based_on_uploads": count,
+            "status": "success"
+        })
+    except Exception as e:
+        print(f"Error in personal_recommendations route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def json_flag(data, key, default):
+    """A boolean field of a JSON body, also accepting the strings "true" and "false" """
+    value = data.get(key, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes')
+    return bool(value)
+
 @app.route('/generate-report', methods=['POST'])
 @auth_required
 def generate_report():
@@ -474,17 +739,20 @@ def generate_report():
         recommendations = data.get('recommendations', [])
         category = data.get('uploaded_category', 'Fashion Item')
         style = data.get('style', 'Casual')
+        include_images = json_flag(data, 'include_images', True)
         
-        # Generate PDF
-        pdf_bytes = generate_pdf_report(recommendations, category, style)
-        
-        if not pdf_bytes:
+        # Generate PDF (identical analyses are served from the report cache)
+        try:
+            pdf_bytes, report_id = generate_pdf_report(recommendations, category, style, include_images)
+        except Exception as pdf_error:
+            print(f"Error generating PDF: {pdf_error}")
             return jsonify({"error": "Failed to generate PDF report"}), 500
         
-        # Create response with PDF
-        response = make_response(pdf_bytes.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
+        # Stream the PDF back in chunks
+        response = Response(stream_bytes(pdf_bytes), mimetype='application/pdf')
+        response.headers['Content-Length'] = str(len(pdf_bytes))
         response.headers['Content-Disposition'] = f'attachment; filename=fashion-report-{int(time.time())}.pdf'
+        response.headers['X-Report-Id'] = report_id
         
         return response
     
@@ -492,13 +760,283 @@ def generate_report():
         print(f"Error in generate_report: {e}")
         return jsonify({"error": str(e)}), 500
 
+def report_job_status(job):
+    """Public view of a report job, with its polling and download URLs"""
+    status = {key: job[key] for key in ("id", "status", "total", "done", "pages", "size", "error")}
+    status["status_url"] = f"/api/reports/jobs/{job['id']}"
+    status["download_url"] = f"/api/reports/jobs/{job['id']}/download" if job["status"] == "done" else None
+    return status
+
+@app.route('/api/reports/jobs', methods=['POST'])
+@auth_required
+def create_report_job():
+    """Queue a PDF report covering all of the current user's uploads"""
+    try:
+        data = request.get_json(silent=True) or {}
+        job = report_jobs.submit(request.user["_id"], json_flag(data, 'include_images', True))
+        return jsonify(report_job_status(job)), 202
+    except Exception as e:
+        print(f"Error in create_report_job route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/reports/jobs/<job_id>', methods=['GET'])
+@auth_required
+def get_report_job(job_id):
+    """Progress of a report job"""
+    job = report_jobs.get(job_id)
+    if not job or job["user_id"] != request.user["_id"]:
+        return jsonify({"error": "Report job not found"}), 404
+    return jsonify(report_job_status(job))
+
+@app.route('/api/reports/jobs/<job_id>/download', methods=['GET'])
+@auth_required
+def download_report_job(job_id):
+    """Download the PDF of a finished report job"""
+    job = report_jobs.get(job_id)
+    if not job or job["user_id"] != request.user["_id"]:
+        return jsonify({"error": "Report job not found"}), 404
+    if job["status"] != "done":
+        return jsonify({"error": f"Report is not ready (status: {job['status']})"}), 409
+
+    response = http_cache.send_cached_file(report_jobs.output_path(job_id), http_cache.PRIVATE,
+                                           mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename=fashion-history-{job_id}.pdf'
+    return response
+
+def send_image(directory, filename, cache_control, variant_cache_control=VARIANT_CACHE_CONTROL):
+    """Serve an original image, or a resized variant when ?w= or ?fmt= is given"""
+    try:
+        width, fmt = parse_variant_args(request.args)
+    except VariantError as e:
+        return jsonify({"error": str(e)}), 400
+
+    source_path = safe_join(directory, filename)
+    if source_path is None or not os.path.isfile(source_path):
+        return jsonify({"error": "Image not found"}), 404
+
+    if width is None and fmt is None:
+        return http_cache.send_cached_file(source_path, cache_control)
+
+    try:
+        variant_path, etag, mimetype = variant_cache.get(source_path, width, fmt)
+    except Exception as e:
+        print(f"Error generating variant for {source_path}: {e}")
+        return jsonify({"error": "Could not process image"}), 422
+
+    return http_cache.send_cached_file(variant_path, variant_cache_control, mimetype=mimetype, etag=etag)
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory("uploads", filename)
+    return send_image("uploads", filename, http_cache.UPLOADS)
 
 @app.route('/images/<filename>')
 def dataset_image(filename):
-    return send_from_directory("images", filename)
+    # The URL stays the same when an item is replaced
+    return send_image("images", filename, http_cache.CATALOGUE, http_cache.CATALOGUE)
+
+@app.route('/contact-sheet')
+def contact_sheet_image():
+    """Serve one composed image for a list of catalogue ids (?ids=10000,10001&w=200&fmt=webp&cols=5)"""
+    try:
+        ids, width, fmt, columns = contact_sheet.parse_sheet_args(request.args)
+        sheet_path, etag, mimetype = contact_sheet.contact_sheet_cache.get_sheet(ids, width, fmt, columns)
+    except VariantError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        print(f"Error rendering contact sheet: {e}")
+        return jsonify({"error": "Could not render contact sheet"}), 500
+
+    return http_cache.send_cached_file(sheet_path, http_cache.CATALOGUE, mimetype=mimetype, etag=etag)
+
+@app.route('/api/contact-sheet')
+def contact_sheet_layout():
+    """Return the contact sheet URL and tile coordinates for a list of catalogue ids"""
+    try:
+        ids, width, fmt, columns = contact_sheet.parse_sheet_args(request.args)
+    except VariantError as e:
+        return jsonify({"error": str(e)}), 400
+
+    sheet = contact_sheet.layout(ids, width, columns)
+    sheet["url"] = contact_sheet.sheet_url(ids, width, fmt, columns)
+    return jsonify(sheet)
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Runtime metrics of this worker process (MongoDB pool, write-behind buffer, query cache, admission control, tiers, index)"""
+    return jsonify({
+        "pid": os.getpid(),
+        "database": "memory" if database.using_memory_db() else "mongodb",
+        "mongo_pool": database.pool_metrics.snapshot(),
+        "write_buffer": write_buffer.stats,
+        "query_cache": query_cache.stats(),
+        "admission": admission.stats(),
+        "recommendation_tiers": dict(tier_counts),
+        "index": index_handle.stats()
+    })
+
+@app.route('/api/admin/reload-index', methods=['POST'])
+@admin_required
+def reload_index():
+    """Load the feature store again and swap it in without a restart (this worker only)"""
+    wait = request.args.get('wait', 'false').lower() == 'true'
+    if not index_handle.reload(load_index, wait=wait):
+        return jsonify({"error": "A reload is already running", "index": index_handle.stats()}), 409
+    if not wait:
+        return jsonify({"status": "reloading", "index": index_handle.stats()}), 202
+    stats = index_handle.stats()
+    if stats["last_error"]:
+        return jsonify({"error": "Reload failed, the previous index is still serving", "index": stats}), 500
+    return jsonify({"status": "success", "index": stats})
+
+# Extensions of catalogue images added through the admin API (contact sheets keep the non-.jpg ones in their ids)
+CATALOGUE_EXTENSIONS = contact_sheet.IMAGE_EXTENSIONS
+compaction_lock = threading.Lock()
+
+def catalogue_name(filename):
+    """Safe image name for a catalogue item, or None"""
+    name = secure_filename(filename or "")
+    return name if os.path.splitext(name)[1].lower() in CATALOGUE_EXTENSIONS else None
+
+def stale_log_response():
+    """503 for a mutation that reached this worker before it reloaded a compacted store"""
+    retry_after = max(1, round(catalogue_delta.CATALOGUE_POLL_INTERVAL))
+    response = jsonify({"error": "The catalogue was compacted, retry shortly", "retry_after": retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 503
+
+def compaction_due(index):
+    """Whether the delta has reached CATALOGUE_COMPACT_ITEMS (never with shards, which compaction would leave stale)"""
+    return SEARCH_MODE != "sharded" and catalogue_delta.CATALOGUE_COMPACT_ITEMS and \
+        index.delta.size() >= catalogue_delta.CATALOGUE_COMPACT_ITEMS
+
+def compact_catalogue(wait=False):
+    """
+    Merge the catalogue delta into the feature store in a background thread, then reload it
+    
+    Returns:
+        bool: False if a compaction is already running
+    """
+    if not compaction_lock.acquire(blocking=False):
+        return False
+    
+    def run():
+        try:
+            with index_handle.lease() as index:
+                compact(index, backbone)
+            index_handle.reload(load_index, wait=True)
+        except Exception as e:
+            print(f"Warning: Catalogue compaction failed: {e}")
+        finally:
+            compaction_lock.release()
+    
+    thread = threading.Thread(target=run, name="catalogue-compact", daemon=True)
+    thread.start()
+    if wait:
+        thread.join()
+    return True
+
+def upsert_catalogue_item(filename, replace):
+    """Add an uploaded image to the live catalogue, or replace the item of that name"""
+    file, error = get_uploaded_file()
+    if error:
+        return error
+    name = catalogue_name(filename or request.form.get('filename') or file.filename)
+    if name is None or (filename and name != filename):
+        return jsonify({"error": f"filename must be an image name ending in {', '.join(CATALOGUE_EXTENSIONS)}"}), 400
+    if model is None:
+        return jsonify({"error": "Model is not loaded"}), 503
+    
+    with index_handle.lease() as index:
+        if index.delta.contains(name) and not replace:
+            return jsonify({"error": f"{name} is already in the catalogue", "detail": "Use PUT to replace it"}), 409
+        _, upload_path, _ = save_upload(file)
+        try:
+            with admission.slot():
+                features = extract_features_from_images(upload_path, model)
+            # The image is in place before the log refers to it
+            os.makedirs(catalogue_delta.CATALOGUE_IMAGES, exist_ok=True)
+            os.replace(upload_path, os.path.join(catalogue_delta.CATALOGUE_IMAGES, name))
+            mutate(index, backbone, {"op": "upsert", "filename": name, "features": encode_features(features)})
+        finally:
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+        query_cache.clear()
+        delta = index.delta.stats()
+    
+    if compaction_due(index):
+        compact_catalogue()
+    item = recommendation(name, 0)
+    return jsonify({"item": {"filename": item["filename"], "category": item["category"]}, "delta": delta,
+                    "status": "success"}), 200 if replace else 201
+
+@app.route('/api/admin/catalogue', methods=['POST'])
+@admin_required
+def add_catalogue_item():
+    """Add an item to the live catalogue: its features are searched within seconds, without a rebuild"""
+    try:
+        return upsert_catalogue_item(None, replace=False)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except StaleLog:
+        return stale_log_response()
+    except Exception as e:
+        print(f"Error in add_catalogue_item route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/admin/catalogue/<filename>', methods=['PUT'])
+@admin_required
+def replace_catalogue_item(filename):
+    """Add or replace a catalogue item by name"""
+    try:
+        return upsert_catalogue_item(filename, replace=True)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except StaleLog:
+        return stale_log_response()
+    except Exception as e:
+        print(f"Error in replace_catalogue_item route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/admin/catalogue/<filename>', methods=['DELETE'])
+@admin_required
+def delete_catalogue_item(filename):
+    """Remove an item from the live catalogue"""
+    try:
+        with index_handle.lease() as index:
+            if not index.delta.contains(filename):
+                return jsonify({"error": f"{filename} is not in the catalogue"}), 404
+            mutate(index, backbone, {"op": "delete", "filename": filename})
+            query_cache.clear()
+            delta = index.delta.stats()
+        # Removed from images/ too, so rebuilding the store with preprocess.py agrees
+        image_path = safe_join(catalogue_delta.CATALOGUE_IMAGES, filename)
+        if image_path and os.path.isfile(image_path):
+            os.remove(image_path)
+        if compaction_due(index):
+            compact_catalogue()
+        return jsonify({"deleted": filename, "delta": delta, "status": "success"})
+    except StaleLog:
+        return stale_log_response()
+    except Exception as e:
+        print(f"Error in delete_catalogue_item route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/admin/catalogue/compact', methods=['POST'])
+@admin_required
+def compact_catalogue_route():
+    """Merge the items added and removed online into the feature store"""
+    if SEARCH_MODE == "sharded":
+        # The shards would keep the old store's version and the new store would not load
+        return jsonify({"error": "Compaction is off with SEARCH_MODE=sharded",
+                        "detail": "Rebuild the store with preprocess.py and run shard_search.py split again"}), 409
+    wait = request.args.get('wait', 'false').lower() == 'true'
+    if not compact_catalogue(wait=wait):
+        return jsonify({"error": "A compaction is already running"}), 409
+    if not wait:
+        return jsonify({"status": "compacting", "index": index_handle.stats()}), 202
+    return jsonify({"status": "success", "index": index_handle.stats()})
 
 @app.route('/test', methods=['GET'])
 def test_endpoint():
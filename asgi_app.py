@@ -0,0 +1,402 @@
+"""
+Async (ASGI) serving mode for the Fashion Recommendation API
+
+The I/O-bound routes (auth, uploads, image history) are ported to Quart
+and await MongoDB (Motor), Cloudinary (httpx) and bcrypt (thread pool)
+instead of blocking a worker. Feature extraction runs in a dedicated
+executor. Every other route is served by the Flask app in app.py through
+a WSGI adapter, so both modes expose the same API.
+
+Run with:
+    uvicorn asgi_app:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import wraps
+
+import httpx
+import jwt
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import Quart, Response, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+import app as flask_app_module
+import cloudinary_utils as cloud
+import contact_sheet
+from admission import Overloaded, UploadRejected, admission
+from async_db import AsyncDatabase
+from auth import JWT_SECRET, generate_token, hash_password, verify_password
+
+# Threads running model inference; TensorFlow releases the GIL while predicting
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '2'))
+# Largest request body the Flask fallback accepts
+WSGI_MAX_BODY_SIZE = 16 * 1024 * 1024
+CLOUDINARY_TIMEOUT = float(os.getenv('CLOUDINARY_TIMEOUT', '60'))
+
+app = Quart(__name__)
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+
+
+@app.before_serving
+async def startup():
+    # Created inside the server's event loop, which Motor and httpx bind to
+    app.db = AsyncDatabase()
+    app.http_client = httpx.AsyncClient(timeout=CLOUDINARY_TIMEOUT,
+                                        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+
+
+@app.after_serving
+async def shutdown():
+    await app.http_client.aclose()
+    app.db.close()
+
+
+@app.after_request
+async def add_cors_headers(response):
+    # Same policy as flask_cors in app.py (preflight requests go to Flask)
+    response.headers.setdefault('Access-Control-Allow-Origin', '*')
+    return response
+
+
+def auth_required(f):
+    """Async counterpart of middleware.auth_required"""
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return jsonify({"error": "Authentication required"}), 401
+
+        parts = auth_header.split()
+        if len(parts) != 2 or parts[0].lower() != 'bearer':
+            return jsonify({"error": "Invalid authorization format", "detail": "Use format 'Bearer <token>'"}), 401
+
+        try:
+            payload = jwt.decode(parts[1], JWT_SECRET, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return jsonify({"error": "Invalid or expired token"}), 401
+
+        user = await app.db.get_user(payload.get("user_id"))
+        if not user:
+            return jsonify({"error": "Invalid or expired token"}), 401
+
+        request.user = user
+        return await f(*args, **kwargs)
+
+    return decorated
+
+
+async def required_fields(*fields):
+    """JSON body of the request, or an error response if a field is missing"""
+    data = await request.get_json(silent=True)
+    if not data:
+        return None, (jsonify({"error": "No data provided"}), 400)
+    for field in fields:
+        if field not in data or not data[field]:
+            return None, (jsonify({"error": f"Missing required field: {field}"}), 400)
+    return data, None
+
+
+# Authentication Routes
+@app.route("/api/auth/register", methods=["POST"])
+async def register():
+    """Register a new user"""
+    try:
+        data, error = await required_fields("username", "password")
+        if error:
+            return error
+
+        if await app.db.find_user(data["username"]):
+            return jsonify({"error": "Username already exists"}), 400
+
+        user = {
+            "username": data["username"],
+            "password": await asyncio.to_thread(hash_password, data["password"]),
+            "email": data.get("email"),
+            "name": data.get("name"),
+            "created_at": datetime.utcnow(),
+            "last_login": None
+        }
+        user["_id"] = await app.db.insert_user(user)
+        del user["password"]
+
+        return jsonify({"user": user, "token": generate_token(user["_id"])}), 201
+    except Exception as e:
+        print(f"Error in register route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/auth/login", methods=["POST"])
+async def login():
+    """Login an existing user"""
+    try:
+        data, error = await required_fields("username", "password")
+        if error:
+            return error
+
+        user = await app.db.find_user(data["username"])
+        if not user or "password" not in user:
+            return jsonify({"error": "Invalid credentials"}), 401
+
+        # bcrypt is deliberately slow; keep it off the event loop
+        if not await asyncio.to_thread(verify_password, data["password"], user["password"]):
+            return jsonify({"error": "Invalid credentials"}), 401
+
+        await app.db.record_login(user["_id"])
+        user["_id"] = str(user["_id"])
+        del user["password"]
+
+        return jsonify({"user": user, "token": generate_token(user["_id"])})
+    except Exception as e:
+        print(f"Error in login route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/auth/me", methods=["GET"])
+@auth_required
+async def get_me():
+    """Get current user (requires authentication)"""
+    return jsonify(request.user)
+
+
+async def save_upload():
+    """
+    Save the request's uploaded file like app.save_upload
+
+    Returns:
+        tuple: ((original filename, local path, timestamp), error response or None)
+    """
+    files = await request.files
+    if "file" not in files:
+        return None, (jsonify({"error": "No file uploaded"}), 400)
+    file = files["file"]
+    if file.filename == "":
+        return None, (jsonify({"error": "No file selected"}), 400)
+    try:
+        admission.check_upload(file)
+    except UploadRejected as e:
+        return None, (jsonify({"error": str(e)}), e.status)
+
+    os.makedirs("uploads", exist_ok=True)
+    timestamp = int(time.time())
+    upload_path = flask_app_module.upload_path_for(file.filename, timestamp)
+    await file.save(upload_path)
+    return (file.filename, upload_path, timestamp), None
+
+
+async def cdn_url(upload_path, user_id):
+    """Async counterpart of app.upload_to_cdn"""
+    image_url = f"/uploads/{os.path.basename(upload_path)}"
+    public_id = os.path.splitext(os.path.basename(upload_path))[0]
+    result = await cloud.upload_image_async(app.http_client, upload_path, public_id=public_id, user_id=user_id)
+    if 'secure_url' in result and not result.get('fallback', False):
+        image_url = result['secure_url']
+    return image_url
+
+
+async def store_upload(user_id, original_filename, image_url, uploaded_category, recommendations, timestamp,
+                       embedding=None):
+    """Async counterpart of app.store_upload"""
+    try:
+        image_data = await app.db.save_uploaded_image(user_id, original_filename, image_url,
+                                                      uploaded_category, recommendations, embedding)
+        return image_data["_id"]
+    except Exception as db_error:
+        print(f"Database error: {db_error}")
+        return f"temp_id_{timestamp}"
+
+
+def overloaded_response(error):
+    """Async counterpart of app.overloaded_response"""
+    response = jsonify({"error": str(error), "reason": error.reason, "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
+def find_recommendations(upload_path, category=None):
+    """Run the neighbour search in the inference executor"""
+    # Shed before queueing in the executor, whose own queue is unbounded; the
+    # cheap tiers don't need the model, so they run outside it
+    if not admission.accepting():
+        return asyncio.to_thread(flask_app_module.find_recommendations, upload_path, category, True)
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(inference_executor, flask_app_module.find_recommendations, upload_path, category)
+
+
+@app.route("/upload", methods=["POST"])
+@auth_required
+async def upload_file():
+    try:
+        saved, error = await save_upload()
+        if error:
+            return error
+        original_filename, upload_path, timestamp = saved
+        user_id = request.user["_id"]
+
+        uploaded_category = flask_app_module.get_category_from_filename(original_filename)
+        # The CDN upload does not depend on the recommendations, so both run at once
+        (recommendations, embedding, tier), image_url = await asyncio.gather(
+            find_recommendations(upload_path, uploaded_category), cdn_url(upload_path, user_id))
+        image_id = await store_upload(user_id, original_filename, image_url, uploaded_category,
+                                      recommendations, timestamp, embedding)
+
+        return jsonify({
+            "uploaded_image": original_filename,
+            "uploaded_category": uploaded_category,
+            "image_url": image_url,
+            "recommendations": recommendations,
+            "tier": tier,
+            "contact_sheet": contact_sheet.describe([rec["filename"] for rec in recommendations]),
+            "image_id": image_id,
+            "status": "success"
+        })
+    except Overloaded as e:
+        print(f"Shedding upload: {e}")
+        return overloaded_response(e)
+    except Exception as e:
+        print(f"Error in upload_file route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/upload/stream", methods=["POST"])
+@auth_required
+async def upload_file_stream():
+    """Same events as app.upload_file_stream"""
+    if not admission.accepting() and not flask_app_module.degraded_available():
+        return overloaded_response(admission.overloaded())
+    saved, error = await save_upload()
+    if error:
+        return error
+    original_filename, upload_path, timestamp = saved
+    user_id = request.user["_id"]
+
+    async def events():
+        try:
+            uploaded_category = flask_app_module.get_category_from_filename(original_filename)
+            cdn_upload = asyncio.ensure_future(cdn_url(upload_path, user_id))
+            recommendations, embedding, tier = await find_recommendations(upload_path, uploaded_category)
+            sheet = contact_sheet.describe([rec["filename"] for rec in recommendations])
+            yield flask_app_module.sse_event("recommendations", {
+                "uploaded_image": original_filename,
+                "uploaded_category": uploaded_category,
+                "recommendations": recommendations,
+                "tier": tier,
+                "contact_sheet": sheet
+            })
+
+            image_url = await cdn_upload
+            yield flask_app_module.sse_event("image_url", {"image_url": image_url})
+
+            image_id = await store_upload(user_id, original_filename, image_url, uploaded_category,
+                                          recommendations, timestamp, embedding)
+            yield flask_app_module.sse_event("saved", {"image_id": image_id})
+
+            yield flask_app_module.sse_event("done", {
+                "uploaded_image": original_filename,
+                "uploaded_category": uploaded_category,
+                "image_url": image_url,
+                "recommendations": recommendations,
+                "tier": tier,
+                "contact_sheet": sheet,
+                "image_id": image_id,
+                "status": "success"
+            })
+        except Overloaded as e:
+            print(f"Shedding streamed upload: {e}")
+            yield flask_app_module.sse_event("error", {"error": str(e), "reason": e.reason,
+                                                      "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"Error in upload_file_stream route: {e}")
+            yield flask_app_module.sse_event("error", {"error": str(e)})
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/images', methods=['GET'])
+@auth_required
+async def get_user_uploaded_images():
+    """Get all images uploaded by the current user"""
+    try:
+        limit = int(request.args.get('limit', 10))
+        skip = int(request.args.get('skip', 0))
+        images = await app.db.get_user_images(request.user["_id"], limit, skip)
+        return jsonify({"images": images, "count": len(images)})
+    except Exception as e:
+        print(f"Error in get_user_uploaded_images route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/images/<image_id>', methods=['GET'])
+@auth_required
+async def get_image(image_id):
+    """Get a specific image by ID"""
+    try:
+        image = await app.db.get_image(image_id)
+        if not image:
+            return jsonify({"error": "Image not found"}), 404
+        if image["user_id"] != request.user["_id"]:
+            return jsonify({"error": "Unauthorized"}), 403
+        return jsonify(image)
+    except Exception as e:
+        print(f"Error in get_image route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/images/<image_id>', methods=['DELETE'])
+@auth_required
+async def delete_user_image(image_id):
+    """Delete an image by ID"""
+    try:
+        image = await app.db.delete_image(image_id, request.user["_id"])
+        if not image:
+            return jsonify({"error": "Image not found or already deleted"}), 404
+
+        # Same best-effort Cloudinary cleanup as models.delete_image, off the loop
+        image_url = image.get("image_url", "")
+        if image_url:
+            public_id = image_url.split("/")[-1].split(".")[0]
+            asyncio.get_running_loop().run_in_executor(None, cloud.delete_image, public_id)
+
+        return jsonify({"message": "Image deleted successfully"})
+    except Exception as e:
+        print(f"Error in delete_user_image route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+class FallbackDispatcher:
+    """
+    ASGI entry point: Quart routes natively, everything else through Flask
+
+    Preflight (OPTIONS) requests also go to Flask so flask_cors answers them
+    exactly as in the WSGI deployment.
+    """
+
+    def __init__(self, asgi_app, wsgi_app):
+        self.asgi_app = asgi_app
+        self.wsgi_app = AsyncioWSGIMiddleware(wsgi_app, max_body_size=WSGI_MAX_BODY_SIZE)
+        self.urls = asgi_app.url_map.bind("localhost")
+
+    def is_native(self, scope):
+        if scope["type"] != "http":
+            return True
+        if scope["method"] == "OPTIONS":
+            return False
+        try:
+            self.urls.match(scope["path"], method=scope["method"])
+            return True
+        except HTTPException:
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if self.is_native(scope):
+            await self.asgi_app(scope, receive, send)
+        else:
+            await self.wsgi_app(scope, receive, send)
+
+
+application = FallbackDispatcher(app, flask_app_module.app)
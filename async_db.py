@@ -0,0 +1,193 @@
+"""
+Async data access for the ASGI server
+
+Uses Motor when database.py connected to MongoDB. When it fell back to the
+in-memory collections, those are wrapped with awaitable methods instead
+(they never do I/O, so calling them on the event loop is fine). The queries
+mirror auth.py and models.py.
+"""
+import asyncio
+import os
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+import database
+from models import SUMMARY_PROJECTION, pack_recommendations, unpack_recommendations
+from backbones import active_backbone
+from profiles import LEGACY_FEATURE_VERSION, pack_vector, unpack_vector, update_taste
+
+MOTOR_MAX_POOL_SIZE = int(os.getenv('MOTOR_MAX_POOL_SIZE', '200'))
+
+
+def to_object_id(value):
+    """ObjectId for Mongo IDs; test/guest/temp IDs of the in-memory database, ObjectIds and non-strings are kept as-is"""
+    # A token without a user_id gives None, which must find no user rather than raise
+    if not isinstance(value, str) or value.startswith(("test", "guest", "temp_id_")):
+        return value
+    try:
+        return ObjectId(value)
+    except Exception:
+        return value
+
+
+class AsyncMemoryCollection:
+    """Awaitable wrapper around a database.MemoryCollection"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, query):
+        return self.collection.find_one(query)
+
+    async def insert_one(self, doc):
+        return self.collection.insert_one(doc)
+
+    async def update_one(self, query, update):
+        return self.collection.update_one(query, update)
+
+    async def delete_one(self, query):
+        return self.collection.delete_one(query)
+
+    async def find_page(self, query, sort_field, direction, skip, limit, projection=None):
+        return list(self.collection.find(query, projection).sort(sort_field, direction).skip(skip).limit(limit))
+
+
+class AsyncMotorCollection:
+    """Motor collection with the same find_page helper as AsyncMemoryCollection"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def find_page(self, query, sort_field, direction, skip, limit, projection=None):
+        cursor = self.collection.find(query, projection).sort(sort_field, direction).skip(skip).limit(limit)
+        return await cursor.to_list(length=limit)
+
+
+class AsyncDatabase:
+    """Users and uploaded images collections for the running event loop"""
+
+    def __init__(self):
+        self.client = None
+        if not database.using_memory_db():
+            # Motor binds to the event loop it is first used on, so this must
+            # be created from inside the server's loop (see asgi_app.startup)
+            from motor.motor_asyncio import AsyncIOMotorClient
+            options = dict(database.client_options(), maxPoolSize=MOTOR_MAX_POOL_SIZE)
+            self.client = AsyncIOMotorClient(database.MONGO_URI, **options)
+            db = self.client[database.DB_NAME]
+            self.users = AsyncMotorCollection(db['users'])
+            self.uploaded_images = AsyncMotorCollection(db['uploaded_images'])
+            print(f"Async database: Motor (max pool size {MOTOR_MAX_POOL_SIZE})")
+        else:
+            self.users = AsyncMemoryCollection(database.get_db()['users'])
+            self.uploaded_images = AsyncMemoryCollection(database.get_db()['uploaded_images'])
+            print("Async database: in-memory collections")
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+    async def find_user(self, username):
+        """User document by username (with password hash) or None"""
+        return await self.users.find_one({"username": username})
+
+    async def get_user(self, user_id):
+        """
+        User by ID, without the password
+
+        Args:
+            user_id (str): User ID
+
+        Returns:
+            dict: User document or None if user doesn't exist
+        """
+        user = await self.users.find_one({"_id": to_object_id(user_id)})
+        if user:
+            user["_id"] = str(user["_id"])
+            user.pop("password", None)
+        return user
+
+    async def insert_user(self, user):
+        result = await self.users.insert_one(user)
+        return str(result.inserted_id)
+
+    async def record_login(self, user_id):
+        try:
+            await self.users.update_one({"_id": user_id}, {"$set": {"last_login": datetime.utcnow()}})
+        except Exception as e:
+            print(f"Warning: Could not update last login time: {e}")
+
+    async def save_uploaded_image(self, user_id, filename, image_url, category, recommendations=None,
+                                  embedding=None):
+        """Async counterpart of models.save_uploaded_image"""
+        image_data = {
+            "user_id": user_id,
+            "filename": filename,
+            "image_url": image_url,
+            "category": category,
+            "recommendations": pack_recommendations(recommendations or []),
+            "uploaded_at": datetime.utcnow()
+        }
+        if embedding is not None:
+            image_data["embedding"] = pack_vector(embedding)
+        image_data["feature_version"] = active_backbone.version
+        result = await self.uploaded_images.insert_one(image_data)
+        if embedding is not None:
+            try:
+                # Compare-and-set loop on the synchronous client, off the event loop
+                await asyncio.to_thread(update_taste, user_id, embedding)
+            except Exception as e:
+                print(f"Warning: Could not update taste vector: {e}")
+        image_data["_id"] = str(result.inserted_id)
+        image_data["recommendations"] = recommendations or []
+        image_data.pop("embedding", None)
+        image_data.pop("feature_version", None)
+        return image_data
+
+    async def get_user_images(self, user_id, limit=10, skip=0):
+        """Async counterpart of models.get_user_images (summary fields only)"""
+        images = await self.uploaded_images.find_page({"user_id": user_id}, "uploaded_at", -1, skip, limit,
+                                                      SUMMARY_PROJECTION)
+        for image in images:
+            image["_id"] = str(image["_id"])
+        return images
+
+    async def get_image(self, image_id):
+        """Async counterpart of models.get_image_by_id"""
+        image = await self.uploaded_images.find_one({"_id": to_object_id(image_id)})
+        if image:
+            image["_id"] = str(image["_id"])
+            image["recommendations"] = unpack_recommendations(image.get("recommendations"))
+            image.pop("embedding", None)
+            image.pop("feature_version", None)
+        return image
+
+    async def delete_image(self, image_id, user_id):
+        """
+        Delete a user's image document
+
+        Args:
+            image_id (str): Image ID
+            user_id (str): User ID (for authorization)
+
+        Returns:
+            dict: The deleted document or None if the user has no such image
+        """
+        query = {"_id": to_object_id(image_id), "user_id": user_id}
+        image = await self.uploaded_images.find_one(query)
+        if not image:
+            return None
+        result = await self.uploaded_images.delete_one(query)
+        if result.deleted_count == 0:
+            return None
+        if image.get("embedding") is not None:
+            try:
+                await asyncio.to_thread(update_taste, user_id, unpack_vector(image["embedding"]), True,
+                                        image.get("feature_version", LEGACY_FEATURE_VERSION))
+            except Exception as e:
+                print(f"Warning: Could not update taste vector: {e}")
+        return image
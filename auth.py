@@ -5,6 +5,7 @@ import base64
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 from database import users_collection
+from write_buffer import write_buffer
 
 # JWT config from existing .env file
 JWT_SECRET = os.getenv('JWT_SECRET', 'your_jwt_secret_key')
@@ -178,7 +179,9 @@ def authenticate_user(username, password):
         if verify_password(password, stored_pwd):
             # Update last login time
             try:
-                users_collection.update_one(
+                # Queued and written with other logins in one batch
+                write_buffer.update_one(
+                    "users",
                     {"_id": user["_id"]},
                     {"$set": {"last_login": datetime.utcnow()}}
                 )
@@ -0,0 +1,196 @@
+"""
+Feature-extractor backbones and their versioned feature stores.
+
+ResNet50 at 224x224 is the original extractor. Lighter backbones trade
+some accuracy for CPU time. Every backbone writes its own feature store:
+a directory with Images_features.pkl, filenames.pkl, the indexes derived
+from them (clusters.pkl, phash_index.pkl, binary_index.pkl) and
+feature_meta.json recording the version. A query embedding is only
+comparable with an index of the same version, so the app refuses to serve
+CNN recommendations from a store whose version differs from its backbone.
+
+The default ResNet50 store is the repository root, where the files
+predate versioning; they are accepted without feature_meta.json.
+
+TensorFlow is only imported when a model is built, so the data layer can
+read versions without it.
+
+Usage:
+    BACKBONE=mobilenet_v3_large python preprocess.py
+    BACKBONE=mobilenet_v3_large gunicorn app:app
+"""
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+# Bump when extraction changes for every backbone (decoding, pooling, normalisation)
+FEATURE_VERSION = 1
+FEATURE_META = "feature_meta.json"
+FEATURE_STORES_DIR = "features"
+DEFAULT_BACKBONE = "resnet50"
+
+
+class Backbone:
+    """A Keras application used as a pooled feature extractor"""
+
+    def __init__(self, name, application, module, input_size=224, dim=None):
+        self.name = name
+        self.application = application
+        self.module = module
+        self.input_size = input_size
+        self.dim = dim
+
+    @property
+    def version(self):
+        """Feature version, e.g. "resnet50-224-v1\""""
+        return f"{self.name.split('@')[0]}-{self.input_size}-v{FEATURE_VERSION}"
+
+    @property
+    def target_size(self):
+        return (self.input_size, self.input_size)
+
+    @property
+    def store_dir(self):
+        """Directory of this backbone's feature store"""
+        if self.name == DEFAULT_BACKBONE:
+            return "."
+        return os.path.join(FEATURE_STORES_DIR, self.version)
+
+    def path(self, filename):
+        """Path of a file in the feature store"""
+        return os.path.join(self.store_dir, filename)
+
+    def build(self, weights="imagenet"):
+        """
+        The feature extractor: the backbone without its classifier, global-max-pooled
+
+        Args:
+            weights (str, optional): "imagenet", or None for random weights. Defaults to "imagenet".
+
+        Returns:
+            tf.keras.Model: Model mapping a preprocessed batch to dim features per image
+        """
+        import tensorflow as tf
+        from tensorflow.keras import applications
+        from tensorflow.keras.layers import GlobalMaxPool2D
+
+        base = getattr(applications, self.application)(weights=weights, include_top=False,
+                                                       input_shape=(self.input_size, self.input_size, 3))
+        base.trainable = False
+        return tf.keras.models.Sequential([base, GlobalMaxPool2D()])
+
+    def preprocess(self, batch):
+        """Backbone-specific input scaling of a float32 RGB batch (0-255)"""
+        from tensorflow.keras import applications
+        return getattr(applications, self.module).preprocess_input(batch)
+
+    def extract(self, model, image_array):
+        """L2-normalised features of one image array from image_loader.load_image"""
+        batch = self.preprocess(np.expand_dims(image_array, axis=0))
+        result = model.predict(batch, verbose=0).flatten()
+        return result / np.linalg.norm(result)
+
+
+BACKBONES = {
+    "resnet50": Backbone("resnet50", "ResNet50", "resnet50", 224, 2048),
+    # Same weights at a reduced input resolution: about half the FLOPs of 224x224
+    "resnet50@160": Backbone("resnet50@160", "ResNet50", "resnet50", 160, 2048),
+    "mobilenet_v3_large": Backbone("mobilenet_v3_large", "MobileNetV3Large", "mobilenet_v3", 224, 960),
+    "mobilenet_v3_small": Backbone("mobilenet_v3_small", "MobileNetV3Small", "mobilenet_v3", 224, 576),
+    "efficientnet_b0": Backbone("efficientnet_b0", "EfficientNetB0", "efficientnet", 224, 1280),
+}
+
+
+def get_backbone(name=None):
+    """
+    Backbone by name
+
+    Args:
+        name (str, optional): A BACKBONES key. Defaults to $BACKBONE, or DEFAULT_BACKBONE.
+
+    Returns:
+        Backbone: The backbone
+
+    Raises:
+        ValueError: Unknown name
+    """
+    name = name or os.getenv('BACKBONE', DEFAULT_BACKBONE)
+    if name not in BACKBONES:
+        raise ValueError(f"Unknown backbone {name!r}; choose one of {', '.join(BACKBONES)}")
+    return BACKBONES[name]
+
+
+def write_meta(backbone, n_items):
+    """Record the version of a feature store just written"""
+    meta = {"backbone": backbone.name, "version": backbone.version, "input_size": backbone.input_size,
+            "dim": backbone.dim, "items": n_items, "created_at": datetime.utcnow().isoformat()}
+    with open(backbone.path(FEATURE_META), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def read_meta(backbone):
+    """feature_meta.json of a backbone's store, or None if it has none"""
+    try:
+        with open(backbone.path(FEATURE_META)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def store_version(backbone):
+    """
+    Version of the feature store currently on disk, e.g. "resnet50-224-v1@2025-06-01T12:00:00"
+
+    Changes whenever the store is rewritten: the creation time from
+    feature_meta.json, or for a store without one, the modification time of
+    Images_features.pkl.
+    """
+    meta = read_meta(backbone)
+    if meta is not None:
+        created_at = meta["created_at"]
+    else:
+        created_at = datetime.utcfromtimestamp(os.path.getmtime(backbone.path("Images_features.pkl"))).isoformat()
+    return f"{backbone.version}@{created_at}"
+
+
+def check_store(backbone, features):
+    """
+    Make sure a feature store was written by this backbone
+
+    Args:
+        backbone (Backbone): Backbone the app extracts query features with
+        features (array): The store's feature matrix
+
+    Raises:
+        ValueError: The store has another version or feature size
+    """
+    meta = read_meta(backbone)
+    if meta is None and backbone.name != DEFAULT_BACKBONE:
+        raise ValueError(f"{backbone.store_dir} has no {FEATURE_META}; "
+                         f"re-run preprocess.py with BACKBONE={backbone.name}")
+    if meta is not None and meta["version"] != backbone.version:
+        raise ValueError(f"Feature store version {meta['version']} does not match backbone {backbone.version}")
+    dim = np.shape(features[0])[-1] if len(features) else backbone.dim
+    if dim != backbone.dim:
+        raise ValueError(f"Feature store has {dim}-d features, backbone {backbone.version} produces {backbone.dim}")
+
+
+def add_store_arguments(parser):
+    """--backbone, --features and --filenames options of the offline index scripts"""
+    parser.add_argument("--backbone", help="Use this backbone's feature store (default: $BACKBONE or resnet50)")
+    parser.add_argument("--features", help="Defaults to Images_features.pkl in the feature store")
+    parser.add_argument("--filenames", help="Defaults to filenames.pkl in the feature store")
+
+
+def resolve_store_arguments(args):
+    """Fill in --features and --filenames left unset; returns the backbone"""
+    backbone = get_backbone(args.backbone)
+    args.features = args.features or backbone.path("Images_features.pkl")
+    args.filenames = args.filenames or backbone.path("filenames.pkl")
+    return backbone
+
+
+active_backbone = get_backbone()
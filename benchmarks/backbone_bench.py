@@ -0,0 +1,145 @@
+"""
+Latency, memory and category-match accuracy per feature-extractor backbone
+
+Each backbone is measured in its own subprocess so its resident memory is
+not mixed with the others'. Latency covers the whole query path: decoding
+a phone-sized JPEG with image_loader, preprocessing and model.predict.
+Accuracy is evaluate.py's category-match evaluation (the vectorized
+successor of accuracy.py) over the backbone's feature store, and is only
+reported for stores that exist (run preprocess.py with BACKBONE=<name>).
+
+Usage (from the repository root):
+    python -m benchmarks.backbone_bench --output backbones.json
+    python -m benchmarks.backbone_bench --random-weights --backbones resnet50 mobilenet_v3_small
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+from backbones import BACKBONES, get_backbone
+from benchmarks.common import REPO_ROOT, git_commit, percentiles
+
+
+def rss_mb():
+    """Resident memory of this process in MB (Linux only)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def category_accuracy(backbone, limit, column):
+    """evaluate.py report over the backbone's feature store, or None if it has none"""
+    from evaluate import evaluate, load_category_codes, load_index
+
+    if not os.path.exists(backbone.path("Images_features.pkl")):
+        return None
+    try:
+        features, filenames = load_index(backbone.path("Images_features.pkl"), backbone.path("filenames.pkl"))
+        codes, labels = load_category_codes(filenames, column=column)
+    except Exception as e:
+        print(f"Could not evaluate {backbone.store_dir}: {e}")
+        return None
+    report = evaluate(features, filenames, codes, labels, limit=limit, latency_samples=0)
+    return {"precision_at_k": report["precision_at_k"], "match_rate": report["match_rate"],
+            "queries": report["queries"], "column": column}
+
+
+def measure_one(name, images, random_weights, limit, column):
+    """Measure one backbone in this process"""
+    from benchmarks.decode_bench import synthetic_jpeg
+    from image_loader import load_image
+
+    import tensorflow  # noqa: F401  (the runtime itself is not part of the backbone's memory)
+
+    backbone = get_backbone(name)
+    baseline = rss_mb()
+    began = time.perf_counter()
+    model = backbone.build(weights=None if random_weights else "imagenet")
+    load_seconds = time.perf_counter() - began
+
+    blobs = [synthetic_jpeg(1512, 2016, seed) for seed in range(images)]
+    # The first call builds the inference graph
+    backbone.extract(model, load_image(io.BytesIO(blobs[0]), backbone.target_size))
+    latencies = []
+    for blob in blobs:
+        began = time.perf_counter()
+        backbone.extract(model, load_image(io.BytesIO(blob), backbone.target_size))
+        latencies.append(time.perf_counter() - began)
+
+    return {
+        "backbone": name,
+        "version": backbone.version,
+        "dim": backbone.dim,
+        "parameters": model.count_params(),
+        "load_seconds": round(load_seconds, 2),
+        "memory_mb": round(rss_mb() - baseline, 1),
+        "latency_ms": percentiles(latencies),
+        "index_mb_per_100k": round(100_000 * backbone.dim * 4 / 1e6, 1),
+        "accuracy": category_accuracy(backbone, limit, column),
+    }
+
+
+def markdown_table(results):
+    lines = ["| Backbone | Dim | Params (M) | Memory (MB) | Latency p50 (ms) | Index MB / 100k | "
+             "Precision@5 | 3-of-5 match |",
+             "|---|---|---|---|---|---|---|---|"]
+    for r in results:
+        accuracy = r["accuracy"]
+        precision = f"{accuracy['precision_at_k'] * 100:.1f}%" if accuracy else "n/a"
+        match = f"{accuracy['match_rate'] * 100:.1f}%" if accuracy else "n/a"
+        lines.append(f"| {r['version']} | {r['dim']} | {r['parameters'] / 1e6:.1f} | {r['memory_mb']} | "
+                     f"{r['latency_ms'].get('p50')} | {r['index_mb_per_100k']} | {precision} | {match} |")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare feature-extractor backbones")
+    parser.add_argument("--backbones", nargs="+", default=list(BACKBONES), choices=list(BACKBONES))
+    parser.add_argument("--images", type=int, default=20, help="Queries timed per backbone")
+    parser.add_argument("--random-weights", action="store_true",
+                        help="Skip downloading ImageNet weights (latency and memory only)")
+    parser.add_argument("--limit", type=int, default=5000, help="Catalogue items evaluated for accuracy")
+    parser.add_argument("--column", default="masterCategory", help="styles.csv column used as ground truth")
+    parser.add_argument("--one", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    if args.one:
+        result = measure_one(args.one, args.images, args.random_weights, args.limit, args.column)
+        print("RESULT " + json.dumps(result))
+        return
+
+    results = []
+    for name in args.backbones:
+        command = [sys.executable, "-m", "benchmarks.backbone_bench", "--one", name, "--images", str(args.images),
+                   "--limit", str(args.limit), "--column", args.column]
+        if args.random_weights:
+            command.append("--random-weights")
+        output = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+        lines = [line for line in output.stdout.splitlines() if line.startswith("RESULT ")]
+        if not lines:
+            print(f"  {name}: failed\n{output.stderr[-2000:]}")
+            continue
+        results.append(json.loads(lines[-1][len("RESULT "):]))
+        print(f"  {name:<20} p50 {results[-1]['latency_ms'].get('p50')} ms, {results[-1]['memory_mb']} MB")
+
+    print()
+    print(markdown_table(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"commit": git_commit(), "random_weights": args.random_weights, "results": results}, f,
+                      indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
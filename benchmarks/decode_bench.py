@@ -0,0 +1,98 @@
+"""
+Decode time per image for the model input
+
+Compares keras' load_img path (full decode, then a nearest-neighbour
+resize to 224x224) with image_loader.load_image (reduced-scale JPEG
+decode). Also reports how far apart the resulting arrays are. By default
+the images are synthetic phone-sized JPEGs, since images/ may only hold
+Git LFS pointers; pass --images to time real files.
+
+Usage (from the repository root):
+    python -m benchmarks.decode_bench --count 20 --size 3024x4032
+    python -m benchmarks.decode_bench --images images/*.jpg --output decode_bench.json
+"""
+import argparse
+import io
+import json
+import time
+
+import numpy as np
+from PIL import Image
+
+import image_loader
+from benchmarks.common import git_commit, percentiles
+
+
+def load_img_array(source, target_size=image_loader.TARGET_SIZE):
+    """The current path: what image.img_to_array(image.load_img(source, target_size)) does"""
+    img = Image.open(source)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    height, width = target_size
+    return np.asarray(img.resize((width, height), Image.NEAREST), dtype=np.float32)
+
+
+def synthetic_jpeg(width, height, seed):
+    """A photo-like JPEG (smooth gradients plus sensor noise) as bytes"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    channels = []
+    for _ in range(3):
+        fx, fy, phase = rng.uniform(1, 6), rng.uniform(1, 6), rng.uniform(0, 2 * np.pi)
+        channels.append(128 + 90 * np.sin(2 * np.pi * (fx * x / width + fy * y / height) + phase))
+    pixels = np.stack(channels, axis=-1) + rng.normal(0, 6, (height, width, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def measure(label, sources, load, repeats):
+    latencies = []
+    for _ in range(repeats):
+        for source in sources:
+            began = time.perf_counter()
+            load(source())
+            latencies.append(time.perf_counter() - began)
+    result = {"images": len(sources) * repeats, "latency_ms": percentiles(latencies)}
+    print(f"  {label:<10} {result['latency_ms']}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image decoding for feature extraction")
+    parser.add_argument("--images", nargs="*", help="Image files (default: synthetic JPEGs)")
+    parser.add_argument("--count", type=int, default=10, help="Synthetic images")
+    parser.add_argument("--size", default="3024x4032", help="Synthetic image size, WIDTHxHEIGHT")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    if args.images:
+        blobs = [open(path, "rb").read() for path in args.images]
+    else:
+        width, height = (int(v) for v in args.size.split("x"))
+        blobs = [synthetic_jpeg(width, height, seed) for seed in range(args.count)]
+    # Decode from memory so disk reads are not part of the timings
+    sources = [lambda blob=blob: io.BytesIO(blob) for blob in blobs]
+
+    print(f"Decoding {len(blobs)} images x {args.repeats} to {image_loader.TARGET_SIZE}")
+    results = {
+        "commit": git_commit(),
+        "load_img": measure("load_img", sources, load_img_array, args.repeats),
+        "draft": measure("draft", sources, image_loader.load_image, args.repeats),
+    }
+    differences = [np.abs(load_img_array(source()) - image_loader.load_image(source())).mean() for source in sources]
+    results["mean_abs_difference"] = round(float(np.mean(differences)), 3)
+    speedup = results["load_img"]["latency_ms"]["p50"] / results["draft"]["latency_ms"]["p50"]
+    results["speedup_p50"] = round(speedup, 1)
+    print(f"  p50 speedup {results['speedup_p50']}x, mean absolute pixel difference "
+          f"{results['mean_abs_difference']} (0-255 scale)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
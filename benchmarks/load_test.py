@@ -0,0 +1,290 @@
+"""
+End-to-end load test for the Fashion Recommendation API
+
+Starts the app under gunicorn with the in-memory database fallback and a
+fake Cloudinary server, then drives the main endpoints at a configurable
+concurrency and writes RPS, latency percentiles and per-worker memory to a
+JSON report that can be compared across commits.
+
+The same load can be run against the sync Flask app (app:app) and the
+async serving mode (asgi_app:application under uvicorn workers). With
+--server both the two run one after the other and are compared side by side;
+a slow fake Cloudinary shows the difference best.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test --concurrency 16 --duration 30 --output bench.json
+    python -m benchmarks.load_test --compare bench-main.json --output bench.json
+    python -m benchmarks.load_test --server both --concurrency 64 --cloudinary-latency 0.5
+    python -m benchmarks.load_test --url http://127.0.0.1:5000   # existing server
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from benchmarks.common import (REPO_ROOT, bench_env, free_port, git_commit, gunicorn_command,
+                               percentiles, start_app, worker_memory)
+from benchmarks.fake_cloudinary import start_fake_cloudinary
+
+ENDPOINTS = ["login", "upload", "images", "report"]
+
+# Serving modes: gunicorn app and worker class
+SERVERS = {
+    "wsgi": ("app:app", None),
+    "asgi": ("asgi_app:application", "uvicorn.workers.UvicornWorker"),
+}
+
+# Credentials of the test user database.py seeds into its in-memory fallback
+USERNAME = "test_user"
+PASSWORD = "password123"
+
+SAMPLE_REPORT = {
+    "recommendations": [
+        {"filename": f"{10000 + i}.jpg", "category": "Fashion Item", "confidence": 90 - i}
+        for i in range(5)
+    ],
+    "uploaded_category": "Shirt",
+    "style": "Casual",
+}
+
+
+def make_test_image(size=(640, 480)):
+    """JPEG bytes used as the /upload payload when no --image is given"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color=(73, 109, 137)).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class Client:
+    """One simulated user with its own connection pool and token"""
+
+    def __init__(self, base_url, image_bytes):
+        self.base_url = base_url
+        self.image_bytes = image_bytes
+        self.session = requests.Session()
+        self.token = None
+
+    def login(self):
+        response = self.session.post(f"{self.base_url}/api/auth/login",
+                                     json={"username": USERNAME, "password": PASSWORD}, timeout=120)
+        if response.status_code == 200:
+            self.token = response.json()["token"]
+        return response
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def upload(self):
+        files = {"file": ("bench.jpg", self.image_bytes, "image/jpeg")}
+        return self.session.post(f"{self.base_url}/upload", files=files, headers=self._headers(), timeout=120)
+
+    def images(self):
+        return self.session.get(f"{self.base_url}/api/images", headers=self._headers(), timeout=120)
+
+    def report(self):
+        return self.session.post(f"{self.base_url}/generate-report", json=SAMPLE_REPORT,
+                                 headers=self._headers(), timeout=120)
+
+
+def run_load(base_url, endpoints, concurrency, duration, image_bytes):
+    """
+    Hit the endpoints round-robin from `concurrency` threads for `duration` seconds
+
+    Args:
+        base_url (str): Server base URL
+        endpoints (list): Endpoint names from ENDPOINTS
+        concurrency (int): Number of concurrent clients
+        duration (float): Seconds to run
+        image_bytes (bytes): Upload payload
+
+    Returns:
+        dict: Per-endpoint request counts, errors, RPS and latency percentiles
+    """
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    statuses = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def worker(slot):
+        client = Client(base_url, image_bytes)
+        client.login()
+        step = slot
+        while time.time() < stop_at:
+            name = endpoints[step % len(endpoints)]
+            step += 1
+            began = time.perf_counter()
+            try:
+                status = getattr(client, name)().status_code
+            except requests.RequestException:
+                status = None
+            elapsed = time.perf_counter() - began
+            with lock:
+                latencies[name].append(elapsed)
+                statuses[name][str(status)] += 1
+                if status is None or status >= 400:
+                    errors[name] += 1
+
+    began = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall = time.time() - began
+
+    results = {}
+    for name in endpoints:
+        results[name] = {
+            "requests": len(latencies[name]),
+            "errors": errors[name],
+            "statuses": dict(statuses[name]),
+            "rps": round(len(latencies[name]) / wall, 2),
+            "latency_ms": percentiles(latencies[name]),
+        }
+    total = sum(len(values) for values in latencies.values())
+    results["total"] = {"requests": total, "errors": sum(errors.values()), "rps": round(total / wall, 2)}
+    return results
+
+
+def compare(previous, current):
+    """Print RPS and p50/p99 changes against an earlier report"""
+    print(f"\nComparison with {previous.get('server', 'wsgi')} server at {previous.get('commit')} "
+          f"({previous.get('timestamp')}), now {current.get('server', 'wsgi')}:")
+    for name, stats in current["endpoints"].items():
+        before = previous.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        line = f"  {name:<8} rps {before['rps']:>8} -> {stats['rps']:<8}"
+        for key in ("p50", "p99"):
+            if key in stats.get("latency_ms", {}) and key in before.get("latency_ms", {}):
+                line += f" {key} {before['latency_ms'][key]}ms -> {stats['latency_ms'][key]}ms"
+        print(line)
+
+
+def run_server(server_name, args, endpoints, image_bytes):
+    """
+    Start one serving mode (or use --url), run warm-up and measured load
+
+    Args:
+        server_name (str): Key of SERVERS
+        args (argparse.Namespace): Command line options
+        endpoints (list): Endpoint names
+        image_bytes (bytes): Upload payload
+
+    Returns:
+        dict: JSON report
+    """
+    server = None
+    cloudinary = None
+    base_url = args.url
+    uploads_dir = os.path.join(REPO_ROOT, "uploads")
+    existing_uploads = set(os.listdir(uploads_dir)) if os.path.isdir(uploads_dir) else set()
+    if not base_url:
+        cloudinary = start_fake_cloudinary(latency=args.cloudinary_latency)
+        port = free_port()
+        log_path = os.path.join(tempfile.gettempdir(), f"load_test_server_{port}.log")
+        app, worker_class = SERVERS[server_name]
+        print(f"Starting {server_name} server on port {port} ({args.workers} workers, log: {log_path})")
+        server = start_app(gunicorn_command(port, args.workers, args.threads, app=app, worker_class=worker_class),
+                           port, bench_env(cloudinary.server_address[1]), log_path)
+        base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        if args.warmup:
+            print(f"Warming up for {args.warmup}s")
+            run_load(base_url, endpoints, args.concurrency, args.warmup, image_bytes)
+
+        print(f"Running {args.duration}s at concurrency {args.concurrency} against {base_url}")
+        results = run_load(base_url, endpoints, args.concurrency, args.duration, image_bytes)
+
+        report = {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "server": server_name if server else None,
+            "config": {
+                "endpoints": endpoints,
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "workers": args.workers if server else None,
+                "threads": args.threads if server else None,
+                "upload_bytes": len(image_bytes),
+                "cloudinary_latency": args.cloudinary_latency if cloudinary else None,
+            },
+            "endpoints": {name: results[name] for name in endpoints},
+            "total": results["total"],
+            "workers": worker_memory(server.pid) if server else [],
+        }
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+        if cloudinary:
+            cloudinary.shutdown()
+        if server and os.path.isdir(uploads_dir):
+            # Drop the files the benchmark uploaded into the local uploads/ folder
+            for name in set(os.listdir(uploads_dir)) - existing_uploads:
+                os.remove(os.path.join(uploads_dir, name))
+
+    for name in endpoints:
+        stats = report["endpoints"][name]
+        print(f"  {name:<8} {stats['requests']:>6} req  {stats['errors']:>4} err  "
+              f"{stats['rps']:>8} rps  {stats['latency_ms']}")
+    print(f"  total    {report['total']['requests']:>6} req  {report['total']['rps']} rps")
+    for worker in report["workers"]:
+        print(f"  worker {worker['pid']}: rss {worker['rss_mb']} MB (peak {worker['peak_rss_mb']} MB)")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Fashion Recommendation API")
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--server", choices=list(SERVERS) + ["both"], default="wsgi",
+                        help="Serving mode to start; 'both' compares sync and async side by side")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"Comma separated subset of {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per run")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of unrecorded warm-up traffic")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers (render.yaml uses 2)")
+    parser.add_argument("--threads", type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument("--image", help="Image file to upload (defaults to a generated 640x480 JPEG)")
+    parser.add_argument("--cloudinary-latency", type=float, default=0.05,
+                        help="Seconds the fake Cloudinary server waits per upload")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+    if args.url and args.server == "both":
+        parser.error("--server both starts its own servers and cannot be combined with --url")
+
+    image_bytes = open(args.image, "rb").read() if args.image else make_test_image()
+
+    if args.server == "both":
+        reports = {name: run_server(name, args, endpoints, image_bytes) for name in SERVERS}
+        compare(reports["wsgi"], reports["asgi"])
+        report = {"side_by_side": reports}
+    else:
+        report = run_server(args.server, args, endpoints, image_bytes)
+        if args.compare:
+            with open(args.compare) as f:
+                compare(json.load(f), report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
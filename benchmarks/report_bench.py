@@ -0,0 +1,75 @@
+"""
+Reports/sec for PDF report generation
+
+Measures rendering from the compiled layout (every report distinct, so
+the cache never hits) and repeated downloads served from the report cache.
+
+Usage (from the repository root):
+    python -m benchmarks.report_bench --reports 2000 --output report_bench.json
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import reports
+from benchmarks.common import git_commit, percentiles
+
+
+def sample_recommendations(seed, count=5):
+    return [{"filename": f"{10000 + seed * count + i}.jpg", "category": "Shirt", "confidence": 95 - i}
+            for i in range(count)]
+
+
+def measure(label, total, threads, make_report):
+    """Run `total` reports across `threads` threads and summarise throughput"""
+    latencies = []
+
+    def one(i):
+        began = time.perf_counter()
+        make_report(i)
+        latencies.append(time.perf_counter() - began)
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - began
+
+    result = {"reports": total, "threads": threads, "reports_per_sec": round(total / elapsed, 1),
+              "latency_ms": percentiles(latencies)}
+    print(f"  {label:<10} {result['reports_per_sec']:>10} reports/s  {result['latency_ms']}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF report generation")
+    parser.add_argument("--reports", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--recommendations", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    count = args.recommendations
+    reports.report_cache.clear()
+
+    print(f"Rendering {args.reports} reports with {count} recommendations on {args.threads} thread(s)")
+    results = {
+        "commit": git_commit(),
+        "uncached": measure("uncached", args.reports, args.threads,
+                            lambda i: reports.render_report(sample_recommendations(i, count), "Shirt", "Casual")),
+    }
+
+    recommendations = sample_recommendations(0, count)
+    reports.generate_pdf_report(recommendations, "Shirt", "Casual")
+    results["cached"] = measure("cached", args.reports, args.threads,
+                                lambda i: reports.generate_pdf_report(recommendations, "Shirt", "Casual"))
+    results["cache"] = reports.report_cache.stats()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Binary-code search index with exact re-ranking.
+
+Every searched catalogue item gets a 256- or 512-bit code: the signs of
+its ResNet50 features after a learned rotation (ITQ: PCA followed by
+iterative quantization) or a random projection ("sign"). A query is
+encoded the same way; Hamming distances to all codes (XOR + popcount over
+packed uint64 words) select the `candidates` closest items, which are
+re-ranked with exact distances on the float features. Codes take bits/8
+bytes per item (64 bytes at 512 bits, against 8 KB of float32 features).
+
+BinaryIndex.kneighbors has the same signature as NearestNeighbors, so
+app.py uses it as a drop-in replacement when SEARCH_MODE=binary.
+
+Usage (after preprocess.py and dedup.py):
+    python binary_index.py
+    python binary_index.py --bits 256 --method sign --candidates 100 200 500
+"""
+import argparse
+import os
+import pickle as pkl
+import time
+
+import numpy as np
+
+from backbones import add_store_arguments, resolve_store_arguments
+
+BINARY_INDEX_PATH = "binary_index.pkl"
+BINARY_BITS = 512
+# Candidates re-ranked exactly per query
+BINARY_CANDIDATES = int(os.getenv('BINARY_CANDIDATES', '200'))
+ITQ_ITERATIONS = 50
+ITQ_SAMPLE = 20000
+
+M1 = np.uint64(0x5555555555555555)
+M2 = np.uint64(0x3333333333333333)
+M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+M8 = np.uint64(0x00FF00FF00FF00FF)
+H01 = np.uint64(0x0101010101010101)
+H16 = np.uint64(0x0001000100010001)
+
+
+def _byte_counts(words):
+    """Set bits of every byte of uint64 words, in place (SWAR)"""
+    words -= (words >> np.uint64(1)) & M1
+    words[...] = (words & M2) + ((words >> np.uint64(2)) & M2)
+    words += words >> np.uint64(4)
+    words &= M4
+    return words
+
+
+def popcount(words):
+    """Set bits of every uint64 word"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    return (_byte_counts(np.array(words, dtype=np.uint64)) * H01) >> np.uint64(56)
+
+
+def train_projection(features, bits=BINARY_BITS, method="itq", iterations=ITQ_ITERATIONS, sample=ITQ_SAMPLE,
+                     seed=0):
+    """
+    Learn the mean and projection that turn features into binary codes
+
+    Args:
+        features (np.ndarray): Catalogue matrix (n_items x dim)
+        bits (int, optional): Code length, a multiple of 64. Defaults to BINARY_BITS.
+        method (str, optional): "itq" (PCA + iterative quantization) or "sign"
+            (random Gaussian projection). Defaults to "itq".
+        iterations (int, optional): ITQ iterations. Defaults to ITQ_ITERATIONS.
+        sample (int, optional): Items ITQ is trained on. Defaults to ITQ_SAMPLE.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        tuple: (mean vector, dim x bits projection matrix)
+    """
+    if bits % 64:
+        raise ValueError("bits must be a multiple of 64")
+    rng = np.random.default_rng(seed)
+    features = np.asarray(features, dtype=np.float32)
+    mean = features.mean(axis=0)
+
+    if method == "sign":
+        return mean, rng.standard_normal((features.shape[1], bits)).astype(np.float32)
+    if method != "itq":
+        raise ValueError(f"Unknown method: {method}")
+    if bits > min(features.shape):
+        raise ValueError(f"ITQ needs at least {bits} items and dimensions")
+
+    rows = rng.choice(len(features), size=min(sample, len(features)), replace=False)
+    centred = features[rows] - mean
+    _, _, vt = np.linalg.svd(centred, full_matrices=False)
+    pca = vt[:bits].T
+    projected = centred @ pca
+
+    # Rotation minimising the quantization error ||sign(VR) - VR||
+    rotation, _ = np.linalg.qr(rng.standard_normal((bits, bits)))
+    for _ in range(iterations):
+        codes = np.where(projected @ rotation >= 0, 1.0, -1.0)
+        u, _, wt = np.linalg.svd(codes.T @ projected)
+        rotation = (u @ wt).T
+    return mean, (pca @ rotation).astype(np.float32)
+
+
+def encode(features, mean, projection):
+    """Packed binary codes (n x bits/64 uint64) of feature vectors"""
+    bits = (np.atleast_2d(np.asarray(features, dtype=np.float32)) - mean) @ projection >= 0
+    return np.ascontiguousarray(np.packbits(bits, axis=1)).view(np.uint64)
+
+
+class BinaryIndex:
+    """Hamming prefilter over packed codes with exact re-ranking"""
+
+    def __init__(self, codes, mean, projection, features, candidates=BINARY_CANDIDATES):
+        if codes.shape[1] > 31:
+            raise ValueError("Codes longer than 1984 bits would overflow the byte counters")
+        self.codes = codes
+        # One contiguous array per word position, so each XOR + popcount pass is a flat loop
+        self.words = np.ascontiguousarray(codes.T)
+        self.mean = mean
+        self.projection = projection
+        self.features = np.asarray(features, dtype=np.float32)
+        self.squared_norms = np.einsum("ij,ij->i", self.features, self.features)
+        self.candidates = candidates
+
+    @property
+    def bits(self):
+        return self.codes.shape[1] * 64
+
+    def hamming(self, query_code):
+        """Hamming distance of every code to a packed query code"""
+        if hasattr(np, "bitwise_count"):
+            # NumPy 2.0+ counts with the CPU's popcount instruction
+            total = np.zeros(len(self.codes), dtype=np.int32)
+            for words, query_word in zip(self.words, query_code):
+                total += popcount(np.bitwise_xor(words, query_word))
+            return total
+        total = None
+        for words, query_word in zip(self.words, query_code):
+            counts = _byte_counts(np.bitwise_xor(words, query_word))
+            # Byte lanes hold at most 8 per word, so up to 31 words can be added before they overflow
+            if total is None:
+                total = counts
+            else:
+                total += counts
+        # Fold bytes into 16-bit lanes, then add the four lanes into the top one
+        total = (total & M8) + ((total >> np.uint64(8)) & M8)
+        return ((total * H16) >> np.uint64(48)).astype(np.int32)
+
+    def search(self, query, k=5, candidates=None):
+        """
+        Nearest items of one query
+
+        Args:
+            query (array): Feature vector
+            k (int, optional): Results. Defaults to 5.
+            candidates (int, optional): Items re-ranked exactly. Defaults to self.candidates.
+
+        Returns:
+            tuple: (Euclidean distances, item indices), nearest first
+        """
+        query = np.asarray(query, dtype=np.float32)
+        distances = self.hamming(encode(query, self.mean, self.projection)[0])
+        count = min(max(candidates or self.candidates, k), len(distances))
+        if count < len(distances):
+            shortlist = np.argpartition(distances, count - 1)[:count]
+        else:
+            shortlist = np.arange(len(distances))
+
+        squared = self.squared_norms[shortlist] + query @ query - 2 * (self.features[shortlist] @ query)
+        k = min(k, len(shortlist))
+        top = np.argpartition(squared, k - 1)[:k] if k < len(shortlist) else np.arange(len(shortlist))
+        top = top[np.argsort(squared[top], kind="stable")]
+        return np.sqrt(np.maximum(squared[top], 0)), shortlist[top]
+
+    def kneighbors(self, X, n_neighbors=5):
+        """NearestNeighbors.kneighbors equivalent: (distances, indices) per query row"""
+        results = [self.search(query, n_neighbors) for query in X]
+        return np.array([d for d, _ in results]), np.array([i for _, i in results])
+
+
+def build(features, rows, bits=BINARY_BITS, method="itq", seed=0):
+    """
+    Train and encode the index of the searched catalogue rows
+
+    Args:
+        features (np.ndarray): Catalogue matrix (n_items x dim)
+        rows (np.ndarray): Catalogue rows searched by the app (cluster representatives)
+        bits (int, optional): Code length. Defaults to BINARY_BITS.
+        method (str, optional): "itq" or "sign". Defaults to "itq".
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        dict: {"bits", "method", "rows", "mean", "projection", "codes"} as saved by main()
+    """
+    indexed = np.asarray(features, dtype=np.float32)[rows]
+    mean, projection = train_projection(indexed, bits, method, seed=seed)
+    return {"bits": bits, "method": method, "rows": np.asarray(rows), "mean": mean, "projection": projection,
+            "codes": encode(indexed, mean, projection)}
+
+
+def load_binary_index(features, rows, path=BINARY_INDEX_PATH, candidates=BINARY_CANDIDATES):
+    """
+    Load the index written by this script for the rows the app searches
+
+    Args:
+        features (np.ndarray): Catalogue matrix, for exact re-ranking
+        rows (np.ndarray): Catalogue rows searched by the app
+        path (str, optional): Index pickle. Defaults to BINARY_INDEX_PATH.
+        candidates (int, optional): Items re-ranked per query. Defaults to BINARY_CANDIDATES.
+
+    Returns:
+        BinaryIndex: The index, or None when the file is missing or was built for other rows
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        data = pkl.load(open(path, "rb"))
+    except Exception as e:
+        print(f"Warning: Could not load {path}: {e}")
+        return None
+    if not np.array_equal(data["rows"], rows):
+        print(f"Warning: {path} was built for a different catalogue or clustering; re-run binary_index.py")
+        return None
+    return BinaryIndex(data["codes"], data["mean"], data["projection"], np.asarray(features)[rows], candidates)
+
+
+def measure_recall(index, queries, exact_indices, k=5, candidate_counts=(100, 200, 500)):
+    """
+    Recall@k against exact search and per-query latency for several candidate counts
+
+    Args:
+        index (BinaryIndex): Index to measure
+        queries (np.ndarray): Query vectors
+        exact_indices (np.ndarray): Exact top-k item indices per query
+        k (int, optional): Results per query. Defaults to 5.
+        candidate_counts (tuple, optional): Candidate counts to try. Defaults to (100, 200, 500).
+
+    Returns:
+        list: One dict per candidate count with recall and latency in ms
+    """
+    report = []
+    for candidates in candidate_counts:
+        found, latencies = 0, []
+        for query, exact in zip(queries, exact_indices):
+            began = time.perf_counter()
+            _, indices = index.search(query, k, candidates)
+            latencies.append(time.perf_counter() - began)
+            found += len(set(indices.tolist()) & set(exact[:k].tolist()))
+        latencies = np.array(latencies) * 1000
+        report.append({
+            "candidates": candidates,
+            "recall_at_k": round(found / (k * len(queries)), 4),
+            "latency_ms": {"p50": round(float(np.percentile(latencies, 50)), 4),
+                           "p99": round(float(np.percentile(latencies, 99)), 4)},
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the binary-code search index")
+    add_store_arguments(parser)
+    parser.add_argument("--bits", type=int, default=BINARY_BITS)
+    parser.add_argument("--method", choices=["itq", "sign"], default="itq")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[100, 200, 500],
+                        help="Candidate counts to report recall for")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500, help="Catalogue items used as recall queries")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help=f"Defaults to {BINARY_INDEX_PATH} in the feature store")
+    args = parser.parse_args()
+    backbone = resolve_store_arguments(args)
+    args.output = args.output or backbone.path(BINARY_INDEX_PATH)
+
+    from dedup import CLUSTERS_PATH, load_clusters
+    from evaluate import blocked_neighbors, load_index
+    features, filenames = load_index(args.features, args.filenames)
+    clusters = load_clusters(len(filenames), backbone.path(CLUSTERS_PATH))
+    rows = clusters["representatives"] if clusters else np.arange(len(filenames))
+
+    began = time.perf_counter()
+    data = build(features, rows, args.bits, args.method, args.seed)
+    print(f"Encoded {len(rows)} items as {args.bits}-bit {args.method} codes in {time.perf_counter() - began:.1f}s "
+          f"({data['codes'].nbytes / 1e6:.1f} MB, float32 features {features[rows].nbytes / 1e6:.1f} MB)")
+
+    index = BinaryIndex(data["codes"], data["mean"], data["projection"], features[rows])
+    rng = np.random.default_rng(args.seed)
+    queries = features[rng.choice(len(features), size=min(args.queries, len(features)), replace=False)]
+    _, exact, _ = blocked_neighbors(features[rows], queries, args.k)
+    for result in measure_recall(index, queries, exact, args.k, args.candidates):
+        print(f"  {result['candidates']:>5} candidates: recall@{args.k} {result['recall_at_k'] * 100:.2f}%, "
+              f"latency p50 {result['latency_ms']['p50']} ms, p99 {result['latency_ms']['p99']} ms")
+
+    with open(args.output, "wb") as f:
+        pkl.dump(data, f)
+    print(f"Index written to {args.output}; serve it with SEARCH_MODE=binary")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Online catalogue mutations: a delta segment over the feature store, made durable by a write-ahead log.
+
+The feature store is built offline by preprocess.py. Items added, replaced
+or removed since then are held in the DeltaSegment of the SearchIndex:
+the features of new items in a small matrix searched by brute force next
+to the main index, and the removed catalogue rows as tombstones filtered
+out of its results. Replacing an item tombstones its old row and adds the
+new features.
+
+Every mutation is appended to catalogue.wal in the feature store, and
+fsynced, before it is applied. Loading the index replays the log, so
+mutations survive a restart. Each worker also tails the log every
+CATALOGUE_POLL_INTERVAL seconds, so an item added through one worker is
+searched by all of them within seconds.
+
+compact() merges the delta into the store: it writes new
+Images_features.pkl and filenames.pkl and starts an empty log for them.
+The derived indexes (clusters.pkl, phash_index.pkl, binary_index.pkl,
+colour_index.pkl) cover the old rows, which no longer line up with the
+new store even when the item count is unchanged, so compaction renames
+them to *.stale. The app runs without them until their scripts are re-run.
+
+The log's first line names the store version it was started for. A log
+for another version is stale: after compaction by another worker, the
+index is reloaded; after preprocess.py rebuilt the store from images/
+(which mutations keep up to date), the log is started afresh.
+"""
+import base64
+import json
+import os
+import pickle as pkl
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from backbones import store_version, write_meta
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks on Windows: a single development process needs none
+    fcntl = None
+
+CATALOGUE_LOG = "catalogue.wal"
+# Indexes built from the store's rows by offline scripts, moved aside by compaction
+DERIVED_INDEXES = ("clusters.pkl", "phash_index.pkl", "binary_index.pkl", "colour_index.pkl")
+# Directory catalogue images are served from
+CATALOGUE_IMAGES = "images"
+# Seconds between reads of the log for mutations made by other workers
+CATALOGUE_POLL_INTERVAL = float(os.getenv('CATALOGUE_POLL_INTERVAL', '2'))
+# Compact once the delta holds this many added and removed items (0: only on request)
+CATALOGUE_COMPACT_ITEMS = int(os.getenv('CATALOGUE_COMPACT_ITEMS', '1000'))
+# Longest wait between attempts to reload a compacted store that failed to load
+CATALOGUE_RELOAD_BACKOFF_MAX = 300
+
+# Snapshot of a delta segment: replaced whole, never modified
+DeltaState = namedtuple("DeltaState", ["features", "filenames", "removed"])
+
+
+class StaleLog(Exception):
+    """The log was started for another version of the feature store"""
+
+
+def encode_features(features):
+    return base64.b64encode(np.asarray(features, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_features(text):
+    return np.frombuffer(base64.b64decode(text), dtype=np.float32)
+
+
+class CatalogueLog:
+    """Append-only log of catalogue mutations, shared by the worker processes"""
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def locked(self):
+        """Exclusive access across processes (the log file itself is replaced by start())"""
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def base(self):
+        """Store version the log was started for, or None if there is no log"""
+        try:
+            with open(self.path, "rb") as f:
+                return json.loads(f.readline())["base"]
+        except FileNotFoundError:
+            return None
+
+    def start(self, base):
+        """Replace the log with an empty one for a store version (call with the lock held)"""
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(json.dumps({"base": base, "started_at": datetime.utcnow().isoformat()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def append(self, base, record):
+        """
+        Durably record a mutation
+
+        Args:
+            base (str): Version of the store the mutation applies to
+            record (dict): The mutation
+
+        Raises:
+            StaleLog: The log belongs to another version of the store
+        """
+        with self.locked():
+            current = self.base()
+            if current is None:
+                self.start(base)
+            elif current != base:
+                raise StaleLog(f"{self.path} was started for {current}, not {base}")
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def read(self, base, offset=0):
+        """
+        Mutations appended since a byte offset
+
+        Args:
+            base (str): Version of the store the caller serves
+            offset (int, optional): Bytes already read. Defaults to 0.
+
+        Returns:
+            tuple: (records, new offset); a line still being written is left for the next read
+
+        Raises:
+            StaleLog: The log belongs to another version of the store
+        """
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return [], 0
+        with f:
+            header = f.readline()
+            if json.loads(header)["base"] != base:
+                raise StaleLog(f"{self.path} was started for another store version")
+            f.seek(max(offset, len(header)))
+            records = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                records.append(json.loads(line))
+                offset = f.tell()
+            return records, max(offset, len(header))
+
+
+class DeltaSegment:
+    """Items added and removed since the feature store was written"""
+
+    def __init__(self, filenames, dim):
+        # Catalogue rows by image name, the key mutations use
+        self.rows = {os.path.basename(filename): row for row, filename in enumerate(filenames)}
+        self.state = DeltaState(np.empty((0, dim), dtype=np.float32), (), frozenset())
+        self.lock = threading.Lock()
+        # Bytes of the log applied
+        self.offset = 0
+        self.mutations = 0
+
+    def contains(self, name):
+        """Whether an image name is in the catalogue, counting mutations"""
+        state = self.state
+        row = self.rows.get(name)
+        return (row is not None and row not in state.removed) or \
+            any(os.path.basename(filename) == name for filename in state.filenames)
+
+    def size(self):
+        state = self.state
+        return len(state.filenames) + len(state.removed)
+
+    def _apply(self, records):
+        """Apply logged mutations, publishing the result as one new state (call with the lock held)"""
+        if not records:
+            return
+        state = self.state
+        items = {os.path.basename(filename): (filename, vector)
+                 for filename, vector in zip(state.filenames, state.features)}
+        removed = set(state.removed)
+        for record in records:
+            name = record["filename"]
+            items.pop(name, None)
+            if name in self.rows:
+                removed.add(self.rows[name])
+            if record["op"] == "upsert":
+                items[name] = (os.path.join(CATALOGUE_IMAGES, name), decode_features(record["features"]))
+        features = np.array([vector for _, vector in items.values()], dtype=np.float32)
+        self.state = DeltaState(features.reshape(len(items), state.features.shape[1]),
+                                tuple(filename for filename, _ in items.values()), frozenset(removed))
+        self.mutations += len(records)
+
+    def catch_up(self, log, base):
+        """
+        Apply what other workers appended to the log
+
+        Returns:
+            int: Mutations applied
+
+        Raises:
+            StaleLog: The log belongs to another version of the store
+        """
+        # One reader at a time, so records are applied once and in log order
+        with self.lock:
+            records, offset = log.read(base, self.offset)
+            self._apply(records)
+            self.offset = offset
+        return len(records)
+
+    def stats(self):
+        state = self.state
+        return {"added": len(state.filenames), "removed": len(state.removed), "mutations": self.mutations}
+
+
+def open_log(backbone):
+    return CatalogueLog(backbone.path(CATALOGUE_LOG))
+
+
+def replay(index, backbone):
+    """
+    Apply the backbone's log to a freshly loaded index
+
+    Raises:
+        StaleLog: The store was rewritten while the index was loading
+    """
+    log = open_log(backbone)
+    try:
+        index.delta.catch_up(log, index.version)
+    except StaleLog:
+        with log.locked():
+            if store_version(backbone) != index.version:
+                raise
+            # The store was rebuilt (preprocess.py) since the log was started
+            print(f"Starting a new {log.path} for {index.version}")
+            log.start(index.version)
+        index.delta.offset = 0
+    if index.delta.mutations:
+        print(f"Replayed {index.delta.mutations} catalogue mutations from {log.path}")
+
+
+def mutate(index, backbone, record):
+    """
+    Log a mutation, then apply it to the index
+
+    Raises:
+        StaleLog: The store was compacted by another worker and this one has not reloaded yet
+    """
+    log = open_log(backbone)
+    record = dict(record, at=datetime.utcnow().isoformat())
+    log.append(index.version, record)
+    # Apply everything up to and including this record, in log order
+    index.delta.catch_up(log, index.version)
+
+
+def write_atomically(path, value):
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        pkl.dump(value, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def compact(index, backbone):
+    """
+    Merge the delta into a new feature store and start an empty log for it
+
+    Args:
+        index (SearchIndex): Index the delta belongs to
+        backbone (Backbone): Backbone of the store
+
+    Returns:
+        str: Version of the new store; reload the index to serve it
+
+    Raises:
+        StaleLog: The store was already compacted by another worker
+        ValueError: No feature store is loaded
+    """
+    if index.version is None:
+        raise ValueError("No feature store is loaded")
+    log = open_log(backbone)
+    began = time.perf_counter()
+    # Mutations wait until the new store and its log are in place
+    with log.locked():
+        index.delta.catch_up(log, index.version)
+        state = index.delta.state
+        keep = np.setdiff1d(np.arange(len(index.filenames)), np.fromiter(state.removed, dtype=np.int64))
+        features = np.asarray(index.features, dtype=np.float32)[keep]
+        features = np.vstack([features, state.features]) if len(state.filenames) else features
+        filenames = [index.filenames[row] for row in keep] + list(state.filenames)
+
+        # Row positions change (a replaced item moves to the end), so the derived indexes
+        # would load and point at the wrong items
+        for name in DERIVED_INDEXES:
+            if os.path.exists(backbone.path(name)):
+                os.replace(backbone.path(name), backbone.path(name) + ".stale")
+        write_atomically(backbone.path("Images_features.pkl"), features)
+        write_atomically(backbone.path("filenames.pkl"), filenames)
+        write_meta(backbone, len(filenames))
+        version = store_version(backbone)
+        log.start(version)
+    print(f"Compacted {len(state.filenames)} added and {len(state.removed)} removed items into {version} "
+          f"({len(filenames)} items) in {time.perf_counter() - began:.1f}s")
+    return version
+
+
+def follow(handle, backbone, loader, on_change=None, interval=CATALOGUE_POLL_INTERVAL):
+    """
+    Tail the log in a background thread, applying other workers' mutations to the current index
+
+    Args:
+        handle (IndexHandle): Handle of the served index
+        backbone (Backbone): Backbone of the store
+        loader (callable): Loads a new index, for when the store was compacted elsewhere; retried
+            with backoff up to CATALOGUE_RELOAD_BACKOFF_MAX seconds while it fails
+        on_change (callable, optional): Called after mutations were applied. Defaults to None.
+        interval (float, optional): Seconds between reads. Defaults to CATALOGUE_POLL_INTERVAL.
+    """
+    if interval <= 0:
+        return
+    log = open_log(backbone)
+
+    def run():
+        delay = interval
+        while True:
+            time.sleep(delay)
+            index = handle.current
+            if index.version is None:
+                continue
+            try:
+                if index.delta.catch_up(log, index.version) and on_change is not None:
+                    on_change()
+                delay = interval
+            except StaleLog:
+                handle.reload(loader, wait=True)
+                if handle.current is index:
+                    # A failed load is retried with backoff, not a full load every poll
+                    delay = min(delay * 2, CATALOGUE_RELOAD_BACKOFF_MAX)
+                    print(f"Warning: {log.path} is for a newer store that did not load, retrying in {delay:.0f}s")
+                else:
+                    delay = interval
+            except Exception as e:
+                print(f"Warning: Could not read {log.path}: {e}")
+
+    threading.Thread(target=run, name="catalogue-follow", daemon=True).start()
@@ -0,0 +1,108 @@
+"""
+Fashion categories derived from filenames
+
+Kept apart from app.py so the data layer can label stored catalogue ids
+without importing the model.
+"""
+import csv
+import os
+
+# Define fashion categories (mapping patterns in filenames to categories)
+category_patterns = {
+    "tshirt": "T-Shirt",
+    "shirt": "Shirt",
+    "jeans": "Jeans",
+    "trouser": "Trousers",
+    "pant": "Pants",
+    "dress": "Dress",
+    "skirt": "Skirt",
+    "jacket": "Jacket",
+    "coat": "Coat",
+    "sweater": "Sweater",
+    "hoodie": "Hoodie",
+    "shorts": "Shorts",
+    "top": "Top",
+    "blouse": "Blouse",
+    "formal": "Formal Wear",
+    "casual": "Casual Wear",
+    "shoe": "Shoes",
+    "sneaker": "Sneakers",
+    "boot": "Boots",
+    "sandal": "Sandals",
+    "accessory": "Accessories",
+    "bag": "Bags",
+    "handbag": "Handbags",
+    "hat": "Hats",
+    "scarf": "Scarves",
+    "watch": "Watches",
+    "jewelry": "Jewelry"
+}
+
+def get_category_from_filename(filename):
+    """Extract category from filename"""
+    filename_lower = filename.lower()
+    
+    # Default category if none is found
+    category = "Fashion Item"
+    
+    for pattern, cat_name in category_patterns.items():
+        if pattern in filename_lower:
+            category = cat_name
+            break
+            
+    return category
+
+# styles.csv articleType values that match each filename category
+category_article_types = {
+    "T-Shirt": ["Tshirts"],
+    "Shirt": ["Shirts"],
+    "Jeans": ["Jeans"],
+    "Trousers": ["Trousers"],
+    "Pants": ["Trousers", "Track Pants", "Capris"],
+    "Dress": ["Dresses"],
+    "Skirt": ["Skirts"],
+    "Jacket": ["Jackets", "Rain Jacket", "Blazers"],
+    "Coat": ["Jackets", "Blazers"],
+    "Sweater": ["Sweaters"],
+    "Hoodie": ["Sweatshirts"],
+    "Shorts": ["Shorts"],
+    "Top": ["Tops"],
+    "Blouse": ["Tops"],
+    "Formal Wear": ["Shirts", "Blazers", "Formal Shoes"],
+    "Casual Wear": ["Tshirts", "Casual Shoes"],
+    "Shoes": ["Casual Shoes", "Formal Shoes", "Sports Shoes"],
+    "Sneakers": ["Sports Shoes", "Casual Shoes"],
+    "Boots": ["Boots", "Casual Shoes"],
+    "Sandals": ["Sandals", "Flip Flops"],
+    "Accessories": ["Belts", "Wallets", "Sunglasses"],
+    "Bags": ["Handbags", "Backpacks", "Laptop Bag"],
+    "Handbags": ["Handbags"],
+    "Hats": ["Caps", "Hat"],
+    "Scarves": ["Scarves"],
+    "Watches": ["Watches"],
+    "Jewelry": ["Earrings", "Pendant", "Ring", "Bracelet", "Necklace and Chains"]
+}
+
+def load_article_types(filenames, styles_path="styles.csv"):
+    """
+    styles.csv articleType of every catalogue file
+    
+    Args:
+        filenames (list): Catalogue filenames (e.g. "images/10000.jpg")
+        styles_path (str, optional): Path to styles.csv. Defaults to "styles.csv".
+        
+    Returns:
+        list: Article type per filename (None for unknown items), or None if styles.csv can't be read
+    """
+    try:
+        with open(styles_path, newline="", encoding="utf-8") as f:
+            rows = csv.DictReader(f)
+            if "articleType" not in (rows.fieldnames or []):
+                return None
+            article_types = {}
+            for row in rows:
+                article_types.setdefault(row["id"], row["articleType"])
+    except Exception as e:
+        print(f"Warning: Could not read {styles_path}: {e}")
+        return None
+    return [article_types.get(os.path.splitext(os.path.basename(f))[0]) for f in filenames]
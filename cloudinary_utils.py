@@ -1,6 +1,8 @@
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
+import cloudinary.utils
+import asyncio
 import os
 import time
 from dotenv import load_dotenv
@@ -32,6 +34,57 @@ else:
     print(f"API key: {'Set' if api_key else 'Not set'}")
     print(f"API secret: {'Set' if api_secret else 'Not set'}")
 
+def _upload_options(public_id=None, folder="fashion_uploads", user_id=None):
+    """Upload parameters shared by the sync and async uploads"""
+    # Create a clean folder structure for uploads
+    # If user_id is provided, create a user-specific folder
+    if user_id:
+        # Clean the user_id to avoid issues with special characters
+        user_folder = str(user_id).replace('/', '_').replace('.', '_')
+        upload_folder = f"{folder}/{user_folder}"
+    else:
+        upload_folder = folder
+    
+    # Keep upload options minimal to avoid signature issues
+    upload_options = {
+        "folder": upload_folder
+    }
+    
+    # Only add public_id if provided and ensure it's clean
+    if public_id:
+        clean_public_id = public_id.replace(' ', '_').replace('/', '_')
+        upload_options["public_id"] = clean_public_id
+    
+    return upload_options
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def _local_fallback(image_path, public_id, error):
+    """Upload response pointing at the local copy when Cloudinary fails"""
+    print(f"Error uploading to Cloudinary: {error}")
+    print(f"Error Details: {str(error)}")
+    print("Returning local file info instead")
+    
+    # Return a dict with similar structure to Cloudinary response
+    # but using local file path as URL
+    if os.path.exists(image_path):
+        filename = os.path.basename(image_path)
+        return {
+            "public_id": public_id or os.path.splitext(filename)[0],
+            "secure_url": f"/uploads/{filename}",
+            "url": f"/uploads/{filename}",
+            "original_filename": filename,
+            "error": str(error),
+            "fallback": True
+        }
+    else:
+        return {
+            "error": f"Image file not found: {image_path}",
+            "fallback": True
+        }
+
 def upload_image(image_path, public_id=None, folder="fashion_uploads", user_id=None):
     """
     Upload an image to Cloudinary
@@ -50,24 +103,7 @@ def upload_image(image_path, public_id=None, folder="fashion_uploads", user_id=N
         if not cloudinary_configured:
             raise ValueError("Cloudinary is not properly configured")
             
-        # Create a clean folder structure for uploads
-        # If user_id is provided, create a user-specific folder
-        if user_id:
-            # Clean the user_id to avoid issues with special characters
-            user_folder = str(user_id).replace('/', '_').replace('.', '_')
-            upload_folder = f"{folder}/{user_folder}"
-        else:
-            upload_folder = folder
-        
-        # Keep upload options minimal to avoid signature issues
-        upload_options = {
-            "folder": upload_folder
-        }
-        
-        # Only add public_id if provided and ensure it's clean
-        if public_id:
-            clean_public_id = public_id.replace(' ', '_').replace('/', '_')
-            upload_options["public_id"] = clean_public_id
+        upload_options = _upload_options(public_id, folder, user_id)
         
         print(f"Uploading image to Cloudinary: {image_path}")
         print(f"Upload options: {upload_options}")
@@ -85,27 +121,47 @@ def upload_image(image_path, public_id=None, folder="fashion_uploads", user_id=N
         print(f"Cloudinary upload successful: {result.get('secure_url')}")
         return result
     except Exception as e:
-        print(f"Error uploading to Cloudinary: {e}")
-        print(f"Error Details: {str(e)}")
-        print("Returning local file info instead")
+        return _local_fallback(image_path, public_id, e)
+
+async def upload_image_async(http_client, image_path, public_id=None, folder="fashion_uploads", user_id=None):
+    """
+    Upload an image to Cloudinary without blocking the event loop
+    
+    Calls the same signed upload API as the Cloudinary SDK, through an
+    httpx.AsyncClient, for the ASGI server (asgi_app.py).
+    
+    Args:
+        http_client (httpx.AsyncClient): Shared HTTP client
+        image_path (str): Path to the image file
+        public_id (str, optional): Public ID for the image. Defaults to None.
+        folder (str, optional): Folder to upload to. Defaults to "fashion_uploads".
+        user_id (str, optional): User ID to include in folder path. Defaults to None.
+        
+    Returns:
+        dict: Cloudinary upload response or local file info if Cloudinary is unavailable
+    """
+    try:
+        if not cloudinary_configured:
+            raise ValueError("Cloudinary is not properly configured")
+        
+        params = _upload_options(public_id, folder, user_id)
+        params["timestamp"] = int(time.time())
+        params = cloudinary.utils.sign_request(params, {"api_key": api_key, "api_secret": api_secret})
+        
+        # Read in a worker thread so the event loop keeps serving other requests
+        data = await asyncio.to_thread(_read_file, image_path)
         
-        # Return a dict with similar structure to Cloudinary response
-        # but using local file path as URL
-        if os.path.exists(image_path):
-            filename = os.path.basename(image_path)
-            return {
-                "public_id": public_id or os.path.splitext(filename)[0],
-                "secure_url": f"/uploads/{filename}",
-                "url": f"/uploads/{filename}",
-                "original_filename": filename,
-                "error": str(e),
-                "fallback": True
-            }
-        else:
-            return {
-                "error": f"Image file not found: {image_path}",
-                "fallback": True
-            }
+        response = await http_client.post(
+            cloudinary.utils.cloudinary_api_url("upload", cloud_name=cloud_name),
+            data=params,
+            files={"file": (os.path.basename(image_path), data)}
+        )
+        response.raise_for_status()
+        result = response.json()
+        print(f"Cloudinary upload successful: {result.get('secure_url')}")
+        return result
+    except Exception as e:
+        return _local_fallback(image_path, public_id, e)
 
 def delete_image(public_id):
     """
@@ -0,0 +1,157 @@
+"""
+Colour-histogram index of the catalogue images.
+
+A fallback signal for when the model is not loaded or is shed under load:
+every image is reduced to a 64-bin RGB histogram (4 levels per channel)
+of a small thumbnail, ignoring the near-white studio background. Histograms
+are stored square-rooted, so the Euclidean distance between two of them
+is the Hellinger distance of the colour distributions, and a lookup is
+one small matrix-vector product.
+
+Usage (after preprocess.py):
+    python colour_index.py
+"""
+import argparse
+import os
+import pickle as pkl
+import time
+
+import numpy as np
+from PIL import Image
+
+from backbones import get_backbone
+
+COLOUR_INDEX_PATH = "colour_index.pkl"
+LEVELS = 4
+BINS = LEVELS ** 3
+THUMBNAIL_SIZE = 32
+# Pixels this bright in every channel are background, not garment
+BACKGROUND = 235
+
+
+def _thumbnail_pixels(img):
+    """THUMBNAIL_SIZE x THUMBNAIL_SIZE RGB pixels of an image, one row per pixel"""
+    # Decode JPEGs at reduced scale; a 32x32 thumbnail needs no more
+    img.draft("RGB", (THUMBNAIL_SIZE * 2, THUMBNAIL_SIZE * 2))
+    pixels = np.asarray(img.convert("RGB").resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BILINEAR))
+    return pixels.reshape(-1, 3)
+
+
+def colour_histogram(source):
+    """
+    Square-rooted, normalised colour histogram of an image
+
+    Args:
+        source (str or file or PIL.Image.Image): Image
+
+    Returns:
+        np.ndarray: BINS float32 values
+    """
+    if isinstance(source, Image.Image):
+        pixels = _thumbnail_pixels(source)
+    else:
+        with Image.open(source) as img:
+            pixels = _thumbnail_pixels(img)
+    foreground = pixels[(pixels < BACKGROUND).any(axis=1)]
+    # Keep the background when it is all there is (a white garment)
+    if len(foreground) >= len(pixels) // 10:
+        pixels = foreground
+    levels = pixels.astype(np.int32) * LEVELS // 256
+    counts = np.bincount((levels[:, 0] * LEVELS + levels[:, 1]) * LEVELS + levels[:, 2], minlength=BINS)
+    return np.sqrt(counts / counts.sum()).astype(np.float32)
+
+
+class ColourIndex:
+    """Nearest colour histograms among the searched catalogue rows"""
+
+    def __init__(self, histograms, rows=None):
+        histograms = np.asarray(histograms, dtype=np.float32)
+        self.rows = np.arange(len(histograms)) if rows is None else np.asarray(rows)
+        self.histograms = histograms[self.rows]
+        self.squared_norms = np.einsum("ij,ij->i", self.histograms, self.histograms)
+
+    def search(self, histogram, k=5, candidates=None):
+        """
+        Catalogue items with the nearest colour histograms
+
+        Args:
+            histogram (np.ndarray): Query histogram from colour_histogram
+            k (int, optional): Results. Defaults to 5.
+            candidates (np.ndarray, optional): Positions in self.rows to search
+                (e.g. the items of one category). Defaults to all.
+
+        Returns:
+            tuple: (catalogue rows, Hellinger distances), nearest first
+        """
+        positions = np.arange(len(self.rows)) if candidates is None else np.asarray(candidates)
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        squared = self.squared_norms[positions] + histogram @ histogram - 2 * (self.histograms[positions] @ histogram)
+        k = min(k, len(positions))
+        top = np.argpartition(squared, k - 1)[:k]
+        top = top[np.argsort(squared[top], kind="stable")]
+        return self.rows[positions[top]], np.sqrt(np.maximum(squared[top], 0))
+
+
+def load_colour_index(n_items, rows=None, path=COLOUR_INDEX_PATH):
+    """
+    Load the histograms written by this script
+
+    Args:
+        n_items (int): Number of catalogue items they must cover
+        rows (np.ndarray, optional): Catalogue rows the app searches. Defaults to all.
+        path (str, optional): Index pickle. Defaults to COLOUR_INDEX_PATH.
+
+    Returns:
+        ColourIndex: The index, or None when the file is missing or was built
+            for a different catalogue
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        data = pkl.load(open(path, "rb"))
+    except Exception as e:
+        print(f"Warning: Could not load {path}: {e}")
+        return None
+    if len(data["histograms"]) != n_items:
+        print(f"Warning: {path} covers {len(data['histograms'])} items, the catalogue has {n_items}; "
+              f"re-run colour_index.py")
+        return None
+    return ColourIndex(data["histograms"], rows)
+
+
+def histogram_files(filenames):
+    """Histograms of image files (zeros for files that can't be read)"""
+    histograms = np.zeros((len(filenames), BINS), dtype=np.float16)
+    for row, filename in enumerate(filenames):
+        try:
+            histograms[row] = colour_histogram(filename)
+        except Exception as e:
+            print(f"Error reading {filename}: {e}")
+        if row and row % 5000 == 0:
+            print(f"  {row}/{len(filenames)} histograms")
+    return histograms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the colour-histogram index of the catalogue images")
+    parser.add_argument("--backbone", help="Use this backbone's feature store (default: $BACKBONE or resnet50)")
+    parser.add_argument("--filenames", help="Defaults to filenames.pkl in the feature store")
+    parser.add_argument("--output", help=f"Defaults to {COLOUR_INDEX_PATH} in the feature store")
+    args = parser.parse_args()
+    backbone = get_backbone(args.backbone)
+    args.filenames = args.filenames or backbone.path("filenames.pkl")
+    args.output = args.output or backbone.path(COLOUR_INDEX_PATH)
+
+    filenames = pkl.load(open(args.filenames, "rb"))
+    began = time.perf_counter()
+    histograms = histogram_files(filenames)
+    print(f"Computed {len(histograms)} colour histograms in {time.perf_counter() - began:.1f}s")
+
+    with open(args.output, "wb") as f:
+        pkl.dump({"histograms": histograms}, f)
+    print(f"Index written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Contact sheets: one composed image for a grid of catalogue items
+
+A recommendation grid is served as a single JPEG/WebP request instead of
+one request per item. The layout is deterministic (fixed cells in row-major
+order), so tile coordinates can be returned without rendering the sheet.
+Rendered sheets are cached on disk by a hash of the source images (path,
+size and mtime) and parameters.
+"""
+import hashlib
+import io
+import os
+import re
+from urllib.parse import urlencode
+
+from PIL import Image, ImageOps
+
+from image_variants import FORMATS, VariantCache, VariantError, draft_oriented, parse_variant_args
+
+CONTACT_SHEET_CACHE_DIR = os.getenv('CONTACT_SHEET_CACHE_DIR', os.path.join('cache', 'sheets'))
+CONTACT_SHEET_CACHE_MAX_BYTES = int(os.getenv('CONTACT_SHEET_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+MAX_TILES = 24
+DEFAULT_WIDTH = 200
+DEFAULT_COLUMNS = 5
+BACKGROUND = (255, 255, 255)
+
+# Catalogue photos are 3:4 portrait shots
+TILE_ASPECT = 4 / 3
+
+_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+# Catalogue image extensions; ".jpg" is implied by a bare id, the others are kept in it
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def sheet_id(filename):
+    """Contact sheet id of a catalogue filename: "10000.jpg" -> "10000", "60001.png" -> "60001.png" """
+    stem, extension = os.path.splitext(os.path.basename(filename))
+    return stem if extension == ".jpg" else os.path.basename(filename)
+
+
+def catalogue_filename(item):
+    """Catalogue filename of a contact sheet id"""
+    return item if os.path.splitext(item)[1] else f"{item}.jpg"
+
+
+def parse_sheet_args(args):
+    """
+    Validate contact sheet query parameters (ids, w, fmt, cols)
+
+    Args:
+        args (dict): Request query parameters
+
+    Returns:
+        tuple: (list of catalogue ids, tile width, format name, columns)
+
+    Raises:
+        VariantError: If any parameter is invalid
+    """
+    ids = [item.strip() for item in args.get('ids', '').split(',') if item.strip()]
+    if not ids:
+        raise VariantError("No catalogue ids given")
+    if len(ids) > MAX_TILES:
+        raise VariantError(f"At most {MAX_TILES} ids per contact sheet")
+    for item in ids:
+        stem, extension = os.path.splitext(item)
+        if not _ID_PATTERN.match(stem) or (extension and extension.lower() not in IMAGE_EXTENSIONS):
+            raise VariantError(f"Invalid catalogue id: {item}")
+    ids = [sheet_id(item) for item in ids]
+
+    width, fmt = parse_variant_args({key: args[key] for key in ('w', 'fmt') if key in args})
+
+    try:
+        columns = int(args.get('cols', DEFAULT_COLUMNS))
+    except ValueError:
+        raise VariantError("Invalid column count")
+    if not 1 <= columns <= MAX_TILES:
+        raise VariantError(f"Column count must be between 1 and {MAX_TILES}")
+
+    return ids, width or DEFAULT_WIDTH, fmt or "jpeg", columns
+
+
+def layout(ids, width=DEFAULT_WIDTH, columns=DEFAULT_COLUMNS):
+    """
+    Tile coordinates of a contact sheet
+
+    Args:
+        ids (list): Catalogue ids in display order ("10000" for 10000.jpg, "60001.png" for other extensions)
+        width (int, optional): Tile width in pixels. Defaults to DEFAULT_WIDTH.
+        columns (int, optional): Tiles per row. Defaults to DEFAULT_COLUMNS.
+
+    Returns:
+        dict: Sheet width/height and one {id, filename, x, y, w, h} entry per tile
+    """
+    height = round(width * TILE_ASPECT)
+    columns = min(columns, len(ids))
+    rows = (len(ids) + columns - 1) // columns
+    tiles = [{
+        "id": os.path.splitext(item)[0],
+        "filename": catalogue_filename(item),
+        "x": (i % columns) * width,
+        "y": (i // columns) * height,
+        "w": width,
+        "h": height,
+    } for i, item in enumerate(ids)]
+    return {"width": columns * width, "height": rows * height, "tiles": tiles}
+
+
+def sheet_url(ids, width=DEFAULT_WIDTH, fmt="webp", columns=DEFAULT_COLUMNS):
+    """URL of the contact sheet image for a list of catalogue ids"""
+    return "/contact-sheet?" + urlencode({"ids": ",".join(ids), "w": width, "fmt": fmt, "cols": columns})
+
+
+def describe(filenames, width=DEFAULT_WIDTH, fmt="webp", columns=DEFAULT_COLUMNS):
+    """
+    Contact sheet URL plus tile coordinates for a recommendation list
+
+    Args:
+        filenames (list): Catalogue filenames (e.g. "10000.jpg") in display order
+        width (int, optional): Tile width. Defaults to DEFAULT_WIDTH.
+        fmt (str, optional): Sheet format. Defaults to "webp".
+        columns (int, optional): Tiles per row. Defaults to DEFAULT_COLUMNS.
+
+    Returns:
+        dict: Layout with an added "url" key, or None for an empty list
+    """
+    ids = [sheet_id(name) for name in filenames][:MAX_TILES]
+    if not ids:
+        return None
+    sheet = layout(ids, width, columns)
+    sheet["url"] = sheet_url(ids, width, fmt, columns)
+    return sheet
+
+
+def render_sheet(paths, width, fmt, columns):
+    """
+    Compose the tiles into one encoded image
+
+    Args:
+        paths (list): Source image paths in display order
+        width (int): Tile width
+        fmt (str): Output format name from image_variants.FORMATS
+        columns (int): Tiles per row
+
+    Returns:
+        bytes: Encoded sheet
+    """
+    sheet_layout = layout(paths, width, columns)
+    sheet = Image.new("RGB", (sheet_layout["width"], sheet_layout["height"]), BACKGROUND)
+
+    for path, tile in zip(paths, sheet_layout["tiles"]):
+        with Image.open(path) as img:
+            draft_oriented(img, tile["w"], tile["h"])
+            img = ImageOps.exif_transpose(img).convert("RGB")
+            img.thumbnail((tile["w"], tile["h"]), Image.LANCZOS)
+            offset = (tile["x"] + (tile["w"] - img.width) // 2, tile["y"] + (tile["h"] - img.height) // 2)
+            sheet.paste(img, offset)
+
+    pil_format, _, _, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    sheet.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+class ContactSheetCache(VariantCache):
+    """Bounded on-disk cache of rendered contact sheets, keyed by id list"""
+
+    def __init__(self, image_dir="images", cache_dir=CONTACT_SHEET_CACHE_DIR,
+                 max_bytes=CONTACT_SHEET_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+        self.image_dir = image_dir
+
+    def sheet_key(self, paths, width, fmt, columns):
+        """Hash of the ordered source images, their size and mtime, and the rendering parameters (also the ETag)"""
+        sources = []
+        for path in paths:
+            stat = os.stat(path)
+            sources.append(f"{path}:{stat.st_size}:{stat.st_mtime_ns}")
+        identity = f"{','.join(sources)}|{width}|{fmt}|{columns}"
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def get_sheet(self, ids, width=DEFAULT_WIDTH, fmt="jpeg", columns=DEFAULT_COLUMNS):
+        """
+        Return the cached sheet, rendering it on a miss
+
+        Args:
+            ids (list): Catalogue ids in display order
+            width (int, optional): Tile width. Defaults to DEFAULT_WIDTH.
+            fmt (str, optional): Format name. Defaults to "jpeg".
+            columns (int, optional): Tiles per row. Defaults to DEFAULT_COLUMNS.
+
+        Returns:
+            tuple: (sheet path, etag, mimetype)
+
+        Raises:
+            FileNotFoundError: If a catalogue id has no image
+        """
+        _, mimetype, extension, _ = FORMATS[fmt]
+        paths = []
+        for item in ids:
+            source = os.path.join(self.image_dir, catalogue_filename(item))
+            if not os.path.isfile(source):
+                raise FileNotFoundError(f"Unknown catalogue id: {item}")
+            paths.append(source)
+
+        # A replaced catalogue image changes the key, so the sheet is rendered again
+        key = self.sheet_key(paths, width, fmt, columns)
+        path = os.path.join(self.cache_dir, key[:2], key + extension)
+
+        try:
+            os.utime(path)
+            return path, key, mimetype
+        except FileNotFoundError:
+            pass
+
+        self._store(path, render_sheet(paths, width, fmt, columns))
+        return path, key, mimetype
+
+
+contact_sheet_cache = ContactSheetCache()
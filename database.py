@@ -1,6 +1,23 @@
+"""
+MongoDB access with a managed, per-process connection pool
+
+The client is created lazily on first use in each process, so gunicorn
+workers never share a MongoClient (or its sockets) inherited from the
+master across fork(). Pool size and timeouts come from the environment and
+pool activity is recorded by PoolMetrics for sizing pools against worker
+threads. Indexes are created by `python migrate.py`, not on every start.
+
+When MongoDB cannot be reached the module falls back to in-memory
+collections seeded with test users, so the app still runs for development.
+"""
+import copy
 import os
+import threading
 import time
-from pymongo import MongoClient
+import uuid
+from collections import deque
+
+from pymongo import MongoClient, monitoring
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 from dotenv import load_dotenv
 
@@ -11,398 +28,521 @@ load_dotenv()
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
 DB_NAME = os.getenv('DB_NAME', 'fashion_recommendation')
 
-print(f"Connecting to MongoDB database: {DB_NAME}")
-print(f"Using connection URI: {MONGO_URI.split('@')[0].split('://')[0]}://*****@{MONGO_URI.split('@')[1] if '@' in MONGO_URI else 'localhost'}")
-
-try:
-    # Create MongoDB client with a reasonable timeout
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    
-    # Test connection
-    client.admin.command('ping')
-    print(f"Successfully connected to MongoDB Atlas!")
-    
-    # Get database
-    db = client[DB_NAME]
-    
-    # Define collections
-    users_collection = db['users']
-    uploaded_images_collection = db['uploaded_images']
-    
-    # Create indexes for better query performance
-    users_collection.create_index("username", unique=True)
-    uploaded_images_collection.create_index("user_id")
-    
-except (ConnectionFailure, ServerSelectionTimeoutError) as e:
-    print(f"Error connecting to MongoDB: {e}")
-    print("This could be due to network issues, incorrect URI, or firewall settings.")
-    print("Make sure you have installed pymongo[srv] for Atlas connections:")
-    print("    python -m pip install \"pymongo[srv]\"")
-    
-    # Provide fallback for testing
-    print("Using memory-based storage instead of MongoDB")
-    
-    # Define in-memory collections for testing (if MongoDB is not available)
-    class MemoryCollection:
-        def __init__(self):
-            self.data = []
-            self.indexes = {}
-        
-        def create_index(self, field, unique=False):
-            self.indexes[field] = unique
-            return True
-        
-        def insert_one(self, doc):
-            # Check unique indexes
-            for field, unique in self.indexes.items():
-                if unique and field in doc:
-                    for existing_doc in self.data:
-                        if field in existing_doc and existing_doc[field] == doc[field]:
-                            class DuplicateKeyError(Exception):
-                                pass
-                            raise DuplicateKeyError(f"Duplicate key error: {field}")
-            
-            # Generate simple _id if not present
-            if '_id' not in doc:
-                import uuid
-                doc['_id'] = str(uuid.uuid4())
-            
-            # Make a deep copy of the document to store
-            import copy
-            doc_copy = copy.deepcopy(doc)
-            
-            # Special handling for password field (it could be bytes)
-            if 'password' in doc_copy and isinstance(doc_copy['password'], bytes):
-                # Store the bytes as a string for easier in-memory handling
-                # This is only for the in-memory store, real MongoDB handles bytes correctly
-                print("MemoryCollection: Converting password bytes to string for storage")
-                doc_copy['password'] = doc_copy['password'].decode('utf-8', errors='replace')
-            
-            # Add document to collection
-            self.data.append(doc_copy)
-            
-            # Return simple result object
-            class InsertOneResult:
-                def __init__(self, id):
-                    self.inserted_id = id
-            
-            return InsertOneResult(doc['_id'])
-        
-        def find_one(self, query):
-            for doc in self.data:
-                match = True
-                for k, v in query.items():
-                    if k not in doc:
-                        match = False
-                        break
-                        
-                    # Special handling for ObjectId
-                    if k == '_id' and isinstance(v, str) and isinstance(doc[k], str):
-                        if str(v) != str(doc[k]):
-                            match = False
-                            break
-                    # Special handling for bytes fields (like password)
-                    elif isinstance(v, bytes) and isinstance(doc[k], str):
-                        # Skip this comparison and leave it to the application code
-                        continue
-                    elif v != doc[k]:
+# Connection pool, per process. Requests hold a connection only for the
+# duration of one operation, so maxPoolSize around the number of threads
+# per worker is enough; check pool_metrics wait times before raising it.
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '20'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '300000'))
+# How long a request waits for a free pooled connection before failing
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '20000'))
+
+# Recent checkout wait times kept for percentiles
+WAIT_SAMPLES = 1024
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection pool counters and checkout wait times for this process
+
+    PyMongo publishes pool events synchronously on the thread doing the
+    checkout, so the wait is measured between the "started" and "checked
+    out" events of the same thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.checkouts = 0
+            self.checkout_failures = {}
+            self.in_use = 0
+            self.max_in_use = 0
+            self.waiting = 0
+            self.max_waiting = 0
+            self.total_wait = 0.0
+            self.waits = deque(maxlen=WAIT_SAMPLES)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def _finish_wait(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        wait = time.perf_counter() - started if started is not None else 0.0
+        self.waiting = max(0, self.waiting - 1)
+        return wait
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            wait = self._finish_wait()
+            self.checkouts += 1
+            self.total_wait += wait
+            self.waits.append(wait)
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._finish_wait()
+            reason = str(event.reason)
+            self.checkout_failures[reason] = self.checkout_failures.get(reason, 0) + 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def snapshot(self):
+        """
+        Current pool statistics
+
+        Returns:
+            dict: Counters, configured limits and checkout wait percentiles (ms)
+        """
+        with self._lock:
+            waits = sorted(self.waits)
+            stats = {
+                "pid": os.getpid(),
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "min_pool_size": MONGO_MIN_POOL_SIZE,
+                "connections_open": self.connections_created - self.connections_closed,
+                "connections_created": self.connections_created,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "mean_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            }
+
+        def pick(fraction):
+            return round(waits[min(len(waits) - 1, int(fraction * len(waits)))] * 1000, 3) if waits else 0.0
+
+        stats["wait_ms"] = {"p50": pick(0.50), "p99": pick(0.99), "max": pick(1.0)}
+        return stats
+
+
+pool_metrics = PoolMetrics()
+
+
+def client_options():
+    """MongoClient keyword arguments for the configured pool and timeouts"""
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "event_listeners": [pool_metrics],
+    }
+
+
+# In-memory fallback (if MongoDB is not available)
+class DuplicateKeyError(Exception):
+    pass
+
+
+class InsertOneResult:
+    def __init__(self, id):
+        self.inserted_id = id
+
+
+class UpdateResult:
+    def __init__(self, matched, modified):
+        self.matched_count = matched
+        self.modified_count = modified
+
+
+class DeleteResult:
+    def __init__(self, deleted):
+        self.deleted_count = deleted
+
+
+def project(doc, projection):
+    """Apply a pymongo-style inclusion or exclusion projection to a document"""
+    if any(projection.values()):
+        fields = {field for field, include in projection.items() if include}
+        if projection.get("_id", 1):
+            fields.add("_id")
+        return {k: v for k, v in doc.items() if k in fields}
+    return {k: v for k, v in doc.items() if k not in projection}
+
+
+# Comparison operators of the in-memory query matcher
+OPERATORS = {
+    "$lt": lambda value, bound: value < bound,
+    "$lte": lambda value, bound: value <= bound,
+    "$gt": lambda value, bound: value > bound,
+    "$gte": lambda value, bound: value >= bound,
+    "$ne": lambda value, bound: value != bound,
+}
+
+
+def matches(doc, query):
+    """Whether a document matches a query of field equalities, comparison operators and $or"""
+    for k, v in query.items():
+        if k == "$or":
+            if not any(matches(doc, clause) for clause in v):
+                return False
+        elif isinstance(v, dict) and v and all(op in OPERATORS for op in v):
+            if k not in doc or not all(OPERATORS[op](doc[k], bound) for op, bound in v.items()):
+                return False
+        elif k not in doc or doc[k] != v:
+            return False
+    return True
+
+
+class MemoryCollection:
+    def __init__(self):
+        self.data = []
+        self.indexes = {}
+
+    def create_index(self, field, unique=False, **kwargs):
+        # Accepts a field name or pymongo-style [(field, direction)] keys;
+        # only single-field unique indexes are enforced
+        if not isinstance(field, str):
+            if len(field) != 1:
+                return True
+            field = field[0][0]
+        self.indexes[field] = unique
+        return True
+
+    def insert_one(self, doc):
+        # Check unique indexes
+        for field, unique in self.indexes.items():
+            if unique and field in doc:
+                for existing_doc in self.data:
+                    if field in existing_doc and existing_doc[field] == doc[field]:
+                        raise DuplicateKeyError(f"Duplicate key error: {field}")
+
+        # Generate simple _id if not present
+        if '_id' not in doc:
+            doc['_id'] = str(uuid.uuid4())
+
+        # Make a deep copy of the document to store
+        doc_copy = copy.deepcopy(doc)
+
+        # Special handling for password field (it could be bytes)
+        if 'password' in doc_copy and isinstance(doc_copy['password'], bytes):
+            # Store the bytes as a string for easier in-memory handling
+            # This is only for the in-memory store, real MongoDB handles bytes correctly
+            print("MemoryCollection: Converting password bytes to string for storage")
+            doc_copy['password'] = doc_copy['password'].decode('utf-8', errors='replace')
+
+        # Add document to collection
+        self.data.append(doc_copy)
+
+        return InsertOneResult(doc['_id'])
+
+    def find_one(self, query):
+        for doc in self.data:
+            match = True
+            for k, v in query.items():
+                if k not in doc:
+                    match = False
+                    break
+
+                # Special handling for ObjectId
+                if k == '_id' and isinstance(v, str) and isinstance(doc[k], str):
+                    if str(v) != str(doc[k]):
                         match = False
                         break
-                        
-                if match:
-                    # Return a copy to prevent mutation
-                    import copy
-                    return copy.deepcopy(doc)
-            return None
-        
-        def find(self, query=None):
-            if query is None:
-                query = {}
-            
-            class Cursor:
-                def __init__(self, data, query):
-                    self.data = data
-                    self.query = query
-                    self.sort_field = None
-                    self.sort_dir = 1
-                    self.skip_count = 0
-                    self.limit_count = None
-                
-                def sort(self, field, direction):
-                    if isinstance(field, str):
-                        self.sort_field = field
-                    else:
-                        self.sort_field = field[0]
-                    self.sort_dir = direction
-                    return self
-                
-                def skip(self, count):
-                    self.skip_count = count
-                    return self
-                
-                def limit(self, count):
-                    self.limit_count = count
-                    return self
-                
-                def __iter__(self):
-                    results = []
-                    for doc in self.data:
-                        match = True
-                        for k, v in self.query.items():
-                            if k not in doc or doc[k] != v:
-                                match = False
-                                break
-                        if match:
-                            # Add a copy to prevent mutation
-                            import copy
-                            results.append(copy.deepcopy(doc))
-                    
-                    if self.sort_field:
-                        results.sort(
-                            key=lambda x: x.get(self.sort_field, ""),
-                            reverse=self.sort_dir == -1
-                        )
-                    
-                    results = results[self.skip_count:]
-                    
-                    if self.limit_count:
-                        results = results[:self.limit_count]
-                    
-                    return iter(results)
-            
-            return Cursor(self.data, query)
-        
-        def update_one(self, query, update):
-            doc = self.find_one(query)
-            if doc:
-                # Find the actual document in the array (not the copy)
-                for i, d in enumerate(self.data):
-                    match = True
-                    for k, v in query.items():
-                        if k not in d or d[k] != v:
-                            match = False
-                            break
-                    if match:
-                        # Found the document to update
-                        if "$set" in update:
-                            for k, v in update["$set"].items():
-                                # Special handling for password field
-                                if k == 'password' and isinstance(v, bytes):
-                                    self.data[i][k] = v.decode('utf-8', errors='replace')
-                                else:
-                                    self.data[i][k] = v
-                
-                # Return simple result object
-                class UpdateResult:
-                    def __init__(self, matched, modified):
-                        self.matched_count = matched
-                        self.modified_count = modified
-                
-                return UpdateResult(1, 1)
-            
-            return UpdateResult(0, 0)
-        
-        def delete_one(self, query):
-            for i, doc in enumerate(self.data):
+                # Special handling for bytes fields (like password)
+                elif isinstance(v, bytes) and isinstance(doc[k], str):
+                    # Skip this comparison and leave it to the application code
+                    continue
+                elif v != doc[k]:
+                    match = False
+                    break
+
+            if match:
+                # Return a copy to prevent mutation
+                return copy.deepcopy(doc)
+        return None
+
+    def find(self, query=None, projection=None):
+        if query is None:
+            query = {}
+
+        class Cursor:
+            def __init__(self, data, query, projection):
+                self.data = data
+                self.query = query
+                self.projection = projection
+                self.sort_keys = []
+                self.skip_count = 0
+                self.limit_count = None
+
+            def sort(self, field, direction=1):
+                # A field name and direction, or pymongo-style [(field, direction), ...] keys
+                if isinstance(field, str):
+                    self.sort_keys = [(field, direction)]
+                else:
+                    self.sort_keys = list(field)
+                return self
+
+            def skip(self, count):
+                self.skip_count = count
+                return self
+
+            def limit(self, count):
+                self.limit_count = count
+                return self
+
+            def __iter__(self):
+                # Add copies to prevent mutation
+                results = [copy.deepcopy(doc) for doc in self.data if matches(doc, self.query)]
+
+                # Stable sorts from the last key to the first give the compound order
+                for field, direction in reversed(self.sort_keys):
+                    results.sort(key=lambda x: x.get(field, ""), reverse=direction == -1)
+
+                results = results[self.skip_count:]
+
+                if self.limit_count:
+                    results = results[:self.limit_count]
+
+                if self.projection:
+                    results = [project(doc, self.projection) for doc in results]
+
+                return iter(results)
+
+        return Cursor(self.data, query, projection)
+
+    def update_one(self, query, update):
+        doc = self.find_one(query)
+        if doc:
+            # Find the actual document in the array (not the copy)
+            for i, d in enumerate(self.data):
                 match = True
                 for k, v in query.items():
-                    if k not in doc or doc[k] != v:
+                    if k not in d or d[k] != v:
                         match = False
                         break
                 if match:
-                    del self.data[i]
-                    
-                    # Return simple result object
-                    class DeleteResult:
-                        def __init__(self, deleted):
-                            self.deleted_count = deleted
-                    
-                    return DeleteResult(1)
-            
-            return DeleteResult(0)
-    
-    # Create in-memory collections
-    users_collection = MemoryCollection()
-    uploaded_images_collection = MemoryCollection()
-    
-    # Create in-memory db wrapper
-    class MemoryDB:
-        def __init__(self):
-            self.users = users_collection
-            self.uploaded_images = uploaded_images_collection
-        
-        def __getitem__(self, name):
-            if name == 'users':
-                return self.users
-            elif name == 'uploaded_images':
-                return self.uploaded_images
-            return MemoryCollection()
-    
-    db = MemoryDB()
-    
-    # Create test user for in-memory database
+                    # Found the document to update
+                    if "$set" in update:
+                        for k, v in update["$set"].items():
+                            # Special handling for password field
+                            if k == 'password' and isinstance(v, bytes):
+                                self.data[i][k] = v.decode('utf-8', errors='replace')
+                            else:
+                                self.data[i][k] = v
+
+            return UpdateResult(1, 1)
+
+        return UpdateResult(0, 0)
+
+    def delete_one(self, query):
+        for i, doc in enumerate(self.data):
+            match = True
+            for k, v in query.items():
+                if k not in doc or doc[k] != v:
+                    match = False
+                    break
+            if match:
+                del self.data[i]
+                return DeleteResult(1)
+
+        return DeleteResult(0)
+
+
+class MemoryDB:
+    """In-memory database; each collection is created once and reused by name"""
+
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection()
+        return self.collections[name]
+
+
+def _seed_memory_users(users):
+    """Create the test and guest users of the in-memory database"""
     try:
         import bcrypt
         test_password = bcrypt.hashpw("password123".encode('utf-8'), bcrypt.gensalt())
-        test_user = {
-            "_id": "test123",
-            "username": "test_user",
-            "password": test_password,
-            "email": "test@example.com",
-            "created_at": time.time(),
-            "last_login": None
-        }
-        users_collection.insert_one(test_user)
-        print("Created test user in memory database: username=test_user, password=password123")
-        
-        # Also create guest account
         guest_password = bcrypt.hashpw("style123".encode('utf-8'), bcrypt.gensalt())
-        guest_user = {
-            "_id": "guest123",
-            "username": "guest",
-            "password": guest_password,
-            "email": "guest@example.com",
-            "name": "Guest User",
-            "created_at": time.time(),
-            "last_login": None
-        }
-        users_collection.insert_one(guest_user)
-        print("Created guest user in memory database: username=guest, password=style123")
     except Exception as e:
-        print(f"Could not create test users in memory database: {e}")
-        # Create simpler test users with plaintext passwords as fallback
-        users_collection.insert_one({
-            "_id": "test123",
-            "username": "test_user",
-            "password": "password123",  # Plaintext as fallback
-            "email": "test@example.com",
-            "created_at": time.time(),
-            "last_login": None
-        })
-        users_collection.insert_one({
-            "_id": "guest123",
-            "username": "guest",
-            "password": "style123",  # Plaintext as fallback
-            "email": "guest@example.com",
-            "name": "Guest User",
-            "created_at": time.time(),
-            "last_login": None
-        })
-        print("Created test users with plaintext passwords in memory database")
-    
-except Exception as e:
-    print(f"Unexpected error connecting to MongoDB: {e}")
-    print("Falling back to in-memory database")
-    
-    # Create fallback in-memory database
-    class MemoryCollection:
-        def __init__(self):
-            self.data = []
-        
-        def create_index(self, *args, **kwargs):
-            return True
-        
-        def insert_one(self, doc):
-            import uuid
-            doc['_id'] = str(uuid.uuid4())
-            
-            # Special handling for password field
-            if 'password' in doc and isinstance(doc['password'], bytes):
-                # Store the bytes as a string for easier in-memory handling
-                doc['password'] = doc['password'].decode('utf-8', errors='replace')
-            
-            self.data.append(doc)
-            
-            class InsertOneResult:
-                def __init__(self, id):
-                    self.inserted_id = id
-            
-            return InsertOneResult(doc['_id'])
-        
-        def find_one(self, query):
-            for doc in self.data:
-                match = True
-                for k, v in query.items():
-                    if k not in doc:
-                        match = False
-                        break
-                    
-                    # Special handling for ObjectId
-                    if k == '_id' and isinstance(v, str) and isinstance(doc[k], str):
-                        if str(v) != str(doc[k]):
-                            match = False
-                            break
-                    elif v != doc[k]:
-                        match = False
-                        break
-                        
-                if match:
-                    return doc
-            return None
-    
-    users_collection = MemoryCollection()
-    uploaded_images_collection = MemoryCollection()
-    
-    class MemoryDB:
-        def __init__(self):
-            pass
-        
-        def __getitem__(self, name):
-            if name == 'users':
-                return users_collection
-            elif name == 'uploaded_images':
-                return uploaded_images_collection
-            return MemoryCollection()
-    
-    db = MemoryDB()
-    
-    # Create test users
+        print(f"Could not hash test user passwords: {e}")
+        # Plaintext fallback, handled by auth.verify_password
+        test_password, guest_password = "password123", "style123"
+
+    users.insert_one({
+        "_id": "test123",
+        "username": "test_user",
+        "password": test_password,
+        "email": "test@example.com",
+        "created_at": time.time(),
+        "last_login": None
+    })
+    print("Created test user in memory database: username=test_user, password=password123")
+
+    users.insert_one({
+        "_id": "guest123",
+        "username": "guest",
+        "password": guest_password,
+        "email": "guest@example.com",
+        "name": "Guest User",
+        "created_at": time.time(),
+        "last_login": None
+    })
+    print("Created guest user in memory database: username=guest, password=style123")
+
+
+_lock = threading.Lock()
+_pid = None
+_client = None
+_db = None
+_memory_db = None
+
+
+def _connect():
+    """Connect this process: a pooled MongoClient, or the in-memory fallback"""
+    global _client, _db, _memory_db
+
+    print(f"Connecting to MongoDB database: {DB_NAME} (pid {os.getpid()})")
+    print(f"Using connection URI: {MONGO_URI.split('@')[0].split('://')[0]}://*****@{MONGO_URI.split('@')[1] if '@' in MONGO_URI else 'localhost'}")
+
+    client = None
     try:
-        import bcrypt
-        test_password = bcrypt.hashpw("password123".encode('utf-8'), bcrypt.gensalt())
-        users_collection.insert_one({
-            "username": "test_user",
-            "password": test_password,
-            "email": "test@example.com",
-            "created_at": time.time(),
-            "last_login": None
-        })
-        
-        guest_password = bcrypt.hashpw("style123".encode('utf-8'), bcrypt.gensalt())
-        users_collection.insert_one({
-            "username": "guest",
-            "password": guest_password,
-            "email": "guest@example.com",
-            "name": "Guest User",
-            "created_at": time.time(),
-            "last_login": None
-        })
-        print("Created test users in fallback memory database")
+        client = MongoClient(MONGO_URI, **client_options())
+
+        # Test connection
+        client.admin.command('ping')
+        print(f"Successfully connected to MongoDB Atlas! (pool size {MONGO_MIN_POOL_SIZE}-{MONGO_MAX_POOL_SIZE})")
+
+        _client, _db = client, client[DB_NAME]
+        return
+    except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+        print(f"Error connecting to MongoDB: {e}")
+        print("This could be due to network issues, incorrect URI, or firewall settings.")
+        print("Make sure you have installed pymongo[srv] for Atlas connections:")
+        print("    python -m pip install \"pymongo[srv]\"")
     except Exception as e:
-        print(f"Could not create hashed test users: {e}")
-        # Fallback to plaintext
-        users_collection.insert_one({
-            "username": "test_user",
-            "password": "password123",
-            "email": "test@example.com",
-            "created_at": time.time(),
-            "last_login": None
-        })
-        users_collection.insert_one({
-            "username": "guest",
-            "password": "style123",
-            "email": "guest@example.com", 
-            "name": "Guest User",
-            "created_at": time.time(),
-            "last_login": None
-        })
-        print("Created plaintext test users in fallback memory database")
+        print(f"Unexpected error connecting to MongoDB: {e}")
+
+    print("Using memory-based storage instead of MongoDB")
+    if client is not None:
+        client.close()
+    if _memory_db is None:
+        # Imported here: migrate.py itself imports this module
+        from migrate import migrate
+        _memory_db = MemoryDB()
+        # Same indexes as a migrated MongoDB, so usernames stay unique
+        migrate(_memory_db)
+        _seed_memory_users(_memory_db['users'])
+    _client, _db = None, _memory_db
+
 
 def get_db():
     """
     Get the database connection
-    
+
+    Connects on first use in each process, so a client is never reused
+    across fork().
+
     Returns:
-        MongoDB database connection
+        MongoDB database connection (or the in-memory MemoryDB fallback)
     """
-    return db 
\ No newline at end of file
+    global _pid
+    if _pid != os.getpid():
+        with _lock:
+            if _pid != os.getpid():
+                _connect()
+                _pid = os.getpid()
+    return _db
+
+
+def get_client():
+    """MongoClient of this process, or None when using the in-memory fallback"""
+    get_db()
+    return _client
+
+
+def using_memory_db():
+    """True when MongoDB was unreachable and the in-memory collections are used"""
+    return get_client() is None
+
+
+def close():
+    """Close this process' client (e.g. on worker shutdown); the next use reconnects"""
+    global _pid, _client
+    with _lock:
+        if _client is not None and _pid == os.getpid():
+            _client.close()
+        _client = None
+        _pid = None
+
+
+class CollectionProxy:
+    """
+    Module-level collection handle that resolves to the current process' client
+
+    Lets other modules keep `from database import users_collection` while
+    the client itself is only created after fork.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
+
+    def __repr__(self):
+        return f"CollectionProxy({self.name!r})"
+
+
+class DatabaseProxy:
+    """Module-level database handle, resolved like CollectionProxy"""
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+    def __getattr__(self, attr):
+        return getattr(get_db(), attr)
+
+
+db = DatabaseProxy()
+users_collection = CollectionProxy('users')
+uploaded_images_collection = CollectionProxy('uploaded_images')
+user_profiles_collection = CollectionProxy('user_profiles')
@@ -0,0 +1,136 @@
+"""
+Offline near-duplicate clustering of the catalogue.
+
+The images/ directory contains near-identical product shots, which made
+kneighbors return the same item several times. This pass links every pair
+of items whose cosine similarity reaches a threshold (blocked matrix
+products over the upper triangle of the similarity matrix), takes the
+connected components as clusters, and picks one representative per
+cluster. app.py searches representatives only, so each cluster can fill
+at most one result slot.
+
+Usage:
+    python dedup.py
+    python dedup.py --threshold 0.95 --block-size 512
+"""
+import argparse
+import os
+import pickle as pkl
+import time
+
+import numpy as np
+
+from backbones import add_store_arguments, resolve_store_arguments
+
+CLUSTERS_PATH = "clusters.pkl"
+# Cosine similarity at or above which two items count as the same product
+DEDUP_THRESHOLD = 0.97
+# The same threshold as a Euclidean distance between unit vectors: a query this
+# close to a catalogue item is that item, not a recommendation
+SELF_MATCH_DISTANCE = float(np.sqrt(2 * (1 - DEDUP_THRESHOLD)))
+
+
+def find_clusters(features, threshold=DEDUP_THRESHOLD, block_size=1024):
+    """
+    Cluster items connected by near-duplicate links
+
+    Args:
+        features (np.ndarray): Catalogue matrix (n_items x dim)
+        threshold (float, optional): Cosine similarity of a link. Defaults to DEDUP_THRESHOLD.
+        block_size (int, optional): Rows and columns per similarity block. Defaults to 1024.
+
+    Returns:
+        tuple: (cluster id of each item, representative item of each cluster)
+    """
+    features = np.asarray(features, dtype=np.float32)
+    if len(features) == 0:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    features = features / np.maximum(np.linalg.norm(features, axis=1, keepdims=True), 1e-12)
+    parent = np.arange(len(features))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for row in range(0, len(features), block_size):
+        rows = features[row:row + block_size]
+        # Blocks left of the diagonal were covered when their rows came up
+        for col in range(row, len(features), block_size):
+            similar = np.nonzero(rows @ features[col:col + block_size].T >= threshold)
+            for i, j in zip(similar[0] + row, similar[1] + col):
+                if i < j:
+                    root_i, root_j = find(i), find(j)
+                    if root_i != root_j:
+                        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    roots = np.array([find(i) for i in range(len(features))])
+    _, cluster_ids = np.unique(roots, return_inverse=True)
+
+    # Representative: the member closest to its cluster's mean
+    centroids = np.zeros((cluster_ids.max() + 1, features.shape[1]), dtype=np.float32)
+    np.add.at(centroids, cluster_ids, features)
+    scores = np.einsum("ij,ij->i", features, centroids[cluster_ids])
+    order = np.lexsort((-scores, cluster_ids))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = cluster_ids[order[1:]] != cluster_ids[order[:-1]]
+    representatives = order[first]
+
+    return cluster_ids.astype(np.int32), representatives.astype(np.int64)
+
+
+def load_clusters(n_items, path=CLUSTERS_PATH):
+    """
+    Load the clustering written by this script
+
+    Args:
+        n_items (int): Number of catalogue items it must cover
+        path (str, optional): Clusters pickle. Defaults to CLUSTERS_PATH.
+
+    Returns:
+        dict: {"threshold", "cluster_ids", "representatives"}, or None when the
+            file is missing or was computed for a different catalogue
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        clusters = pkl.load(open(path, "rb"))
+    except Exception as e:
+        print(f"Warning: Could not load {path}: {e}")
+        return None
+    if len(clusters["cluster_ids"]) != n_items:
+        print(f"Warning: {path} covers {len(clusters['cluster_ids'])} items, the catalogue has {n_items}; "
+              f"re-run dedup.py")
+        return None
+    return clusters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate catalogue images")
+    add_store_arguments(parser)
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD)
+    parser.add_argument("--block-size", type=int, default=1024)
+    parser.add_argument("--output", help=f"Defaults to {CLUSTERS_PATH} in the feature store")
+    args = parser.parse_args()
+    backbone = resolve_store_arguments(args)
+    args.output = args.output or backbone.path(CLUSTERS_PATH)
+
+    from evaluate import load_index
+    features, filenames = load_index(args.features, args.filenames)
+    print(f"Loaded {len(features)} features")
+
+    began = time.perf_counter()
+    cluster_ids, representatives = find_clusters(features, args.threshold, args.block_size)
+    sizes = np.bincount(cluster_ids)
+    print(f"Clustered in {time.perf_counter() - began:.1f}s: {len(representatives)} clusters, "
+          f"{int((sizes > 1).sum())} with duplicates, largest {int(sizes.max())} items")
+
+    with open(args.output, "wb") as f:
+        pkl.dump({"threshold": args.threshold, "cluster_ids": cluster_ids,
+                  "representatives": representatives}, f)
+    print(f"Clusters written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Vectorized evaluation harness for the recommendation index.
+
+Replaces the per-sample loop in accuracy.py: filenames are mapped to
+styles.csv category codes once, and every catalogue item is queried in
+blocked matrix batches instead of one kneighbors call per sample.
+
+Usage:
+    python evaluate.py
+    python evaluate.py --limit 5000 --block-size 512 --output eval.json
+"""
+import argparse
+import json
+import os
+import pickle as pkl
+import time
+
+import numpy as np
+import pandas as pd
+
+from backbones import add_store_arguments, resolve_store_arguments
+
+
+def load_index(features_path="Images_features.pkl", filenames_path="filenames.pkl"):
+    """
+    Load the precomputed feature matrix and filenames
+
+    Args:
+        features_path (str, optional): Path to the features pickle. Defaults to "Images_features.pkl".
+        filenames_path (str, optional): Path to the filenames pickle. Defaults to "filenames.pkl".
+
+    Returns:
+        tuple: (features as a float32 matrix, list of filenames)
+    """
+    features = np.asarray(pkl.load(open(features_path, "rb")), dtype=np.float32)
+    filenames = pkl.load(open(filenames_path, "rb"))
+    return features, filenames
+
+
+def load_category_codes(filenames, styles_path="styles.csv", column="masterCategory"):
+    """
+    Map every filename to an integer category code in a single pass
+
+    Args:
+        filenames (list): Catalogue filenames (e.g. "images/10000.jpg")
+        styles_path (str, optional): Path to styles.csv. Defaults to "styles.csv".
+        column (str, optional): styles.csv column to evaluate against. Defaults to "masterCategory".
+
+    Returns:
+        tuple: (int array of codes with -1 for unknown items, list of category labels)
+    """
+    styles_df = pd.read_csv(styles_path, on_bad_lines="skip", usecols=["id", column])
+    categories = pd.Series(styles_df[column].values, index=styles_df["id"].astype(str))
+    categories = categories[~categories.index.duplicated()]
+
+    stems = pd.Series([os.path.splitext(os.path.basename(f))[0] for f in filenames])
+    labelled = pd.Categorical(stems.map(categories))
+    return np.asarray(labelled.codes, dtype=np.int32), list(labelled.categories)
+
+
+def blocked_neighbors(features, queries, n_neighbors=6, block_size=1024):
+    """
+    Euclidean nearest neighbours for many queries using blocked matrix products
+
+    Produces the same ordering as NearestNeighbors(algorithm="brute",
+    metric="euclidean") but processes `block_size` queries per matmul.
+
+    Args:
+        features (np.ndarray): Catalogue matrix (n_items x dim)
+        queries (np.ndarray): Query matrix (n_queries x dim)
+        n_neighbors (int, optional): Neighbours to return per query. Defaults to 6.
+        block_size (int, optional): Queries per block. Defaults to 1024.
+
+    Returns:
+        tuple: (distances, indices, per-query latency in seconds for every query)
+    """
+    n_neighbors = min(n_neighbors, len(features))
+    item_sq = np.einsum("ij,ij->i", features, features)
+
+    distances = np.empty((len(queries), n_neighbors), dtype=np.float32)
+    indices = np.empty((len(queries), n_neighbors), dtype=np.int64)
+    latencies = np.empty(len(queries), dtype=np.float64)
+
+    for start in range(0, len(queries), block_size):
+        block = queries[start:start + block_size]
+        began = time.perf_counter()
+
+        query_sq = np.einsum("ij,ij->i", block, block)
+        sq_dist = query_sq[:, None] + item_sq[None, :] - 2.0 * (block @ features.T)
+
+        if n_neighbors < sq_dist.shape[1]:
+            top = np.argpartition(sq_dist, n_neighbors - 1, axis=1)[:, :n_neighbors]
+        else:
+            top = np.tile(np.arange(sq_dist.shape[1]), (len(block), 1))
+        top_dist = np.take_along_axis(sq_dist, top, axis=1)
+        order = np.argsort(top_dist, axis=1, kind="stable")
+
+        stop = start + len(block)
+        indices[start:stop] = np.take_along_axis(top, order, axis=1)
+        distances[start:stop] = np.sqrt(np.maximum(np.take_along_axis(top_dist, order, axis=1), 0))
+        latencies[start:stop] = (time.perf_counter() - began) / len(block)
+
+    return distances, indices, latencies
+
+
+def score_recommendations(query_codes, recommended_codes, min_matches=3):
+    """
+    Score recommendation lists against the query categories
+
+    Args:
+        query_codes (np.ndarray): Category code of each query (n_queries,)
+        recommended_codes (np.ndarray): Category codes of the recommendations (n_queries x k)
+        min_matches (int, optional): Matches needed for a query to count as correct. Defaults to 3.
+
+    Returns:
+        tuple: (matches per query, boolean mask of correct queries)
+    """
+    matches = ((recommended_codes == query_codes[:, None]) & (recommended_codes >= 0)).sum(axis=1)
+    return matches, matches >= min_matches
+
+
+def evaluate(features, filenames, codes, labels, k=5, min_matches=3, block_size=1024, limit=None,
+             latency_samples=200, seed=0):
+    """
+    Evaluate category-match quality of the index over the catalogue
+
+    Args:
+        features (np.ndarray): Catalogue feature matrix
+        filenames (list): Catalogue filenames
+        codes (np.ndarray): Category code per catalogue item (-1 when unknown)
+        labels (list): Category labels indexed by code
+        k (int, optional): Recommendations per query (the app shows 5). Defaults to 5.
+        min_matches (int, optional): Matches for the "3 of 5" metric. Defaults to 3.
+        block_size (int, optional): Queries per matrix block. Defaults to 1024.
+        limit (int, optional): Evaluate only this many random items. Defaults to None (all).
+        latency_samples (int, optional): Single-query searches to time. Defaults to 200.
+        seed (int, optional): Random seed for sampling. Defaults to 0.
+
+    Returns:
+        dict: Evaluation report
+    """
+    rng = np.random.default_rng(seed)
+    query_idx = np.flatnonzero(codes >= 0)
+    if limit is not None and limit < len(query_idx):
+        query_idx = np.sort(rng.choice(query_idx, size=limit, replace=False))
+
+    began = time.perf_counter()
+    # Like the /upload route, drop the first neighbour as the self-match
+    _, indices, block_latencies = blocked_neighbors(features, features[query_idx], k + 1, block_size)
+    elapsed = time.perf_counter() - began
+    recommended = indices[:, 1:k + 1]
+
+    query_codes = codes[query_idx]
+    matches, correct = score_recommendations(query_codes, codes[recommended], min_matches)
+
+    per_category = {}
+    for code in np.unique(query_codes):
+        mask = query_codes == code
+        per_category[labels[code]] = {
+            "queries": int(mask.sum()),
+            "precision_at_k": round(float(matches[mask].mean() / k), 4),
+            "match_rate": round(float(correct[mask].mean()), 4),
+        }
+
+    single_latencies = []
+    if latency_samples:
+        for i in rng.choice(query_idx, size=min(latency_samples, len(query_idx)), replace=False):
+            _, _, latency = blocked_neighbors(features, features[i:i + 1], k + 1, 1)
+            single_latencies.append(latency[0])
+
+    return {
+        "items": len(filenames),
+        "queries": int(len(query_idx)),
+        "k": k,
+        "min_matches": min_matches,
+        "precision_at_k": round(float(matches.mean() / k), 4) if len(matches) else 0.0,
+        "match_rate": round(float(correct.mean()), 4) if len(correct) else 0.0,
+        "elapsed_seconds": round(elapsed, 3),
+        "latency_ms": {
+            "batched": _percentiles(block_latencies),
+            "single_query": _percentiles(np.asarray(single_latencies)),
+        },
+        "per_category": per_category,
+    }
+
+
+def evaluate_query_cache(features, codes, k=5, min_matches=3, block_size=1024, limit=None, repeats=0.2,
+                         noise=0.1, cache_size=None, similarity=None, seed=0):
+    """
+    Measure the semantic query cache on a stream of catalogue queries
+
+    Every labelled item (or a random subset) is queried once in random order,
+    and a fraction of the queries are re-shots of an earlier query: the same
+    embedding with a random perturbation, like the same garment photographed
+    twice. Each query goes through a query_cache.SemanticCache; cached lists
+    are scored against the freshly searched lists of the same queries.
+
+    Args:
+        features (np.ndarray): Catalogue feature matrix
+        codes (np.ndarray): Category code per catalogue item (-1 when unknown)
+        k (int, optional): Recommendations per query. Defaults to 5.
+        min_matches (int, optional): Matches for the "3 of 5" metric. Defaults to 3.
+        block_size (int, optional): Queries per matrix block. Defaults to 1024.
+        limit (int, optional): Distinct items to query. Defaults to None (all).
+        repeats (float, optional): Re-shot queries per distinct item. Defaults to 0.2.
+        noise (float, optional): Length of the re-shot perturbation relative to the
+            (unit) embedding. Defaults to 0.1.
+        cache_size (int, optional): Cache entries. Defaults to QUERY_CACHE_SIZE.
+        similarity (float, optional): Cache cosine radius. Defaults to QUERY_CACHE_SIMILARITY.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        dict: Hit rate and cached vs fresh quality on the hits
+    """
+    from query_cache import QUERY_CACHE_SIMILARITY, QUERY_CACHE_SIZE, SemanticCache
+
+    rng = np.random.default_rng(seed)
+    items = rng.permutation(np.flatnonzero(codes >= 0))
+    if limit is not None:
+        items = items[:limit]
+
+    # Re-shots are queried at a random time after their original
+    originals = rng.choice(len(items), size=int(len(items) * repeats), replace=True)
+    times = np.concatenate([np.arange(len(items)), rng.uniform(originals, len(items))])
+    order = np.argsort(times, kind="stable")
+    item_of = np.concatenate([items, items[originals]])[order]
+    reshots = (np.arange(len(times)) >= len(items))[order]
+
+    queries = features[item_of].astype(np.float32)
+    perturbation = rng.standard_normal(queries[reshots].shape).astype(np.float32)
+    perturbation *= noise / np.linalg.norm(perturbation, axis=1, keepdims=True)
+    queries[reshots] += perturbation
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    # Fresh results of every query, dropping the self-match like evaluate()
+    _, indices, _ = blocked_neighbors(features, queries, k + 1, block_size)
+    fresh = indices[:, 1:k + 1]
+
+    cache = SemanticCache(cache_size or QUERY_CACHE_SIZE, similarity or QUERY_CACHE_SIMILARITY)
+    served = fresh.copy()
+    hit = np.zeros(len(queries), dtype=bool)
+    for i, query in enumerate(queries):
+        cached = cache.get(query)
+        if cached is None:
+            cache.put(query, fresh[i])
+        else:
+            served[i], hit[i] = cached, True
+
+    query_codes = codes[item_of]
+    fresh_matches, fresh_correct = score_recommendations(query_codes[hit], codes[fresh[hit]], min_matches)
+    cached_matches, cached_correct = score_recommendations(query_codes[hit], codes[served[hit]], min_matches)
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(fresh[hit], served[hit])]
+
+    def rate(values):
+        return round(float(np.mean(values)), 4) if len(values) else 0.0
+
+    return {
+        "queries": int(len(queries)),
+        "reshots": int(reshots.sum()),
+        "hits": int(hit.sum()),
+        "hit_rate": rate(hit),
+        "reshot_hit_rate": rate(hit[reshots]),
+        "distinct_item_hit_rate": rate(hit[~reshots]),
+        "on_hits": {
+            "fresh_precision_at_k": rate(fresh_matches / k),
+            "cached_precision_at_k": rate(cached_matches / k),
+            "fresh_match_rate": rate(fresh_correct),
+            "cached_match_rate": rate(cached_correct),
+            "overlap_at_k": rate(overlap),
+        },
+    }
+
+
+def _percentiles(latencies):
+    """Summarise latencies in seconds as millisecond percentiles"""
+    if len(latencies) == 0:
+        return {}
+    p50, p90, p99 = np.percentile(latencies * 1000, [50, 90, 99])
+    return {"p50": round(float(p50), 4), "p90": round(float(p90), 4), "p99": round(float(p99), 4),
+            "max": round(float(latencies.max() * 1000), 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate recommendation quality over the whole catalogue")
+    add_store_arguments(parser)
+    parser.add_argument("--styles", default="styles.csv")
+    parser.add_argument("--column", default="masterCategory", help="styles.csv column used as ground truth")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--min-matches", type=int, default=3)
+    parser.add_argument("--block-size", type=int, default=1024)
+    parser.add_argument("--limit", type=int, default=None, help="Evaluate a random subset of this size")
+    parser.add_argument("--latency-samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--query-cache", action="store_true",
+                        help="Measure the semantic query cache instead (see query_cache.py)")
+    parser.add_argument("--cache-repeats", type=float, default=0.2, help="Re-shot queries per distinct item")
+    parser.add_argument("--cache-noise", type=float, default=0.1, help="Re-shot perturbation length")
+    parser.add_argument("--cache-size", type=int, default=None)
+    parser.add_argument("--cache-similarity", type=float, default=None)
+    args = parser.parse_args()
+    resolve_store_arguments(args)
+
+    features, filenames = load_index(args.features, args.filenames)
+    print(f"Loaded {len(features)} features and {len(filenames)} filenames")
+    codes, labels = load_category_codes(filenames, args.styles, args.column)
+    print(f"Mapped {int((codes >= 0).sum())} items to {len(labels)} categories ({args.column})")
+
+    if args.query_cache:
+        report = evaluate_query_cache(features, codes, k=args.k, min_matches=args.min_matches,
+                                      block_size=args.block_size, limit=args.limit, repeats=args.cache_repeats,
+                                      noise=args.cache_noise, cache_size=args.cache_size,
+                                      similarity=args.cache_similarity, seed=args.seed)
+        print(f"Query cache: {report['hits']} hits in {report['queries']} queries "
+              f"({report['hit_rate'] * 100:.2f}%; re-shots {report['reshot_hit_rate'] * 100:.2f}%, "
+              f"distinct items {report['distinct_item_hit_rate'] * 100:.2f}%)")
+        print(f"On hits: {report['on_hits']}")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Report written to {args.output}")
+        return
+
+    report = evaluate(features, filenames, codes, labels, k=args.k, min_matches=args.min_matches,
+                      block_size=args.block_size, limit=args.limit,
+                      latency_samples=args.latency_samples, seed=args.seed)
+
+    print(f"Evaluated {report['queries']} queries in {report['elapsed_seconds']}s")
+    print(f"Precision@{args.k}: {report['precision_at_k'] * 100:.2f}%")
+    print(f"Accuracy ({args.min_matches} of {args.k} match): {report['match_rate'] * 100:.2f}%")
+    print(f"Latency (ms): {report['latency_ms']}")
+    for label, stats in sorted(report["per_category"].items(), key=lambda item: -item[1]["queries"]):
+        print(f"  {label:<20} {stats['queries']:>6} queries  "
+              f"precision {stats['precision_at_k'] * 100:6.2f}%  match {stats['match_rate'] * 100:6.2f}%")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+HTTP caching helpers for files served by the API
+
+Files are sent with a content-hash ETag, Last-Modified, Cache-Control and
+Range support. Conditional requests (If-None-Match / If-Modified-Since)
+are answered with 304 and Range requests with 206 by Werkzeug.
+"""
+import hashlib
+import os
+from functools import lru_cache
+
+from flask import send_file
+
+# Files that never change once published
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Catalogue images can be replaced online (catalogue_delta.py), so they are revalidated with their ETag
+CATALOGUE = "public, no-cache"
+# User uploads are kept for a day, then revalidated with their ETag
+UPLOADS = "public, max-age=86400"
+# Always revalidate (cheap 304) so API docs are never stale
+REVALIDATE = "no-cache"
+# Per-user downloads must not be stored by shared caches
+PRIVATE = "private, no-cache"
+
+_HASH_CHUNK = 1024 * 1024
+
+
+@lru_cache(maxsize=65536)
+def _content_hash(path, size, mtime_ns):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_etag(path):
+    """
+    Content-hash ETag of a file, computed once per (path, size, mtime)
+
+    Args:
+        path (str): File path
+
+    Returns:
+        str: Hex digest of the file content
+    """
+    stat = os.stat(path)
+    return _content_hash(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def send_cached_file(path, cache_control, mimetype=None, etag=None):
+    """
+    Send a file with validators so browsers can reuse their cached copy
+
+    Args:
+        path (str): File path
+        cache_control (str): Cache-Control header value
+        mimetype (str, optional): Response mimetype, guessed from the name by default. Defaults to None.
+        etag (str, optional): Precomputed strong ETag; the content hash is used by default. Defaults to None.
+
+    Returns:
+        Response: 200, 206 or 304 response
+    """
+    response = send_file(path, mimetype=mimetype, etag=etag or file_etag(path), conditional=True)
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,56 @@
+"""
+Fast image loading for ResNet50 inputs.
+
+keras.preprocessing.image.load_img decodes a JPEG at full resolution and
+then resizes it, so a 12-megapixel phone photo costs a full decode for a
+224x224 input. load_image asks libjpeg to decode at a reduced scale
+instead (Pillow's draft mode: 1/2, 1/4 or 1/8 in the DCT domain, never
+smaller than the target), rotates the result according to its EXIF
+orientation and then resizes it like load_img does. Other formats are
+decoded as before.
+
+`python -m benchmarks.decode_bench` compares decode time and pixel
+differences against the load_img path.
+"""
+import numpy as np
+from PIL import Image, ImageOps
+
+TARGET_SIZE = (224, 224)
+
+
+def open_image(source, target_size=TARGET_SIZE, resample=Image.NEAREST):
+    """
+    Decode an image at the model's input size
+
+    Args:
+        source (str or file): Image path or file object
+        target_size (tuple, optional): (height, width), as for load_img. Defaults to TARGET_SIZE.
+        resample (int, optional): Final resize filter. Defaults to Image.NEAREST, load_img's default.
+
+    Returns:
+        PIL.Image.Image: RGB image of the target size
+    """
+    height, width = target_size
+    img = Image.open(source)
+    # A no-op for formats other than JPEG; must run before the pixels are loaded
+    img.draft("RGB", (width, height))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if img.size != (width, height):
+        img = img.resize((width, height), resample)
+    return img
+
+
+def load_image(source, target_size=TARGET_SIZE):
+    """
+    Image as a float32 array, like image.img_to_array(image.load_img(...))
+
+    Args:
+        source (str or file): Image path or file object
+        target_size (tuple, optional): (height, width). Defaults to TARGET_SIZE.
+
+    Returns:
+        np.ndarray: height x width x 3 float32 array
+    """
+    return np.asarray(open_image(source, target_size), dtype=np.float32)
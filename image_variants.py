@@ -0,0 +1,297 @@
+"""
+Resized / re-encoded image variants with a bounded on-disk cache
+
+Variants are generated on first request from images/ or uploads/ and
+stored under VARIANT_CACHE_DIR. The cache is bounded by
+VARIANT_CACHE_MAX_BYTES and evicts the least recently used files first.
+
+Pre-generate variants for the whole catalogue with:
+    python image_variants.py --widths 200,400 --formats webp
+"""
+import argparse
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+VARIANT_CACHE_DIR = os.getenv('VARIANT_CACHE_DIR', os.path.join('cache', 'variants'))
+VARIANT_CACHE_MAX_BYTES = int(os.getenv('VARIANT_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# Only a fixed set of widths is served so the cache key space stays bounded
+ALLOWED_WIDTHS = (100, 200, 300, 400, 600, 800)
+
+# Output format name -> (Pillow format, mimetype, extension, save options)
+FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", ".jpg", {"quality": 82, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", "image/webp", ".webp", {"quality": 80, "method": 4}),
+}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+
+# Variants never change for a given key, so browsers may keep them for a year
+VARIANT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class VariantError(ValueError):
+    """Raised for variant parameters that are not supported"""
+
+
+def parse_variant_args(args):
+    """
+    Validate the ?w=...&fmt=... query parameters of an image request
+
+    Args:
+        args (dict): Request query parameters
+
+    Returns:
+        tuple: (width or None, format name or None); (None, None) means serve the original
+
+    Raises:
+        VariantError: If the width or format is not supported
+    """
+    width = args.get('w')
+    fmt = args.get('fmt')
+
+    if width is not None:
+        try:
+            width = int(width)
+        except ValueError:
+            raise VariantError(f"Invalid width: {width}")
+        if width not in ALLOWED_WIDTHS:
+            raise VariantError(f"Unsupported width {width}, use one of {', '.join(map(str, ALLOWED_WIDTHS))}")
+
+    if fmt is not None:
+        fmt = FORMAT_ALIASES.get(fmt.lower(), fmt.lower())
+        if fmt not in FORMATS:
+            raise VariantError(f"Unsupported format {fmt}, use one of {', '.join(FORMATS)}")
+
+    return width, fmt
+
+
+# EXIF orientations that rotate the stored pixels by 90 or 270 degrees
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def draft_oriented(img, width, height=None):
+    """
+    Let libjpeg decode at a reduced scale that still covers a size after the EXIF rotation
+
+    A no-op for formats other than JPEG; must run before the pixels are loaded.
+
+    Args:
+        img (PIL.Image.Image): Image opened but not loaded
+        width (int): Width wanted once exif_transpose has run
+        height (int, optional): Height wanted then. Defaults to the aspect ratio's.
+    """
+    if img.format != "JPEG":
+        return
+    stored_width, stored_height = img.size
+    # draft() works on the stored pixels, whose axes the rotation swaps
+    transposed = img.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS
+    if transposed:
+        stored_width, stored_height = stored_height, stored_width
+    if height is None:
+        height = max(1, width * stored_height // stored_width)
+    img.draft("RGB", (height, width) if transposed else (width, height))
+
+
+def render_variant(source_path, width=None, fmt="jpeg"):
+    """
+    Decode, resize and re-encode an image
+
+    Args:
+        source_path (str): Path of the original image
+        width (int, optional): Target width; images are never upscaled. Defaults to None.
+        fmt (str, optional): Output format name from FORMATS. Defaults to "jpeg".
+
+    Returns:
+        bytes: Encoded variant
+    """
+    pil_format, _, _, options = FORMATS[fmt]
+
+    with Image.open(source_path) as img:
+        if width:
+            # Let libjpeg decode at a reduced scale instead of full resolution
+            draft_oriented(img, width)
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+        if width and img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        img.save(buffer, pil_format, **options)
+        return buffer.getvalue()
+
+
+class VariantCache:
+    """
+    Bounded on-disk cache of image variants
+
+    Files are named after a hash of the source identity (path, size, mtime)
+    and the variant parameters, so a changed source never serves a stale
+    variant. Hits refresh the file's mtime, which drives LRU eviction.
+    """
+
+    def __init__(self, cache_dir=VARIANT_CACHE_DIR, max_bytes=VARIANT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def key(self, source_path, width, fmt):
+        """Strong, content-identifying key for a variant (also used as its ETag)"""
+        stat = os.stat(source_path)
+        identity = f"{os.path.abspath(source_path)}|{stat.st_size}|{stat.st_mtime_ns}|{width}|{fmt}"
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def get(self, source_path, width=None, fmt=None):
+        """
+        Return the cached variant, generating it on a miss
+
+        Args:
+            source_path (str): Path of the original image
+            width (int, optional): Target width. Defaults to None.
+            fmt (str, optional): Output format name. Defaults to "jpeg".
+
+        Returns:
+            tuple: (variant path, etag, mimetype)
+        """
+        fmt = fmt or "jpeg"
+        _, mimetype, extension, _ = FORMATS[fmt]
+        key = self.key(source_path, width, fmt)
+        path = os.path.join(self.cache_dir, key[:2], key + extension)
+
+        try:
+            os.utime(path)
+            return path, key, mimetype
+        except FileNotFoundError:
+            pass
+
+        self._store(path, render_variant(source_path, width, fmt))
+        return path, key, mimetype
+
+    def _store(self, path, data):
+        """Write a cache entry atomically, then enforce the size bound"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._account(len(data), path)
+
+    def size(self):
+        """Total bytes currently stored in the cache directory"""
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _account(self, added, path):
+        with self._lock:
+            if self._size is None:
+                self._size = self.size()
+            else:
+                self._size += added
+            if self._size > self.max_bytes:
+                self._size = self.evict(keep=path)
+
+    def evict(self, target_ratio=0.9, keep=None):
+        """
+        Delete least recently used variants until the cache is under target
+
+        Other worker processes share the directory, so the real size is
+        re-measured from disk rather than trusted from this process' counter.
+
+        Args:
+            target_ratio (float, optional): Fraction of max_bytes to shrink to. Defaults to 0.9.
+            keep (str, optional): Path that must not be evicted (the variant being served). Defaults to None.
+
+        Returns:
+            int: Bytes remaining in the cache
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * target_ratio
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        return total
+
+
+variant_cache = VariantCache()
+
+
+_worker_cache = None
+
+
+def _init_worker(cache_dir, max_bytes):
+    global _worker_cache
+    _worker_cache = VariantCache(cache_dir, max_bytes)
+
+
+def _pregenerate(job):
+    source_path, width, fmt = job
+    try:
+        _worker_cache.get(source_path, width, fmt)
+        return None
+    except Exception as e:
+        return f"{source_path}: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate image variants for the catalogue")
+    parser.add_argument("--source", default="images", help="Directory of originals (default: images)")
+    parser.add_argument("--widths", default="200,400", help="Comma separated widths")
+    parser.add_argument("--formats", default="webp", help=f"Comma separated formats ({', '.join(FORMATS)})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--cache-dir", default=VARIANT_CACHE_DIR)
+    parser.add_argument("--max-bytes", type=int, default=VARIANT_CACHE_MAX_BYTES)
+    args = parser.parse_args()
+
+    try:
+        widths = [parse_variant_args({"w": w})[0] for w in args.widths.split(",")]
+        formats = [parse_variant_args({"fmt": f})[1] for f in args.formats.split(",")]
+    except VariantError as e:
+        parser.error(str(e))
+
+    files = sorted(f for f in os.listdir(args.source) if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+    jobs = [(os.path.join(args.source, f), w, fmt) for f in files for w in widths for fmt in formats]
+    print(f"Generating {len(jobs)} variants for {len(files)} images with {args.workers} workers")
+
+    started = time.time()
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.cache_dir, args.max_bytes)) as pool:
+        for i, error in enumerate(pool.map(_pregenerate, jobs, chunksize=64), 1):
+            if error:
+                failures += 1
+                print(f"Failed: {error}")
+            if i % 5000 == 0:
+                print(f"  {i}/{len(jobs)} variants ({time.time() - started:.1f}s)")
+
+    print(f"Done in {time.time() - started:.1f}s, {failures} failures, "
+          f"cache size {VariantCache(args.cache_dir, args.max_bytes).size() / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
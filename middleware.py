@@ -1,8 +1,13 @@
 from functools import wraps
 from flask import request, jsonify
 from auth import verify_token
+import hmac
+import os
 import traceback
 
+# Shared secret for operational endpoints; they are disabled while it is unset
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
 def auth_required(f):
     """
     Decorator to require authentication for a route
@@ -52,4 +57,28 @@ def auth_required(f):
             print(traceback.format_exc())
             return jsonify({"error": "Authentication failed", "detail": str(e)}), 500
     
-    return decorated 
\ No newline at end of file
+    return decorated 
+
+def admin_required(f):
+    """
+    Decorator to require the ADMIN_TOKEN in the X-Admin-Token header
+    
+    Args:
+        f: The route function to protect
+        
+    Returns:
+        Function: Wrapped function that checks the admin token
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Admin endpoints are disabled", "detail": "Set ADMIN_TOKEN to enable them"}), 403
+        
+        token = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            print("Admin authentication failed")
+            return jsonify({"error": "Invalid admin token"}), 401
+        
+        return f(*args, **kwargs)
+    
+    return decorated
@@ -0,0 +1,56 @@
+"""
+One-shot database migration: create the indexes the app relies on
+
+Run once per deployment (e.g. as a release command) instead of on every
+worker start:
+    python migrate.py
+"""
+from pymongo import ASCENDING, DESCENDING
+
+from database import get_db, using_memory_db
+
+# collection -> list of (keys, options)
+INDEXES = {
+    "users": [
+        ([("username", ASCENDING)], {"unique": True}),
+    ],
+    "uploaded_images": [
+        ([("user_id", ASCENDING)], {}),
+        # get_user_images: a user's uploads, newest first; _id breaks ties for get_user_images_page
+        ([("user_id", ASCENDING), ("uploaded_at", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    "user_profiles": [
+        ([("user_id", ASCENDING)], {"unique": True}),
+    ],
+}
+
+
+def migrate(db=None):
+    """
+    Create all indexes (a no-op for indexes that already exist)
+
+    Args:
+        db (Database, optional): Database to migrate. Defaults to get_db().
+
+    Returns:
+        list: (collection, index name) pairs
+    """
+    db = db if db is not None else get_db()
+    created = []
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            name = db[collection].create_index(keys, **options)
+            created.append((collection, name))
+    return created
+
+
+def main():
+    if using_memory_db():
+        print("MongoDB is not reachable; nothing to migrate for the in-memory database")
+        return
+    for collection, name in migrate():
+        print(f"Index ready: {collection}.{name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,70 @@
+import os
 from datetime import datetime
+import numpy as np
+from bson.binary import Binary
 from bson.objectid import ObjectId
-from database import uploaded_images_collection, users_collection
+from database import project, uploaded_images_collection, users_collection
+from write_buffer import write_buffer
+from categories import get_category_from_filename
+from backbones import active_backbone
+from profiles import LEGACY_FEATURE_VERSION, pack_vector, unpack_vector, update_taste
 import cloudinary_utils as cloud
 
-def save_uploaded_image(user_id, filename, image_url, category, recommendations=None):
+# Fields returned by history lists; recommendations are only loaded for a single image
+SUMMARY_PROJECTION = {"filename": 1, "image_url": 1, "category": 1, "uploaded_at": 1}
+
+def pack_recommendations(recommendations):
+    """
+    Compact storage form of a recommendation list
+    
+    Catalogue items are stored by id (the numeric filename stem) with their
+    confidences as one float16 array, instead of a dict per item. Categories
+    are not stored; they are derived from the filename again on read.
+    
+    Args:
+        recommendations (list): Recommendation dicts with filename and confidence
+        
+    Returns:
+        dict: {"ids": [...], "scores": Binary} ready to embed in a document
+    """
+    ids = []
+    for rec in recommendations:
+        stem, ext = os.path.splitext(rec["filename"])
+        # Names that aren't "<id>.jpg" (e.g. test fixtures) are kept whole, as are
+        # ids with leading zeros, which an int would not give back
+        numeric = stem.isdigit() and ext == ".jpg" and str(int(stem)) == stem
+        ids.append(int(stem) if numeric else rec["filename"])
+    scores = np.array([rec.get("confidence", 0) for rec in recommendations], dtype="<f2")
+    return {"ids": ids, "scores": Binary(scores.tobytes())}
+
+def unpack_recommendations(stored):
+    """
+    Recommendation dicts from a stored document field
+    
+    Args:
+        stored (dict or list): pack_recommendations output, or the plain list
+            of dicts written by earlier versions
+        
+    Returns:
+        list: Recommendation dicts with filename, category and confidence
+    """
+    if not stored:
+        return []
+    if isinstance(stored, list):
+        return stored
+    scores = np.frombuffer(bytes(stored["scores"]), dtype="<f2")
+    recommendations = []
+    for item, score in zip(stored["ids"], scores):
+        filename = f"{item}.jpg" if isinstance(item, int) else item
+        score = float(score)
+        recommendations.append({
+            "filename": filename,
+            "category": get_category_from_filename(filename),
+            "confidence": int(score) if score.is_integer() else round(score, 1)
+        })
+    return recommendations
+
+def save_uploaded_image(user_id, filename, image_url, category, recommendations=None, embedding=None):
     """
     Save uploaded image metadata to MongoDB
     
@@ -13,6 +74,8 @@ def save_uploaded_image(user_id, filename, image_url, category, recommendations=
         image_url (str): Cloudinary URL
         category (str): Category of the image
         recommendations (list, optional): List of recommended items. Defaults to None.
+        embedding (array, optional): Feature vector of the image; stored as float16 and
+            added to the user's taste vector. Defaults to None.
         
     Returns:
         dict: Saved image document
@@ -23,19 +86,31 @@ def save_uploaded_image(user_id, filename, image_url, category, recommendations=
         "filename": filename,
         "image_url": image_url,
         "category": category,
-        "recommendations": recommendations or [],
+        "recommendations": pack_recommendations(recommendations or []),
         "uploaded_at": datetime.utcnow()
     }
+    if embedding is not None:
+        image_data["embedding"] = pack_vector(embedding)
+        image_data["feature_version"] = active_backbone.version
+    
+    # Queue the insert; it is written with other uploads in one batch
+    image_id = write_buffer.insert("uploaded_images", image_data)
     
-    # Insert into database
-    result = uploaded_images_collection.insert_one(image_data)
+    if embedding is not None:
+        try:
+            update_taste(user_id, embedding)
+        except Exception as e:
+            print(f"Warning: Could not update taste vector: {e}")
     
-    # Return document with string ID
-    image_data["_id"] = str(result.inserted_id)
+    # Return document with string ID and the recommendations as given
+    image_data["_id"] = str(image_id)
+    image_data["recommendations"] = recommendations or []
+    image_data.pop("embedding", None)
+    image_data.pop("feature_version", None)
     
     return image_data
 
-def get_user_images(user_id, limit=10, skip=0):
+def get_user_images(user_id, limit=10, skip=0, summary=True):
     """
     Get images uploaded by a specific user
     
@@ -43,24 +118,97 @@ def get_user_images(user_id, limit=10, skip=0):
         user_id (str): User ID
         limit (int, optional): Maximum number of results. Defaults to 10.
         skip (int, optional): Number of results to skip (for pagination). Defaults to 0.
+        summary (bool, optional): Only fetch the SUMMARY_PROJECTION fields. When False,
+            whole documents are returned with their recommendations unpacked. Defaults to True.
         
     Returns:
         list: List of image documents
     """
-    # Query database for user's images
-    cursor = uploaded_images_collection.find(
-        {"user_id": user_id}
-    ).sort(
-        "uploaded_at", -1  # Sort by upload date (newest first)
-    ).skip(skip).limit(limit)
+    # Queued uploads are newer than anything stored, so they come first
+    pending = write_buffer.pending("uploaded_images", {"user_id": user_id})
+    pending.sort(key=lambda image: image["uploaded_at"], reverse=True)
+    results = pending[skip:skip + limit]
+    if summary:
+        results = [project(image, SUMMARY_PROJECTION) for image in results]
+    
+    if len(results) < limit:
+        # Query database for user's images
+        cursor = uploaded_images_collection.find(
+            {"user_id": user_id}, SUMMARY_PROJECTION if summary else None
+        ).sort(
+            "uploaded_at", -1  # Sort by upload date (newest first)
+        ).skip(max(0, skip - len(pending))).limit(limit - len(results))
+        # An upload flushed since it was read from the queue comes back from the database too
+        queued_ids = {image["_id"] for image in results}
+        results.extend(image for image in cursor if image["_id"] not in queued_ids)
     
     # Convert to list and format IDs
-    images = []
-    for image in cursor:
-        image["_id"] = str(image["_id"])
-        images.append(image)
+    return [format_image(image, summary) for image in results]
+
+def format_image(image, summary=True):
+    """An image document as returned by the history queries (string _id, unpacked recommendations)"""
+    image["_id"] = str(image["_id"])
+    if not summary:
+        image["recommendations"] = unpack_recommendations(image.get("recommendations"))
+        image.pop("embedding", None)
+        image.pop("feature_version", None)
+    return image
+
+def get_queued_user_images(user_id):
+    """
+    Uploads of a user still queued by the write-behind buffer (whole documents, newest first)
     
-    return images
+    Args:
+        user_id (str): User ID
+        
+    Returns:
+        list: Image documents
+    """
+    pending = write_buffer.pending("uploaded_images", {"user_id": user_id})
+    pending.sort(key=lambda image: image["uploaded_at"], reverse=True)
+    return [format_image(image, summary=False) for image in pending]
+
+def get_user_images_page(user_id, limit, after=None):
+    """
+    A page of a user's stored uploads, newest first, continuing after the previous page
+    
+    Pages are keyed on the (uploaded_at, _id) of the last document read rather
+    than an offset, so uploads and deletions while paging neither repeat nor
+    skip documents.
+    
+    Args:
+        user_id (str): User ID
+        limit (int): Maximum number of results
+        after (tuple, optional): Cursor returned with the previous page. Defaults to None (the newest uploads).
+        
+    Returns:
+        tuple: (whole image documents, cursor for the next page)
+    """
+    query = {"user_id": user_id}
+    if after is not None:
+        uploaded_at, image_id = after
+        query["$or"] = [{"uploaded_at": {"$lt": uploaded_at}},
+                        {"uploaded_at": uploaded_at, "_id": {"$lt": image_id}}]
+    images = list(uploaded_images_collection.find(query).sort([("uploaded_at", -1), ("_id", -1)]).limit(limit))
+    if images:
+        after = (images[-1]["uploaded_at"], images[-1]["_id"])
+    return [format_image(image, summary=False) for image in images], after
+
+def count_user_images(user_id):
+    """
+    Count the images uploaded by a specific user
+    
+    Args:
+        user_id (str): User ID
+        
+    Returns:
+        int: Number of image documents
+    """
+    queued = len(write_buffer.pending("uploaded_images", {"user_id": user_id}))
+    if hasattr(uploaded_images_collection, "count_documents"):
+        return queued + uploaded_images_collection.count_documents({"user_id": user_id})
+    # The in-memory fallback collection has no count_documents
+    return queued + sum(1 for _ in uploaded_images_collection.find({"user_id": user_id}, {"_id": 1}))
 
 def get_image_by_id(image_id):
     """
@@ -84,9 +232,16 @@ def get_image_by_id(image_id):
             image_id_obj = image_id
             
         image = uploaded_images_collection.find_one({"_id": image_id_obj})
+        if not image:
+            # Not written yet
+            queued = write_buffer.pending("uploaded_images", {"_id": image_id_obj})
+            image = queued[0] if queued else None
         
         if image:
             image["_id"] = str(image["_id"])
+            image["recommendations"] = unpack_recommendations(image.get("recommendations"))
+            image.pop("embedding", None)
+            image.pop("feature_version", None)
             
         return image
     except Exception as e:
@@ -115,6 +270,10 @@ def delete_image(image_id, user_id):
             # If conversion fails, use as-is (for in-memory database)
             image_id_obj = image_id
             
+        # Write the image first if it is still queued
+        if write_buffer.pending("uploaded_images", {"_id": image_id_obj}):
+            write_buffer.flush()
+        
         # Get image document
         image = uploaded_images_collection.find_one({
             "_id": image_id_obj,
@@ -142,6 +301,14 @@ def delete_image(image_id, user_id):
             "user_id": user_id
         })
         
+        # Take the image out of the user's taste vector
+        if result.deleted_count > 0 and image.get("embedding") is not None:
+            try:
+                update_taste(user_id, unpack_vector(image["embedding"]), remove=True,
+                             feature_version=image.get("feature_version", LEGACY_FEATURE_VERSION))
+            except Exception as e:
+                print(f"Warning: Could not update taste vector: {e}")
+        
         return result.deleted_count > 0
     except Exception as e:
         print(f"Error deleting image: {e}")
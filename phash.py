@@ -0,0 +1,274 @@
+"""
+Perceptual-hash index of the catalogue images.
+
+Many uploads are re-encoded or resized copies of our own catalogue photos.
+A 64-bit pHash of the upload is cheap to compute (a small DCT of a 32x32
+greyscale thumbnail), so app.py checks it against this index before
+running ResNet50. On a match the recommendations precomputed here for
+that catalogue item are returned and the model is skipped.
+
+Hashes are stored packed as one uint64 per item. Lookups use multi-index
+hashing: the 64 bits are split into CHUNKS chunks, and by the pigeonhole
+principle a hash within distance r of the query agrees with it on at
+least one chunk to within r // CHUNKS bits, so only the buckets of those
+chunk values need to be checked.
+
+Usage (after preprocess.py and dedup.py):
+    python phash.py
+    python phash.py --max-distance 4
+"""
+import argparse
+import itertools
+import os
+import pickle as pkl
+import time
+
+import numpy as np
+from PIL import Image
+
+from backbones import add_store_arguments, resolve_store_arguments
+
+PHASH_INDEX_PATH = "phash_index.pkl"
+# Largest Hamming distance at which an upload counts as a copy of a catalogue image
+PHASH_MAX_DISTANCE = int(os.getenv('PHASH_MAX_DISTANCE', '6'))
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+# Recommendations precomputed per catalogue item
+NEIGHBOURS = 5
+
+HASH_SIZE = 8
+SAMPLE_SIZE = 32
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II matrix"""
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT = _dct_matrix(SAMPLE_SIZE)
+# Popcount of every byte value, for Hamming distances of packed hashes
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def phash(source):
+    """
+    64-bit perceptual hash of an image
+
+    Args:
+        source (str or file or PIL.Image.Image): Image to hash
+
+    Returns:
+        int: The hash (fits in a uint64)
+    """
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    # Let the JPEG decoder downscale while decoding; a 32x32 sample needs no more
+    img.draft("L", (SAMPLE_SIZE * 2, SAMPLE_SIZE * 2))
+    pixels = np.asarray(img.convert("L").resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.LANCZOS), dtype=np.float32)
+    low = (DCT @ pixels @ DCT.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    # Compare against the median of the low frequencies, ignoring the DC term
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming(hashes, query):
+    """Hamming distances between packed uint64 hashes and one query hash"""
+    diff = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(query))
+    return POPCOUNT[diff.view(np.uint8)].reshape(len(diff), 8).sum(axis=1)
+
+
+class HashIndex:
+    """Multi-index Hamming search over packed 64-bit hashes"""
+
+    def __init__(self, hashes):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.tables = []
+        for chunk in range(CHUNKS):
+            values = self._chunk(self.hashes, chunk)
+            order = np.argsort(values, kind="stable")
+            self.tables.append((values[order], order))
+
+    @staticmethod
+    def _chunk(hashes, chunk):
+        return (hashes >> np.uint64(chunk * CHUNK_BITS)) & np.uint64((1 << CHUNK_BITS) - 1)
+
+    def _probes(self, value, radius):
+        """Chunk values within `radius` bits of value"""
+        yield value
+        for flips in range(1, radius + 1):
+            for bits in itertools.combinations(range(CHUNK_BITS), flips):
+                probe = value
+                for bit in bits:
+                    probe ^= 1 << bit
+                yield probe
+
+    def search(self, query, max_distance=PHASH_MAX_DISTANCE):
+        """
+        Items within a Hamming distance of a hash
+
+        Args:
+            query (int): Query hash
+            max_distance (int, optional): Largest distance. Defaults to PHASH_MAX_DISTANCE.
+
+        Returns:
+            list: (row, distance) pairs, nearest first
+        """
+        candidates = set()
+        radius = max_distance // CHUNKS
+        for chunk, (values, rows) in enumerate(self.tables):
+            value = int(self._chunk(np.uint64(query), chunk))
+            for probe in self._probes(value, radius):
+                start, stop = np.searchsorted(values, [probe, probe + 1])
+                candidates.update(rows[start:stop].tolist())
+        if not candidates:
+            return []
+        rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        distances = hamming(self.hashes[rows], query)
+        keep = distances <= max_distance
+        return sorted(zip(rows[keep].tolist(), distances[keep].tolist()), key=lambda item: (item[1], item[0]))
+
+
+class CatalogueMatcher:
+    """Hash index of the catalogue plus the recommendations precomputed per item"""
+
+    def __init__(self, hashes, neighbours=None, distances=None, max_distance=PHASH_MAX_DISTANCE):
+        self.index = HashIndex(hashes)
+        self.neighbours = neighbours
+        self.distances = distances
+        self.max_distance = max_distance
+
+    def match(self, source):
+        """
+        Catalogue item an image is a copy of
+
+        Args:
+            source (str or file): Uploaded image
+
+        Returns:
+            tuple: (catalogue row, Hamming distance), or None
+        """
+        try:
+            query = phash(source)
+        except Exception as e:
+            print(f"Could not hash {source}: {e}")
+            return None
+        matches = self.index.search(query, self.max_distance)
+        return matches[0] if matches else None
+
+    def recommendations(self, row):
+        """(catalogue rows, distances) precomputed for an item, or None if there are none"""
+        if self.neighbours is None:
+            return None
+        valid = self.neighbours[row] >= 0
+        return self.neighbours[row][valid], self.distances[row][valid].astype(np.float32)
+
+
+def load_matcher(n_items, path=PHASH_INDEX_PATH):
+    """
+    Load the index written by this script
+
+    Args:
+        n_items (int): Number of catalogue items it must cover
+        path (str, optional): Index pickle. Defaults to PHASH_INDEX_PATH.
+
+    Returns:
+        CatalogueMatcher: The matcher, or None when the file is missing or was
+            built for a different catalogue
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        data = pkl.load(open(path, "rb"))
+    except Exception as e:
+        print(f"Warning: Could not load {path}: {e}")
+        return None
+    if len(data["hashes"]) != n_items:
+        print(f"Warning: {path} covers {len(data['hashes'])} items, the catalogue has {n_items}; re-run phash.py")
+        return None
+    return CatalogueMatcher(data["hashes"], data.get("neighbours"), data.get("distances"))
+
+
+def hash_files(filenames):
+    """Packed hashes of image files (0 for files that can't be read)"""
+    hashes = np.zeros(len(filenames), dtype=np.uint64)
+    for row, filename in enumerate(filenames):
+        try:
+            hashes[row] = phash(filename)
+        except Exception as e:
+            print(f"Error hashing {filename}: {e}")
+        if row and row % 5000 == 0:
+            print(f"  {row}/{len(filenames)} hashed")
+    return hashes
+
+
+def precompute_neighbours(features, representatives, k=NEIGHBOURS, block_size=1024):
+    """
+    Recommendations of every catalogue item, as the app would compute them
+
+    Searches the cluster representatives and leaves out the item's own
+    cluster, like app.nearest_items(..., exclude_query=True).
+
+    Args:
+        features (np.ndarray): Catalogue matrix (n_items x dim)
+        representatives (np.ndarray): Rows searched by the app
+        k (int, optional): Recommendations per item. Defaults to NEIGHBOURS.
+        block_size (int, optional): Queries per matmul. Defaults to 1024.
+
+    Returns:
+        tuple: (catalogue rows (n_items x k, -1 padded), distances (n_items x k) as float16)
+    """
+    from dedup import SELF_MATCH_DISTANCE
+    from evaluate import blocked_neighbors
+
+    distances, indices, _ = blocked_neighbors(features[representatives], features, k + 1, block_size)
+    rows = np.asarray(representatives)[indices]
+    neighbours = np.full((len(features), k), -1, dtype=np.int32)
+    kept = np.zeros((len(features), k), dtype=np.float16)
+    for item in range(len(features)):
+        self_match = distances[item] <= SELF_MATCH_DISTANCE
+        # Only the nearest self match is dropped, as in nearest_items
+        drop = np.argmax(self_match) if self_match.any() else k
+        keep = [i for i in range(len(rows[item])) if i != drop][:k]
+        neighbours[item, :len(keep)] = rows[item][keep]
+        kept[item, :len(keep)] = distances[item][keep]
+    return neighbours, kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the perceptual-hash index of the catalogue images")
+    add_store_arguments(parser)
+    parser.add_argument("--max-distance", type=int, default=PHASH_MAX_DISTANCE,
+                        help="Report how many catalogue pairs are within this distance")
+    parser.add_argument("--output", help=f"Defaults to {PHASH_INDEX_PATH} in the feature store")
+    args = parser.parse_args()
+    backbone = resolve_store_arguments(args)
+    args.output = args.output or backbone.path(PHASH_INDEX_PATH)
+
+    from dedup import CLUSTERS_PATH, load_clusters
+    from evaluate import load_index
+    features, filenames = load_index(args.features, args.filenames)
+
+    began = time.perf_counter()
+    hashes = hash_files(filenames)
+    print(f"Hashed {len(hashes)} images in {time.perf_counter() - began:.1f}s")
+
+    clusters = load_clusters(len(filenames), backbone.path(CLUSTERS_PATH))
+    representatives = clusters["representatives"] if clusters else np.arange(len(filenames))
+    began = time.perf_counter()
+    neighbours, distances = precompute_neighbours(features, representatives)
+    print(f"Precomputed {NEIGHBOURS} recommendations per item in {time.perf_counter() - began:.1f}s")
+
+    index = HashIndex(hashes)
+    collisions = sum(len(index.search(int(h), args.max_distance)) > 1 for h in hashes[:2000])
+    print(f"{collisions} of the first {min(2000, len(hashes))} items have another item within "
+          f"{args.max_distance} bits")
+
+    with open(args.output, "wb") as f:
+        pkl.dump({"hashes": hashes, "neighbours": neighbours, "distances": distances}, f)
+    print(f"Index written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,42 @@
 import numpy as np
 import pickle as pkl
-import tensorflow as tf
-from tensorflow.keras.applications.resnet50 import ResNet50, preprocess_input
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.layers import GlobalMaxPool2D
 import os
-from numpy.linalg import norm
+from image_loader import load_image
+from backbones import get_backbone, write_meta
 
-# Load all image filenames from the dataset
-filenames = [os.path.join("images", file) for file in os.listdir("images") if file.endswith(".jpg")]
+# Feature extractor (BACKBONE environment variable, see backbones.py; ResNet50 by default)
+backbone = get_backbone()
 
-# Load ResNet50 model
-model = ResNet50(weights="imagenet", include_top=False, input_shape=(224, 224, 3))
-model.trainable = False
-model = tf.keras.models.Sequential([model, GlobalMaxPool2D()])
+# Load all image filenames from the dataset (including .jpeg/.png items added through the admin API)
+filenames = [os.path.join("images", file) for file in os.listdir("images") if file.lower().endswith((".jpg", ".jpeg", ".png"))]
+
+# Load the model
+model = backbone.build()
+print(f"Extracting {backbone.dim}-d features with {backbone.version}")
 
 # Feature extraction function
 def extract_features_from_images(image_path, model):
     try:
-        img = image.load_img(image_path, target_size=(224, 224))
-        img_array = image.img_to_array(img)
-        img_expand_dim = np.expand_dims(img_array, axis=0)
-        img_preprocess = preprocess_input(img_expand_dim)
-        result = model.predict(img_preprocess).flatten()
-        norm_result = result / norm(result)
-        return norm_result
+        # Decodes JPEGs at reduced scale and applies EXIF orientation
+        img_array = load_image(image_path, backbone.target_size)
+        return backbone.extract(model, img_array)
     except Exception as e:
         print(f"Error processing {image_path}: {e}")
         return None
 
 # Extract features for all images
 image_features = []
+valid_filenames = []
 for file in filenames:
     features = extract_features_from_images(file, model)
     if features is not None:
         image_features.append(features)
+        valid_filenames.append(file)
 
-# Save to pickle files
-pkl.dump(filenames, open("filenames.pkl", "wb"))
-pkl.dump(image_features, open("Images_features.pkl", "wb"))
+# Save to the backbone's feature store
+os.makedirs(backbone.store_dir, exist_ok=True)
+pkl.dump(valid_filenames, open(backbone.path("filenames.pkl"), "wb"))
+pkl.dump(image_features, open(backbone.path("Images_features.pkl"), "wb"))
+write_meta(backbone, len(image_features))
 
-print("Preprocessing complete. Files saved: filenames.pkl, Images_features.pkl")
\ No newline at end of file
+print(f"Preprocessing complete. Files saved in {backbone.store_dir}: filenames.pkl, Images_features.pkl, feature_meta.json")
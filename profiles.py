@@ -0,0 +1,140 @@
+"""
+Per-user taste vectors
+
+The embedding of every upload is folded into a running centroid kept in
+the user_profiles collection, so /api/recommend/personal can recommend
+from a user's whole history without an upload or model inference.
+
+Upload embeddings are stored as float16: they are L2-normalised, so half
+precision loses nothing that matters for nearest-neighbour search and
+halves the document size. The centroid itself is float32, since it is
+updated incrementally and rounding errors would accumulate.
+
+Embeddings of different backbones are not comparable, so profiles record
+the feature version they were built with (see backbones.py). A profile of
+another version is started afresh on the next upload and is not used for
+recommendations until then.
+"""
+from datetime import datetime
+
+import numpy as np
+from bson.binary import Binary
+from pymongo.errors import DuplicateKeyError
+
+import database
+from backbones import BACKBONES, DEFAULT_BACKBONE, active_backbone
+from database import user_profiles_collection
+
+EMBEDDING_DTYPE = "<f2"
+TASTE_DTYPE = "<f4"
+# Attempts at the compare-and-set update before giving up on a concurrent writer
+UPDATE_RETRIES = 5
+# Version of profiles and uploads saved before feature versions were recorded
+LEGACY_FEATURE_VERSION = BACKBONES[DEFAULT_BACKBONE].version
+
+
+def pack_vector(vector, dtype=EMBEDDING_DTYPE):
+    """Vector as BSON binary of the given little-endian dtype"""
+    return Binary(np.asarray(vector, dtype=dtype).tobytes())
+
+
+def unpack_vector(stored, dtype=EMBEDDING_DTYPE):
+    """float32 vector from pack_vector output"""
+    return np.frombuffer(bytes(stored), dtype=dtype).astype(np.float32)
+
+
+def update_taste(user_id, embedding, remove=False, feature_version=None):
+    """
+    Add an upload's embedding to the user's taste vector, or take it out again
+
+    The centroid is updated with a compare-and-set on a version field, so
+    concurrent uploads in other workers are never lost.
+
+    Args:
+        user_id (str): User ID
+        embedding (array): Upload embedding
+        remove (bool, optional): Remove the embedding (the upload was deleted). Defaults to False.
+        feature_version (str, optional): Version of the embedding. Defaults to the active backbone's.
+
+    Returns:
+        int: Number of uploads in the taste vector afterwards
+    """
+    embedding = np.asarray(embedding, dtype=np.float32)
+    feature_version = feature_version or active_backbone.version
+    for _ in range(UPDATE_RETRIES):
+        profile = user_profiles_collection.find_one({"user_id": user_id})
+
+        if profile is None:
+            if remove:
+                return 0
+            try:
+                user_profiles_collection.insert_one({
+                    "user_id": user_id,
+                    "taste": pack_vector(embedding, TASTE_DTYPE),
+                    "count": 1,
+                    "version": 1,
+                    "feature_version": feature_version,
+                    "updated_at": datetime.utcnow()
+                })
+                return 1
+            except (DuplicateKeyError, database.DuplicateKeyError):
+                # Another worker created the profile first
+                continue
+
+        count = profile["count"]
+        taste = unpack_vector(profile["taste"], TASTE_DTYPE)
+        if profile.get("feature_version", LEGACY_FEATURE_VERSION) != feature_version:
+            if remove:
+                # The embedding is not part of this profile
+                return count
+            # Another backbone's centroid can't be averaged with this embedding: start over
+            taste, count = embedding, 1
+        elif remove:
+            if count <= 1:
+                user_profiles_collection.delete_one({"user_id": user_id, "version": profile["version"]})
+                return 0
+            taste = (taste * count - embedding) / (count - 1)
+            count -= 1
+        else:
+            # Running mean: c' = c + (x - c) / (n + 1)
+            taste += (embedding - taste) / (count + 1)
+            count += 1
+
+        result = user_profiles_collection.update_one(
+            {"user_id": user_id, "version": profile["version"]},
+            {"$set": {
+                "taste": pack_vector(taste, TASTE_DTYPE),
+                "count": count,
+                "version": profile["version"] + 1,
+                "feature_version": feature_version,
+                "updated_at": datetime.utcnow()
+            }}
+        )
+        if result.matched_count:
+            return count
+
+    print(f"Warning: Could not update taste vector of user {user_id} (concurrent updates)")
+    return None
+
+
+def get_taste(user_id, feature_version=None):
+    """
+    The user's taste vector, normalised like an upload embedding
+
+    Args:
+        user_id (str): User ID
+        feature_version (str, optional): Version the vector must have. Defaults to the active backbone's.
+
+    Returns:
+        tuple: (vector, number of uploads), or (None, 0) without upload history of that version
+    """
+    profile = user_profiles_collection.find_one({"user_id": user_id})
+    if not profile or not profile.get("count"):
+        return None, 0
+    if profile.get("feature_version", LEGACY_FEATURE_VERSION) != (feature_version or active_backbone.version):
+        return None, 0
+    taste = unpack_vector(profile["taste"], TASTE_DTYPE)
+    length = np.linalg.norm(taste)
+    if length == 0:
+        return None, 0
+    return taste / length, profile["count"]
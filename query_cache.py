@@ -0,0 +1,126 @@
+"""
+Semantic cache of recommendation lists, keyed on query embeddings.
+
+Two photos of the same garment never share bytes, but their embeddings are
+almost identical. Each embedding is hashed to an LSH bucket (signs of its
+projections onto LSH_PLANES random hyperplanes); a lookup compares the
+query with the cached embeddings in its bucket and in the buckets one bit
+away, and reuses the recommendations of the nearest one if it is within
+QUERY_CACHE_SIMILARITY cosine similarity. Entries are evicted least
+recently used beyond QUERY_CACHE_SIZE.
+
+`python evaluate.py --query-cache` measures the hit rate and the quality of
+cached against freshly searched results.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', '2048'))
+# Cosine similarity at which a cached query's recommendations are reused
+QUERY_CACHE_SIMILARITY = float(os.getenv('QUERY_CACHE_SIMILARITY', '0.98'))
+# Few planes keep near-identical queries in the same or an adjacent bucket
+LSH_PLANES = 8
+LSH_SEED = 0
+
+
+class SemanticCache:
+    """Bounded LRU cache of recommendation lists for nearby embeddings"""
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE, similarity=QUERY_CACHE_SIMILARITY, planes=LSH_PLANES,
+                 seed=LSH_SEED):
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.planes = planes
+        self.seed = seed
+        self.hyperplanes = None
+        self.entries = OrderedDict()   # id -> (float16 unit vector, bucket, recommendations)
+        self.buckets = {}              # bucket -> set of entry ids
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _bucket(self, vector):
+        if self.hyperplanes is None or self.hyperplanes.shape[1] != len(vector):
+            # Created on first use, when the embedding size is known
+            rng = np.random.default_rng(self.seed)
+            self.hyperplanes = rng.standard_normal((self.planes, len(vector))).astype(np.float32)
+        bits = self.hyperplanes @ vector > 0
+        return int(bits @ (1 << np.arange(self.planes, dtype=np.int64)))
+
+    def _probes(self, bucket):
+        yield bucket
+        for bit in range(self.planes):
+            yield bucket ^ (1 << bit)
+
+    @staticmethod
+    def _normalise(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        length = np.linalg.norm(vector)
+        return vector / length if length else vector
+
+    def get(self, vector):
+        """
+        Recommendations cached for a query within the similarity radius
+
+        Args:
+            vector (array): Query embedding
+
+        Returns:
+            list: The cached recommendations, or None on a miss
+        """
+        vector = self._normalise(vector)
+        with self.lock:
+            bucket = self._bucket(vector)
+            candidates = [entry_id for probe in self._probes(bucket) for entry_id in self.buckets.get(probe, ())]
+            if candidates:
+                cached = np.stack([self.entries[entry_id][0] for entry_id in candidates]).astype(np.float32)
+                similarities = cached @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity:
+                    entry_id = candidates[best]
+                    self.entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return list(self.entries[entry_id][2])
+            self.misses += 1
+            return None
+
+    def put(self, vector, recommendations):
+        """
+        Cache the recommendations of a query
+
+        Args:
+            vector (array): Query embedding
+            recommendations (list): Its recommendations
+        """
+        vector = self._normalise(vector)
+        with self.lock:
+            bucket = self._bucket(vector)
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = (vector.astype(np.float16), bucket, list(recommendations))
+            self.buckets.setdefault(bucket, set()).add(entry_id)
+            while len(self.entries) > self.max_entries:
+                old_id, (_, old_bucket, _) = self.entries.popitem(last=False)
+                self.buckets[old_bucket].discard(old_id)
+                if not self.buckets[old_bucket]:
+                    del self.buckets[old_bucket]
+
+    def clear(self):
+        """Drop every entry (e.g. when the catalogue index changes)"""
+        with self.lock:
+            self.entries.clear()
+            self.buckets.clear()
+
+    def stats(self):
+        """Entry count, hits, misses and hit rate"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+query_cache = SemanticCache()
@@ -0,0 +1,258 @@
+"""
+Background jobs for multi-analysis PDF reports
+
+A job renders one report covering all of a user's uploads. Jobs run in a
+thread pool inside the app process and write the PDF page by page with
+reports.StreamingReportWriter, so memory stays flat however many uploads
+there are. Job state is kept as small JSON files next to the output, which
+lets any app worker answer progress polls and downloads.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from models import count_user_images, get_queued_user_images, get_user_images_page
+from reports import FOOTER_Y, MAX_THUMBNAILS, PAGE_MARGIN, THUMBNAIL_GAP, StreamingReportWriter, collect_thumbnails
+
+REPORT_JOB_DIR = os.getenv('REPORT_JOB_DIR', os.path.join('cache', 'report_jobs'))
+REPORT_JOB_WORKERS = int(os.getenv('REPORT_JOB_WORKERS', '2'))
+# Finished jobs (and their PDFs) are deleted after this many seconds
+REPORT_JOB_TTL = int(os.getenv('REPORT_JOB_TTL', str(24 * 3600)))
+# Uploads fetched from the database per query
+BATCH_SIZE = 100
+# Progress is saved every this many analyses
+PROGRESS_INTERVAL = 50
+
+# Thumbnail strip of each analysis (mm)
+STRIP_THUMBNAIL = (22, 29)
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+def _analysis_lines(number, image):
+    """(element, text) pairs for one analysis, with y relative to the block"""
+    uploaded_at = image.get("uploaded_at")
+    if isinstance(uploaded_at, datetime):
+        uploaded_at = uploaded_at.strftime('%Y-%m-%d %H:%M')
+    lines = [
+        (("heading", 0, 8, "B", 12, "", None),
+         f"{number}. {image.get('category', 'Fashion Item')} - {image.get('filename', '')}"),
+        (("uploaded_at", 8, 6, "I", 10, "", None), f"Uploaded: {uploaded_at or 'unknown'}"),
+    ]
+    y = 14
+    recommendations = image.get("recommendations") or []
+    if not recommendations:
+        lines.append((("none", y, 6, "", 10, "", None), "No recommendations"))
+    for i, rec in enumerate(recommendations):
+        lines.append(((f"recommendation_{i}", y, 6, "", 10, "", None),
+                      f"   {i+1}. {rec.get('category', 'Fashion Item')} (Confidence: {rec.get('confidence', 0)}%)"))
+        y += 6
+    return lines
+
+
+def write_user_report(path, images, total=None, include_images=True, title="Style Analysis History",
+                      on_progress=None):
+    """
+    Write a report covering many analyses, one block per upload
+
+    Args:
+        path (str): Output file
+        images (iterable): Upload documents as returned by get_user_images
+        total (int, optional): Number of uploads, printed on the first page. Defaults to None.
+        include_images (bool, optional): Show recommendation thumbnails. Defaults to True.
+        title (str, optional): Report title. Defaults to "Style Analysis History".
+        on_progress (callable, optional): Called with the number of analyses written. Defaults to None.
+
+    Returns:
+        tuple: (analyses written, pages written)
+    """
+    with StreamingReportWriter(path, title) as writer:
+        def new_page():
+            writer.add_page()
+            writer.draw(("footer", FOOTER_Y, 10, "I", 10, "C", None),
+                        f"Fashion Recommendation System - Page {writer.page_count}")
+
+        new_page()
+        writer.draw(("title", 10, 10, "B", 16, "C", None), title)
+        summary = f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+        if total is not None:
+            summary += f" - {total} analyses"
+        writer.draw(("generated_on", 20, 10, "", 12, "C", None), summary)
+        y = 35
+
+        count = 0
+        for count, image in enumerate(images, 1):
+            lines = _analysis_lines(count, image)
+            thumbnails = collect_thumbnails(image.get("recommendations") or []) if include_images else []
+            strip = STRIP_THUMBNAIL[1] + 2 if thumbnails else 0
+            height = lines[-1][0][1] + lines[-1][0][2] + strip + 4
+
+            if y + height > FOOTER_Y - 2:
+                new_page()
+                y = PAGE_MARGIN
+
+            for element, text in lines[:2]:
+                writer.draw((element[0], y + element[1]) + element[2:], text)
+            for slot, name, info in thumbnails[:MAX_THUMBNAILS]:
+                box_w, box_h = STRIP_THUMBNAIL
+                scale = min(box_w / info["w"], box_h / info["h"])
+                w, h = info["w"] * scale, info["h"] * scale
+                x = PAGE_MARGIN + 4 + slot * (box_w + THUMBNAIL_GAP) + (box_w - w) / 2
+                writer.image(name, info, x, y + 14 + (box_h - h) / 2, w, h)
+            for element, text in lines[2:]:
+                writer.draw((element[0], y + element[1] + strip) + element[2:], text)
+            y += height
+
+            if on_progress and count % PROGRESS_INTERVAL == 0:
+                on_progress(count)
+
+        if count == 0:
+            writer.draw(("empty", 35, 10, "", 12, "", None), "No analyses yet.")
+        pages = writer.page_count
+    return count, pages
+
+
+def iter_user_images(user_id, batch_size=BATCH_SIZE):
+    """
+    Yield all of a user's uploads, newest first, one database page at a time
+
+    Each page continues after the last upload read, so uploads and deletions
+    while the job runs don't shift the pages.
+    """
+    # Queued uploads are newer than anything stored; one flushed meanwhile is skipped below
+    queued = get_queued_user_images(user_id)
+    yield from queued
+    seen = {image["_id"] for image in queued}
+    after = None
+    while True:
+        batch, after = get_user_images_page(user_id, batch_size, after)
+        yield from (image for image in batch if image["_id"] not in seen)
+        if len(batch) < batch_size:
+            return
+
+
+class ReportJobs:
+    """Queue of report jobs rendered by a background thread pool"""
+
+    def __init__(self, job_dir=REPORT_JOB_DIR, workers=REPORT_JOB_WORKERS, ttl=REPORT_JOB_TTL):
+        self.job_dir = job_dir
+        self.workers = workers
+        self.ttl = ttl
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _state_path(self, job_id):
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def output_path(self, job_id):
+        """Where the finished PDF of a job is stored"""
+        return os.path.join(self.job_dir, f"{job_id}.pdf")
+
+    def _save(self, job):
+        os.makedirs(self.job_dir, exist_ok=True)
+        job["updated_at"] = time.time()
+        fd, tmp_path = tempfile.mkstemp(dir=self.job_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._state_path(job["id"]))
+
+    def get(self, job_id):
+        """
+        Current state of a job
+
+        Args:
+            job_id (str): Job ID
+
+        Returns:
+            dict: Job state or None if the job does not exist
+        """
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._state_path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def submit(self, user_id, include_images=True):
+        """
+        Queue a report covering all uploads of a user
+
+        Args:
+            user_id (str): User ID
+            include_images (bool, optional): Show recommendation thumbnails. Defaults to True.
+
+        Returns:
+            dict: The new job's state
+        """
+        self.cleanup()
+        job = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "status": PENDING,
+            "include_images": include_images,
+            "total": None,
+            "done": 0,
+            "pages": 0,
+            "size": None,
+            "error": None,
+            "created_at": time.time(),
+        }
+        self._save(job)
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="report-job")
+        self._executor.submit(self._run, dict(job))
+        return job
+
+    def _run(self, job):
+        output_path = self.output_path(job["id"])
+        partial_path = output_path + ".part"
+        try:
+            job.update(status=RUNNING, total=count_user_images(job["user_id"]))
+            self._save(job)
+
+            def on_progress(done):
+                job["done"] = done
+                self._save(job)
+
+            done, pages = write_user_report(partial_path, iter_user_images(job["user_id"]), job["total"],
+                                            job["include_images"], on_progress=on_progress)
+            os.replace(partial_path, output_path)
+            job.update(status=DONE, done=done, pages=pages, size=os.path.getsize(output_path))
+            print(f"Report job {job['id']}: {done} analyses, {pages} pages, {job['size']} bytes")
+        except Exception as e:
+            print(f"Report job {job['id']} failed: {e}")
+            job.update(status=FAILED, error=str(e))
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        self._save(job)
+
+    def cleanup(self):
+        """Delete jobs (and their PDFs) not updated within the TTL"""
+        if not os.path.isdir(self.job_dir):
+            return
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.job_dir):
+            path = os.path.join(self.job_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool (used by tests and benchmarks)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait)
+
+
+report_jobs = ReportJobs()
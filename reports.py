@@ -0,0 +1,567 @@
+"""
+PDF style analysis reports
+
+The static part of the page (titles, headings, fixed tips, footer) is
+rendered once per layout into a PDF content fragment, and each report only
+draws its variable fields on top of it. Rendered reports are kept in a
+bounded LRU cache keyed by a hash of (recommendations, category, style),
+so repeated downloads of the same analysis are served without rendering.
+
+Recommendation thumbnails come from the image variant cache (small JPEGs,
+never the full-resolution originals) and their parsed image data is shared
+between reports, so each distinct thumbnail is read and parsed only once.
+"""
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+
+from PIL import Image
+
+from image_variants import variant_cache
+
+try:
+    from fpdf import FPDF
+    from fpdf.fonts import fpdf_charwidths
+except ImportError:
+    FPDF = None
+    fpdf_charwidths = {}
+    print("FPDF library not installed. PDF reports will not be available.")
+    print("To install: pip install fpdf")
+
+REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', '128'))
+# Recommendations that fit on the single report page
+MAX_RECOMMENDATIONS = 15
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Thumbnails: a strip of up to MAX_THUMBNAILS images above the list, taken
+# from the REPORT_THUMBNAIL_WIDTH px JPEG variants of images/
+REPORT_IMAGE_DIR = os.getenv('REPORT_IMAGE_DIR', 'images')
+REPORT_THUMBNAIL_WIDTH = 100
+REPORT_MAX_BYTES = int(os.getenv('REPORT_MAX_BYTES', str(256 * 1024)))
+THUMBNAIL_CACHE_SIZE = int(os.getenv('THUMBNAIL_CACHE_SIZE', '2048'))
+MAX_THUMBNAILS = 5
+# The thumbnail strip pushes the list down, leaving room for fewer lines
+MAX_RECOMMENDATIONS_WITH_IMAGES = 10
+THUMBNAIL_BOX = (34, 45)  # mm
+THUMBNAIL_GAP = 5
+# Room reserved for the text part of a report when applying REPORT_MAX_BYTES
+TEXT_OVERHEAD_BYTES = 4 * 1024
+
+FONT_FAMILY = "Arial"
+# Registered in this order on every document so the compiled fragment's
+# font references (/F1, /F2, ...) stay valid
+FONT_STYLES = ("B", "", "I")
+FOOTER_Y = 277
+
+STYLE_TIPS = [
+    "1. {category} items work well with complementary accessories.",
+    "2. Consider pairing with similar styled items for a cohesive look.",
+    "3. This style works well for both casual and formal occasions.",
+]
+
+
+class ReportLayout:
+    """
+    Compiled page layout for a given number of recommendations
+
+    Elements are (name, y, height, style, size, align, text) tuples; those
+    with fixed text are drawn once at compile time and kept as raw page
+    content, the rest are filled per report.
+    """
+
+    def __init__(self, recommendation_count, thumbnails=False):
+        self.recommendation_count = recommendation_count
+        self.thumbnails = thumbnails
+        self.elements = self._elements(recommendation_count, thumbnails)
+        self.variable = [element for element in self.elements if element[6] is None]
+
+        pdf = self._new_document()
+        start = len(pdf.pages[pdf.page])
+        for element in self.elements:
+            if element[6] is not None:
+                self._draw(pdf, element, element[6])
+        self.static_content = pdf.pages[pdf.page][start:]
+
+    @staticmethod
+    def _elements(count, thumbnails):
+        elements = [
+            ("title", 10, 10, "B", 16, "C", "Fashion Style Analysis Report"),
+            ("generated_on", 20, 10, "", 12, "C", None),
+            ("analyzed_heading", 30, 10, "B", 14, "", "Analyzed Item"),
+            ("category", 40, 10, "", 12, "", None),
+            ("style", 50, 10, "", 12, "", None),
+            ("recommendations_heading", 60, 15, "B", 14, "", "Recommended Similar Items"),
+        ]
+        y = 75
+        if thumbnails:
+            y += THUMBNAIL_BOX[1] + THUMBNAIL_GAP
+        for i in range(count):
+            elements.append((f"recommendation_{i}", y, 10, "", 12, "", None))
+            y += 10
+
+        elements.append(("tips_heading", y, 15, "B", 14, "", "Style Tips"))
+        y += 15
+        for i, tip in enumerate(STYLE_TIPS):
+            # Tips that mention the category are filled per report
+            elements.append((f"tip_{i}", y, 10, "", 12, "", None if "{category}" in tip else tip))
+            y += 10
+
+        elements.append(("footer", FOOTER_Y, 10, "I", 10, "C", "Fashion Recommendation System - www.fashionrec.ai"))
+        return elements
+
+    @staticmethod
+    def _new_document():
+        pdf = FPDF()
+        pdf.set_title("Fashion Style Analysis Report")
+        pdf.add_page()
+        pdf.set_auto_page_break(False)
+        for style in FONT_STYLES:
+            pdf.set_font(FONT_FAMILY, style, 12)
+        return pdf
+
+    @staticmethod
+    def _draw(pdf, element, text):
+        _, y, height, style, size, align, _ = element
+        pdf.set_font(FONT_FAMILY, style, size)
+        pdf.set_xy(pdf.l_margin, y)
+        pdf.cell(0, height, text, 0, 0, align)
+
+    def render(self, fields, thumbnails=()):
+        """
+        Draw a report from the compiled static content and the variable fields
+
+        Args:
+            fields (dict): Text for every variable element, by name
+            thumbnails (list, optional): (slot, name, image info) from collect_thumbnails. Defaults to ().
+
+        Returns:
+            bytes: PDF document
+        """
+        pdf = self._new_document()
+        # FPDF 1.7 keeps each page's content as a string in pdf.pages
+        pdf.pages[pdf.page] += self.static_content
+        # The fragment changed the font behind FPDF's back, so force the next
+        # set_font call to re-select it
+        pdf.font_family = ""
+        for element in self.variable:
+            self._draw(pdf, element, fields.get(element[0], ""))
+
+        box_w, box_h = THUMBNAIL_BOX
+        for slot, name, info in (thumbnails if self.thumbnails else ()):
+            # Register the already parsed image so FPDF neither re-reads nor
+            # re-parses it; _putimages() drops 'data' from its own copy. A
+            # repeated item reuses its registration, so its /I number stays valid
+            if name not in pdf.images:
+                pdf.images[name] = dict(info, i=len(pdf.images) + 1)
+            scale = min(box_w / info["w"], box_h / info["h"])
+            w, h = info["w"] * scale, info["h"] * scale
+            x = pdf.l_margin + slot * (box_w + THUMBNAIL_GAP) + (box_w - w) / 2
+            pdf.image(name, x, 75 + (box_h - h) / 2, w, h)
+
+        return pdf.output(dest="S").encode("latin-1")
+
+
+@lru_cache(maxsize=None)
+def compile_layout(recommendation_count, thumbnails=False):
+    """Compiled layout for a number of recommendations, built once and shared"""
+    return ReportLayout(recommendation_count, thumbnails)
+
+
+class ThumbnailStore:
+    """
+    Parsed report thumbnails shared by every report (bounded LRU)
+
+    Each entry holds the FPDF image info for one pre-shrunk JPEG variant,
+    with the JPEG bytes kept as the latin-1 string FPDF writes verbatim.
+    """
+
+    def __init__(self, image_dir=REPORT_IMAGE_DIR, max_entries=THUMBNAIL_CACHE_SIZE, cache=variant_cache):
+        self.image_dir = image_dir
+        self.max_entries = max_entries
+        self.cache = cache
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """
+        Image info for a catalogue item's thumbnail
+
+        Args:
+            filename (str): Catalogue filename (e.g. "10000.jpg")
+
+        Returns:
+            tuple: (image name, FPDF image info dict) or None if there is no usable image
+        """
+        source_path = os.path.join(self.image_dir, os.path.basename(str(filename)))
+        if not os.path.isfile(source_path):
+            return None
+
+        try:
+            variant_path, etag, _ = self.cache.get(source_path, REPORT_THUMBNAIL_WIDTH, "jpeg")
+        except Exception as e:
+            print(f"Could not create report thumbnail for {source_path}: {e}")
+            return None
+
+        with self._lock:
+            info = self._entries.get(etag)
+            if info is not None:
+                self._entries.move_to_end(etag)
+                return etag, info
+
+        with Image.open(variant_path) as img:
+            width, height = img.size
+            colour_space = {"L": "DeviceGray", "CMYK": "DeviceCMYK"}.get(img.mode, "DeviceRGB")
+        with open(variant_path, "rb") as f:
+            data = f.read().decode("latin-1")
+        info = {"w": width, "h": height, "cs": colour_space, "bpc": 8, "f": "DCTDecode", "data": data}
+
+        with self._lock:
+            self._entries[etag] = info
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag, info
+
+
+thumbnail_store = ThumbnailStore()
+
+
+def collect_thumbnails(recommendations, max_bytes=REPORT_MAX_BYTES):
+    """
+    Thumbnails for the first recommendations, within the report size cap
+
+    Args:
+        recommendations (list): Recommendation dicts with a filename
+        max_bytes (int, optional): Output size cap for the report. Defaults to REPORT_MAX_BYTES.
+
+    Returns:
+        list: (slot, image name, image info) tuples; the slot is the
+            recommendation's position, so an item without an image leaves a gap
+    """
+    budget = max_bytes - TEXT_OVERHEAD_BYTES
+    thumbnails = []
+    for slot, rec in enumerate(recommendations[:MAX_THUMBNAILS]):
+        thumbnail = thumbnail_store.get(rec.get("filename", ""))
+        if thumbnail is None:
+            continue
+        name, info = thumbnail
+        if len(info["data"]) > budget:
+            break
+        budget -= len(info["data"])
+        thumbnails.append((slot, name, info))
+    return thumbnails
+
+
+def _latin1(value):
+    """The core PDF fonts only cover latin-1"""
+    return str(value).encode("latin-1", "replace").decode("latin-1")
+
+
+def render_report(recommendations, category, style, generated_on=None, include_images=False):
+    """
+    Render a report from the compiled layout
+
+    Args:
+        recommendations (list): Recommendation dicts with category and confidence
+        category (str): Category of the analysed item
+        style (str): Detected style
+        generated_on (datetime, optional): Timestamp printed on the report. Defaults to now.
+        include_images (bool, optional): Embed recommendation thumbnails. Defaults to False.
+
+    Returns:
+        bytes: PDF document
+    """
+    if FPDF is None:
+        raise RuntimeError("FPDF library not installed")
+
+    recommendations = recommendations[:MAX_RECOMMENDATIONS]
+    thumbnails = collect_thumbnails(recommendations) if include_images else []
+    if thumbnails:
+        recommendations = recommendations[:MAX_RECOMMENDATIONS_WITH_IMAGES]
+    generated_on = generated_on or datetime.now()
+
+    fields = {
+        "generated_on": f"Generated on: {generated_on.strftime('%Y-%m-%d %H:%M')}",
+        "category": _latin1(f"Category: {category}"),
+        "style": _latin1(f"Detected Style: {style}"),
+    }
+    for i, rec in enumerate(recommendations):
+        fields[f"recommendation_{i}"] = _latin1(
+            f"{i+1}. {rec.get('category', 'Fashion Item')} (Confidence: {rec.get('confidence', 0)}%)")
+    for i, tip in enumerate(STYLE_TIPS):
+        if "{category}" in tip:
+            fields[f"tip_{i}"] = _latin1(tip.format(category=category))
+
+    layout = compile_layout(len(recommendations), bool(thumbnails))
+    return layout.render(fields, thumbnails)
+
+
+def report_key(recommendations, category, style, include_images=False, generated_on=None):
+    """
+    Cache key of a report: a hash of the fields that appear on it
+
+    Args:
+        recommendations (list): Recommendation dicts
+        category (str): Category of the analysed item
+        style (str): Detected style
+        include_images (bool, optional): Whether thumbnails are embedded. Defaults to False.
+        generated_on (datetime, optional): Timestamp printed on the report, to the minute. Defaults to None.
+
+    Returns:
+        str: Hex digest
+    """
+    fields = [[rec.get("filename"), rec.get("category"), rec.get("confidence")]
+              for rec in recommendations[:MAX_RECOMMENDATIONS]]
+    printed_on = generated_on.strftime('%Y-%m-%d %H:%M') if generated_on else None
+    payload = json.dumps([fields, category, style, include_images, printed_on], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """Thread-safe bounded LRU cache of rendered reports"""
+
+    def __init__(self, max_entries=REPORT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+
+report_cache = ReportCache()
+
+
+def generate_pdf_report(recommendations, category, style, include_images=False, generated_on=None):
+    """
+    Return the PDF report for an analysis, rendering it only on a cache miss
+
+    The report prints its generation time to the minute, so a cached report
+    is reused for repeat requests within that minute.
+
+    Args:
+        recommendations (list): Recommendation dicts
+        category (str): Category of the analysed item
+        style (str): Detected style
+        include_images (bool, optional): Embed recommendation thumbnails. Defaults to False.
+        generated_on (datetime, optional): Timestamp printed on the report. Defaults to now.
+
+    Returns:
+        tuple: (PDF bytes, cache key)
+    """
+    generated_on = generated_on or datetime.now()
+    key = report_key(recommendations, category, style, include_images, generated_on)
+    data = report_cache.get(key)
+    if data is None:
+        data = render_report(recommendations, category, style, generated_on, include_images)
+        report_cache.put(key, data)
+    return data, key
+
+
+def stream_bytes(data, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield a document in chunks for a streaming response"""
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+# Streaming writer geometry, matching FPDF's A4 defaults (mm)
+PT_PER_MM = 72 / 25.4
+PAGE_SIZE = (210, 297)
+PAGE_MARGIN = 10
+CELL_MARGIN = 1
+
+# Core fonts by FPDF style: (resource name, base font, width table)
+CORE_FONTS = {
+    "": ("F1", "Helvetica", "helvetica"),
+    "B": ("F2", "Helvetica-Bold", "helveticaB"),
+    "I": ("F3", "Helvetica-Oblique", "helveticaI"),
+}
+
+
+def _pdf_string(text):
+    return _latin1(text).replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+class StreamingReportWriter:
+    """
+    Multi-page PDF report written to a file one page at a time
+
+    FPDF keeps every page of a document in memory until output(), which is
+    fine for the one-page analysis report but not for reports covering
+    thousands of uploads. This writer emits each page's objects as soon as
+    the page is finished and only keeps object offsets, so memory stays flat
+    regardless of the page count. Text uses the same element tuples and
+    core fonts as ReportLayout, and each distinct thumbnail is written once
+    per document and referenced from every page that shows it.
+    """
+
+    # Object numbers reserved for the objects written last
+    PAGES_OBJECT = 1
+    RESOURCES_OBJECT = 2
+
+    def __init__(self, path, title="Fashion Style Analysis Report"):
+        if FPDF is None:
+            raise RuntimeError("FPDF library not installed")
+        self.title = title
+        self.file = open(path, "wb")
+        self.position = 0
+        self.offsets = [None, None]
+        self.page_objects = []
+        self.image_objects = OrderedDict()
+        self.content = None
+        self._write(b"%PDF-1.3\n")
+
+    def _write(self, data):
+        self.file.write(data)
+        self.position += len(data)
+
+    def _begin_object(self, number=None):
+        if number is None:
+            self.offsets.append(self.position)
+            number = len(self.offsets)
+        else:
+            self.offsets[number - 1] = self.position
+        self._write(f"{number} 0 obj\n".encode("latin-1"))
+        return number
+
+    def _object(self, body, number=None):
+        number = self._begin_object(number)
+        self._write(body.encode("latin-1") + b"\nendobj\n")
+        return number
+
+    def _stream_object(self, dictionary, data):
+        number = self._begin_object()
+        self._write(f"<<{dictionary} /Length {len(data)}>>\nstream\n".encode("latin-1"))
+        self._write(data)
+        self._write(b"\nendstream\nendobj\n")
+        return number
+
+    @property
+    def page_count(self):
+        return len(self.page_objects) + (self.content is not None)
+
+    def add_page(self):
+        """Finish the current page (if any) and start a new one"""
+        self._flush_page()
+        self.content = []
+
+    def _flush_page(self):
+        if self.content is None:
+            return
+        data = zlib.compress("\n".join(self.content).encode("latin-1"))
+        contents = self._stream_object("/Filter /FlateDecode", data)
+        self.page_objects.append(self._object(
+            f"<</Type /Page /Parent {self.PAGES_OBJECT} 0 R /Resources {self.RESOURCES_OBJECT} 0 R "
+            f"/Contents {contents} 0 R>>"))
+        self.content = None
+
+    def text_width(self, text, style="", size=12):
+        """Width of a line of text in mm"""
+        widths = fpdf_charwidths[CORE_FONTS[style][2]]
+        return sum(widths.get(char, 0) for char in _latin1(text)) * size / 1000 / PT_PER_MM
+
+    def draw(self, element, text, x=PAGE_MARGIN):
+        """
+        Draw one line of text, placed like FPDF's cell()
+
+        Args:
+            element (tuple): (name, y, height, style, size, align, _) as in ReportLayout
+            text (str): Text to draw
+            x (float, optional): Left edge of the cell in mm. Defaults to PAGE_MARGIN.
+        """
+        _, y, height, style, size, align, _ = element
+        if align == "C":
+            width = PAGE_SIZE[0] - PAGE_MARGIN - x
+            x = x + (width - self.text_width(text, style, size)) / 2
+        else:
+            x += CELL_MARGIN
+        baseline = y + 0.5 * height + 0.3 * size / PT_PER_MM
+        self.content.append(f"BT /{CORE_FONTS[style][0]} {size:.2f} Tf {x * PT_PER_MM:.2f} "
+                            f"{(PAGE_SIZE[1] - baseline) * PT_PER_MM:.2f} Td ({_pdf_string(text)}) Tj ET")
+
+    def image(self, name, info, x, y, w, h):
+        """
+        Place a thumbnail, writing its image object the first time it is used
+
+        Args:
+            name (str): Thumbnail name from ThumbnailStore
+            info (dict): Parsed image info from ThumbnailStore
+            x, y, w, h (float): Placement in mm
+        """
+        if name not in self.image_objects:
+            decode = " /Decode [1 0 1 0 1 0 1 0]" if info["cs"] == "DeviceCMYK" else ""
+            self.image_objects[name] = self._stream_object(
+                f"/Type /XObject /Subtype /Image /Width {info['w']} /Height {info['h']} "
+                f"/ColorSpace /{info['cs']} /BitsPerComponent {info['bpc']} /Filter /{info['f']}{decode}",
+                info["data"].encode("latin-1"))
+        self.content.append(f"q {w * PT_PER_MM:.2f} 0 0 {h * PT_PER_MM:.2f} {x * PT_PER_MM:.2f} "
+                            f"{(PAGE_SIZE[1] - y - h) * PT_PER_MM:.2f} cm /I{self.image_objects[name]} Do Q")
+
+    def close(self):
+        """Write the shared objects, cross-reference table and trailer"""
+        if self.file.closed:
+            return
+        if not self.page_objects and self.content is None:
+            self.add_page()
+        self._flush_page()
+
+        fonts = " ".join(
+            f"/{resource} {self._object(f'<</Type /Font /BaseFont /{base} /Subtype /Type1 /Encoding /WinAnsiEncoding>>')} 0 R"
+            for resource, base, _ in CORE_FONTS.values())
+        images = " ".join(f"/I{number} {number} 0 R" for number in self.image_objects.values())
+        self._object(f"<</ProcSet [/PDF /Text /ImageB /ImageC /ImageI] /Font <<{fonts}>> "
+                     f"/XObject <<{images}>>>>", self.RESOURCES_OBJECT)
+        kids = " ".join(f"{number} 0 R" for number in self.page_objects)
+        self._object(f"<</Type /Pages /Kids [{kids}] /Count {len(self.page_objects)} "
+                     f"/MediaBox [0 0 {PAGE_SIZE[0] * PT_PER_MM:.2f} {PAGE_SIZE[1] * PT_PER_MM:.2f}]>>",
+                     self.PAGES_OBJECT)
+        info = self._object(f"<</Producer (Fashion Recommendation System) /Title ({_pdf_string(self.title)}) "
+                            f"/CreationDate (D:{datetime.now().strftime('%Y%m%d%H%M%S')})>>")
+        catalog = self._object(f"<</Type /Catalog /Pages {self.PAGES_OBJECT} 0 R>>")
+
+        xref = self.position
+        lines = [f"xref\n0 {len(self.offsets) + 1}\n0000000000 65535 f "]
+        lines.extend(f"{offset:010d} 00000 n " for offset in self.offsets)
+        lines.append(f"trailer\n<</Size {len(self.offsets) + 1} /Root {catalog} 0 R /Info {info} 0 R>>")
+        lines.append(f"startxref\n{xref}\n%%EOF\n")
+        self._write("\n".join(lines).encode("latin-1"))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.file.close()
+        return False
@@ -0,0 +1,331 @@
+"""
+The catalogue search index behind an atomically swappable handle.
+
+A SearchIndex bundles everything one version of the feature store serves
+from: the feature matrix and filenames, the rows searched (one per
+near-duplicate cluster), the nearest-neighbour index over them, and the
+pHash, colour and article-type indexes derived from the same catalogue.
+It is never modified after it is built, so a request that took it keeps a
+consistent view however long it runs. The one exception is its delta
+segment of items added and removed online (catalogue_delta.py), whose
+state is replaced whole on every change.
+
+IndexHandle holds the current SearchIndex. Requests lease it for the
+duration of a search; reload() builds a new index in a background thread,
+validates it and swaps it in with one reference assignment. Requests that
+started before the swap finish on the old index, which the handle lets go
+of once its last lease returns. A failed load or validation leaves the
+current index serving. While a reload runs, both indexes are in memory.
+
+Reloads are triggered by the admin endpoint, SIGHUP, or watch() noticing
+the feature store's files change.
+
+Usage (after replacing the feature store, e.g. by re-running preprocess.py):
+    kill -HUP <worker pid>
+    curl -X POST -H "X-Admin-Token: $ADMIN_TOKEN" http://localhost:5000/api/admin/reload-index
+"""
+import os
+import pickle as pkl
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+from backbones import check_store, store_version
+from binary_index import load_binary_index
+from catalogue_delta import DeltaSegment, replay
+from categories import load_article_types
+from colour_index import load_colour_index
+from dedup import SELF_MATCH_DISTANCE, load_clusters
+from phash import load_matcher
+from shard_search import connect_shards
+
+# Seconds between checks of the feature store's modification times (0: don't watch)
+INDEX_WATCH_INTERVAL = float(os.getenv('INDEX_WATCH_INTERVAL', '0'))
+# Files whose change means a new index version
+WATCHED_FILES = ("Images_features.pkl", "filenames.pkl", "feature_meta.json", "clusters.pkl", "binary_index.pkl", "phash_index.pkl",
+                 "colour_index.pkl")
+
+
+class SearchIndex:
+    """One version of the catalogue index (read-only once built, apart from its delta segment)"""
+
+    def __init__(self, features, filenames, rows=None, neighbors=None, catalogue_matcher=None, colour_index=None,
+                 article_positions=None, version=None):
+        self.features = features
+        self.filenames = filenames
+        self.rows = np.arange(len(filenames)) if rows is None else rows
+        self.index_filenames = [filenames[i] for i in self.rows]
+        self.neighbors = neighbors
+        self.catalogue_matcher = catalogue_matcher
+        self.colour_index = colour_index
+        self.article_positions = article_positions or {}
+        self.version = version
+        # Items added and removed online since the store was written (catalogue_delta.py)
+        self.delta = DeltaSegment(filenames, np.shape(features)[-1] if len(features) else 0)
+        self.loaded_at = datetime.utcnow().isoformat()
+        # Set by IndexHandle
+        self.generation = 0
+        self.leases = 0
+
+    def describe(self):
+        return {"generation": self.generation, "version": self.version, "loaded_at": self.loaded_at,
+                "items": len(self.filenames), "searched": len(self.index_filenames),
+                "search": type(self.neighbors).__name__ if self.neighbors is not None else None,
+                "in_flight": self.leases, "delta": self.delta.stats(),
+                "shards": self.neighbors.stats() if hasattr(self.neighbors, "stats") else None}
+
+    def is_removed(self, row):
+        """Whether a catalogue row was removed or replaced since the store was written"""
+        return row in self.delta.state.removed
+
+    def search(self, features, k=5):
+        """
+        Nearest items in the catalogue as mutated: the main index without its
+        removed rows, merged with the items added since
+
+        Removing a cluster representative hides its near-duplicates until
+        the store is compacted and dedup.py re-run.
+
+        Args:
+            features (array): Normalised feature vector
+            k (int, optional): Results. Defaults to 5.
+
+        Returns:
+            list: (distance, filename) pairs, nearest first
+        """
+        state = self.delta.state
+        results = []
+        if len(self.index_filenames):
+            fetch = min(k + len(state.removed), len(self.index_filenames))
+            distances, indices = self.neighbors.kneighbors([features], n_neighbors=fetch)
+            results = [(distance, self.index_filenames[i]) for distance, i in zip(distances[0], indices[0])
+                       if self.rows[i] not in state.removed]
+        if len(state.filenames):
+            distances = np.linalg.norm(state.features - np.asarray(features, dtype=np.float32), axis=1)
+            top = np.argsort(distances, kind="stable")[:k]
+            results += [(distances[i], state.filenames[i]) for i in top]
+        return sorted(results, key=lambda result: result[0])[:k]
+
+
+def store_signature(backbone):
+    """Modification times of the feature store's files, None for missing ones"""
+    signature = []
+    for filename in WATCHED_FILES:
+        try:
+            signature.append(os.path.getmtime(backbone.path(filename)))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def validate(index):
+    """
+    Make sure an index answers queries before it is served
+
+    Raises:
+        ValueError: The files disagree with each other, or a catalogue item
+            is not found at distance zero from itself
+    """
+    if len(index.features) != len(index.filenames):
+        raise ValueError(f"{len(index.features)} feature rows for {len(index.filenames)} filenames")
+    if index.neighbors is None or not len(index.rows):
+        return
+    row = index.rows[0]
+    distances, _ = index.neighbors.kneighbors([np.asarray(index.features[row], dtype=np.float32)], n_neighbors=1)
+    if distances[0][0] > SELF_MATCH_DISTANCE:
+        raise ValueError(f"Smoke query for {os.path.basename(index.filenames[row])} did not find itself "
+                         f"(distance {distances[0][0]:.3f})")
+
+
+def load_search_index(backbone, search_mode="exact"):
+    """
+    Load and validate the feature store of a backbone
+
+    Args:
+        backbone (Backbone): Backbone the app extracts query features with
+        search_mode (str, optional): "exact" (brute-force NearestNeighbors),
+            "binary" (binary_index.py) or "sharded" (shard_search.py). Defaults to "exact".
+
+    Returns:
+        SearchIndex: The index
+
+    Raises:
+        Exception: The files are missing, unreadable or fail validation
+    """
+    # Read first: a store rewritten while loading then looks out of date, not current
+    version = store_version(backbone)
+    with open(backbone.path("Images_features.pkl"), "rb") as f:
+        features = pkl.load(f)
+    with open(backbone.path("filenames.pkl"), "rb") as f:
+        filenames = pkl.load(f)
+    # Query features from another backbone are not comparable with the index
+    check_store(backbone, features)
+
+    # Search one representative per near-duplicate cluster (clusters.pkl, written by dedup.py)
+    clusters = load_clusters(len(filenames), backbone.path("clusters.pkl"))
+    if clusters is not None:
+        rows = clusters["representatives"]
+        print(f"Searching {len(rows)} cluster representatives of {len(filenames)} catalogue items")
+    else:
+        rows = np.arange(len(filenames))
+
+    neighbors = None
+    if search_mode == "sharded":
+        # Shard servers holding slices of the searched rows (shard_search.py); fails the load if they don't match
+        neighbors = connect_shards(version, len(rows))
+    elif search_mode == "binary":
+        # Hamming prefilter with exact re-ranking (binary_index.pkl, written by binary_index.py)
+        neighbors = load_binary_index(features, rows, backbone.path("binary_index.pkl"))
+        if neighbors is not None:
+            print(f"Searching {neighbors.bits}-bit binary codes, re-ranking {neighbors.candidates} candidates")
+    if neighbors is None:
+        neighbors = NearestNeighbors(n_neighbors=6, algorithm="brute", metric="euclidean")
+        neighbors.fit(np.asarray(features)[rows])
+
+    # Perceptual hashes of the catalogue (phash_index.pkl, written by phash.py)
+    catalogue_matcher = load_matcher(len(filenames), backbone.path("phash_index.pkl"))
+    # Cheap signals for degraded recommendations: colour histograms (colour_index.pkl,
+    # written by colour_index.py) and styles.csv article types, both over the searched rows
+    colour_index = load_colour_index(len(filenames), rows, backbone.path("colour_index.pkl"))
+    index_filenames = [filenames[i] for i in rows]
+    article_positions = {}
+    for position, article_type in enumerate(load_article_types(index_filenames) or []):
+        if article_type:
+            article_positions.setdefault(article_type, []).append(position)
+    article_positions = {article_type: np.array(positions) for article_type, positions in article_positions.items()}
+
+    index = SearchIndex(features, filenames, rows, neighbors, catalogue_matcher, colour_index, article_positions,
+                        version)
+    validate(index)
+    # Items added and removed online since the store was written
+    replay(index, backbone)
+    return index
+
+
+class IndexHandle:
+    """The current SearchIndex, swapped atomically and released once drained"""
+
+    def __init__(self, index=None):
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.current = None
+        # Swapped-out indexes with queries still running on them
+        self.draining = []
+        self.generations = 0
+        self.reloads = {"succeeded": 0, "failed": 0}
+        self.last_error = None
+        self.on_swap = []
+        self.watcher = None
+        if index is not None:
+            self.swap(index)
+
+    @contextmanager
+    def lease(self):
+        """The current index, kept loaded until the with block ends"""
+        with self.lock:
+            index = self.current
+            index.leases += 1
+        try:
+            yield index
+        finally:
+            with self.lock:
+                index.leases -= 1
+                if index.leases == 0 and index in self.draining:
+                    self._release(index)
+
+    def _release(self, index):
+        """Let go of a drained index (call with the lock held)"""
+        self.draining.remove(index)
+        print(f"Released index generation {index.generation} ({index.version})")
+
+    def swap(self, index):
+        """
+        Serve a new index from the next lease on
+
+        Args:
+            index (SearchIndex): The new index
+
+        Returns:
+            SearchIndex: The index it replaced, or None
+        """
+        with self.lock:
+            self.generations += 1
+            index.generation = self.generations
+            old, self.current = self.current, index
+            if old is not None:
+                self.draining.append(old)
+                if old.leases == 0:
+                    self._release(old)
+        for callback in self.on_swap:
+            callback(index)
+        return old
+
+    def reload(self, loader, wait=False):
+        """
+        Load a new index in a background thread and swap it in if it loads
+
+        Args:
+            loader (callable): Returns a validated SearchIndex, raises if it can't
+            wait (bool, optional): Block until the reload is done. Defaults to False.
+
+        Returns:
+            bool: False if a reload is already running
+        """
+        if not self.reload_lock.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                began = time.perf_counter()
+                index = loader()
+                self.swap(index)
+                self.reloads["succeeded"] += 1
+                self.last_error = None
+                print(f"Swapped in index generation {index.generation} ({index.version}) "
+                      f"in {time.perf_counter() - began:.1f}s")
+            except Exception as e:
+                self.reloads["failed"] += 1
+                self.last_error = str(e)
+                print(f"Warning: Index reload failed, still serving the current index: {e}")
+            finally:
+                self.reload_lock.release()
+
+        thread = threading.Thread(target=run, name="index-reload", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def reloading(self):
+        return self.reload_lock.locked()
+
+    def watch(self, backbone, loader, interval=INDEX_WATCH_INTERVAL):
+        """
+        Reload when the backbone's feature store changes on disk
+
+        A change is acted on once the modification times are the same on two
+        consecutive checks, so files still being written are not loaded.
+        """
+        if interval <= 0 or self.watcher is not None:
+            return
+
+        def run():
+            loaded = seen = store_signature(backbone)
+            while True:
+                time.sleep(interval)
+                signature = store_signature(backbone)
+                if signature != loaded and signature == seen and self.reload(loader, wait=True):
+                    loaded = signature
+                seen = signature
+
+        self.watcher = threading.Thread(target=run, name="index-watch", daemon=True)
+        self.watcher.start()
+
+    def stats(self):
+        with self.lock:
+            return {"current": self.current.describe(), "draining": [index.describe() for index in self.draining],
+                    "reloading": self.reloading(), "reloads": dict(self.reloads), "last_error": self.last_error}
@@ -0,0 +1,409 @@
+"""
+Sharded nearest-neighbour search with scatter-gather queries.
+
+The searched catalogue rows are split into N shards. Each shard is served
+by its own process, on this machine or another one, holding only its
+slice of the feature matrix. ShardedIndex is the coordinator in the app:
+it sends a query to every shard in parallel, and merges the shards'
+sorted top-k lists into the global top k. A shard that has not answered
+by SHARD_DEADLINE_MS is left out of that query's results (they are then
+the best of the other shards) rather than holding up the request.
+
+Shards talk multiprocessing.connection: pickled requests over TCP,
+authenticated with the shared SHARD_AUTHKEY. Every shard file records
+the store version it was split from, and the app refuses shards of
+another version or shards that don't cover the searched rows.
+
+Usage (after preprocess.py and dedup.py):
+    python shard_search.py split --shards 4
+    SHARD_AUTHKEY=... python shard_search.py serve --shard 0 --shards 4 --port 7100   # one per shard
+    SEARCH_MODE=sharded SHARD_ADDRESSES=host1:7100,host2:7101,... SHARD_AUTHKEY=... gunicorn app:app
+
+    # All shards in child processes on localhost, for development
+    python shard_search.py local --shards 4
+"""
+import argparse
+import heapq
+import multiprocessing
+import os
+import pickle as pkl
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from itertools import islice
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+from backbones import get_backbone, store_version
+
+SHARDS_DIR = "shards"
+# Comma-separated host:port of the shard servers, in any order
+SHARD_ADDRESSES = os.getenv('SHARD_ADDRESSES', '')
+SHARD_AUTHKEY = os.getenv('SHARD_AUTHKEY', '')
+# Longest wait for a shard's answer to one query
+SHARD_DEADLINE_MS = float(os.getenv('SHARD_DEADLINE_MS', '250'))
+# Requests to one shard at once; beyond this a stalled shard is skipped without waiting
+SHARD_MAX_PENDING = 4
+
+
+class ShardsUnavailable(Exception):
+    """No shard answered a query in time"""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.reason = "shards_unavailable"
+
+
+def partition(n_positions, shards):
+    """Positions in the searched rows held by each shard (contiguous, near-equal slices)"""
+    return np.array_split(np.arange(n_positions), shards)
+
+
+def shard_path(directory, shard, shards):
+    return os.path.join(directory, f"shard-{shard}-of-{shards}.pkl")
+
+
+def split(features, rows, shards, version, directory):
+    """
+    Write one file per shard with its slice of the searched rows
+
+    Args:
+        features (array): Catalogue feature matrix
+        rows (np.ndarray): Catalogue rows the app searches (cluster representatives)
+        shards (int): Number of shards
+        version (str): Store version (backbones.store_version)
+        directory (str): Output directory
+
+    Returns:
+        list: Paths of the shard files
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for shard, positions in enumerate(partition(len(rows), shards)):
+        data = {"version": version, "shard": shard, "shards": shards, "positions": positions,
+                "features": np.asarray([features[row] for row in rows[positions]], dtype=np.float32)}
+        paths.append(shard_path(directory, shard, shards))
+        with open(paths[-1], "wb") as f:
+            pkl.dump(data, f)
+    return paths
+
+
+class ShardServer:
+    """Exact search over one shard's slice of the catalogue"""
+
+    def __init__(self, features, positions, version=None, shard=0, shards=1):
+        self.positions = np.asarray(positions)
+        self.neighbors = NearestNeighbors(algorithm="brute", metric="euclidean")
+        self.neighbors.fit(np.asarray(features, dtype=np.float32))
+        self.info = {"version": version, "shard": shard, "shards": shards, "items": len(self.positions)}
+
+    def handle(self, request):
+        """
+        Answer one request
+
+        Args:
+            request (tuple): ("search", queries, k) or ("info",)
+
+        Returns:
+            tuple: (distances, positions) per query row, nearest first, or the shard's info dict
+        """
+        if request[0] == "info":
+            return self.info
+        if request[0] == "search":
+            _, queries, k = request
+            distances, indices = self.neighbors.kneighbors(queries, n_neighbors=min(k, len(self.positions)))
+            return distances, self.positions[indices]
+        raise ValueError(f"Unknown request {request[0]!r}")
+
+    def serve_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    request = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    connection.send(("ok", self.handle(request)))
+                except Exception as e:
+                    connection.send(("error", str(e)))
+
+    def serve(self, listener):
+        """Answer connections on a Listener, one thread each, until the process exits"""
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                # A client with the wrong authkey
+                print(f"Rejected shard connection: {e}")
+                continue
+            threading.Thread(target=self.serve_connection, args=(connection,), daemon=True).start()
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+class ShardedIndex:
+    """NearestNeighbors.kneighbors over shard servers, with a per-query deadline"""
+
+    def __init__(self, addresses, authkey, deadline_ms=SHARD_DEADLINE_MS):
+        self.addresses = [parse_address(a) if isinstance(a, str) else tuple(a) for a in addresses]
+        self.authkey = authkey.encode() if isinstance(authkey, str) else authkey
+        self.deadline = deadline_ms / 1000
+        # Idle connections per shard; a connection carries one request at a time
+        self.idle = [queue.LifoQueue() for _ in self.addresses]
+        # Threads stuck on a stalled shard (e.g. in the connection handshake, which has no
+        # timeout) are bounded by SHARD_MAX_PENDING, so the other shards keep theirs
+        self.executor = ThreadPoolExecutor(max_workers=SHARD_MAX_PENDING * len(self.addresses),
+                                           thread_name_prefix="shard")
+        self.pending = [0] * len(self.addresses)
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.partial = 0
+        self.timeouts = [0] * len(self.addresses)
+        self.errors = [0] * len(self.addresses)
+
+    def call(self, shard, request, deadline):
+        """
+        Send a request to one shard and wait for its answer until a monotonic deadline
+
+        Raises:
+            TimeoutError: The shard did not answer in time
+            Exception: The shard could not be reached or failed the request
+        """
+        try:
+            try:
+                connection = self.idle[shard].get_nowait()
+            except queue.Empty:
+                connection = Client(self.addresses[shard], authkey=self.authkey)
+            try:
+                connection.send(request)
+                if not connection.poll(max(deadline - time.monotonic(), 0)):
+                    raise TimeoutError(f"Shard {shard} did not answer in {self.deadline * 1000:.0f} ms")
+                status, result = connection.recv()
+            except BaseException:
+                # The answer may still arrive; the connection can't be reused
+                connection.close()
+                raise
+            self.idle[shard].put(connection)
+        finally:
+            with self.lock:
+                self.pending[shard] -= 1
+        if status != "ok":
+            raise RuntimeError(f"Shard {shard}: {result}")
+        return result
+
+    def scatter(self, request, deadline_s=None):
+        """Results of a request from the shards that answered in time, in shard order (None for the others)"""
+        deadline = time.monotonic() + (deadline_s or self.deadline)
+        futures = []
+        for shard in range(len(self.addresses)):
+            with self.lock:
+                stalled = self.pending[shard] >= SHARD_MAX_PENDING
+                if not stalled:
+                    self.pending[shard] += 1
+            futures.append(None if stalled else self.executor.submit(self.call, shard, request, deadline))
+        wait([f for f in futures if f is not None], timeout=max(deadline - time.monotonic(), 0) + 0.05)
+        results = []
+        for shard, future in enumerate(futures):
+            try:
+                if future is None:
+                    raise TimeoutError(f"Shard {shard} has {SHARD_MAX_PENDING} requests pending")
+                results.append(future.result(timeout=0))
+            except Exception as e:
+                with self.lock:
+                    if isinstance(e, (TimeoutError, FutureTimeout)):
+                        self.timeouts[shard] += 1
+                    else:
+                        self.errors[shard] += 1
+                results.append(None)
+        return results
+
+    def kneighbors(self, X, n_neighbors=5):
+        """
+        Nearest items across the shards: (distances, positions in the searched rows) per query row
+
+        Raises:
+            ShardsUnavailable: No shard answered in time
+        """
+        queries = np.asarray(X, dtype=np.float32)
+        results = [r for r in self.scatter(("search", queries, n_neighbors)) if r is not None]
+        with self.lock:
+            self.queries += 1
+            if len(results) < len(self.addresses):
+                self.partial += 1
+        if not results:
+            raise ShardsUnavailable(f"None of {len(self.addresses)} shards answered in "
+                                    f"{self.deadline * 1000:.0f} ms")
+
+        distances, positions = [], []
+        for row in range(len(queries)):
+            # Each shard's list is sorted, so merging them keeps the global order
+            merged = list(islice(heapq.merge(*[zip(d[row], p[row]) for d, p in results]), n_neighbors))
+            distances.append([distance for distance, _ in merged])
+            positions.append([position for _, position in merged])
+        return np.array(distances), np.array(positions, dtype=np.int64)
+
+    def check(self, version, n_positions):
+        """
+        Make sure the shards serve this store version and cover the searched rows
+
+        Raises:
+            ValueError: A shard is unreachable, of another version, or missing
+        """
+        infos = self.scatter(("info",), deadline_s=max(self.deadline, 5))
+        for address, info in zip(self.addresses, infos):
+            if info is None:
+                raise ValueError(f"Shard {address[0]}:{address[1]} did not answer")
+            if info["version"] != version:
+                raise ValueError(f"Shard {info['shard']} serves {info['version']}, the store is {version}")
+        shards = {info["shard"] for info in infos}
+        if shards != set(range(infos[0]["shards"])) or sum(info["items"] for info in infos) != n_positions:
+            raise ValueError(f"Shards {sorted(shards)} of {infos[0]['shards']} cover "
+                             f"{sum(info['items'] for info in infos)} of {n_positions} searched items")
+
+    def stats(self):
+        with self.lock:
+            return {"shards": len(self.addresses), "queries": self.queries, "partial": self.partial,
+                    "timeouts": list(self.timeouts), "errors": list(self.errors),
+                    "deadline_ms": self.deadline * 1000}
+
+
+def connect_shards(version, n_positions, addresses=None, authkey=None):
+    """
+    Coordinator for the shard servers in SHARD_ADDRESSES
+
+    Args:
+        version (str): Version of the store the app loaded
+        n_positions (int): Number of searched rows the shards must cover
+        addresses (list, optional): "host:port" strings. Defaults to SHARD_ADDRESSES.
+        authkey (str, optional): Defaults to SHARD_AUTHKEY.
+
+    Returns:
+        ShardedIndex: The coordinator
+
+    Raises:
+        ValueError: No addresses, or the shards don't match the store
+    """
+    addresses = addresses or [a.strip() for a in SHARD_ADDRESSES.split(",") if a.strip()]
+    if not addresses:
+        raise ValueError("SEARCH_MODE=sharded needs SHARD_ADDRESSES")
+    index = ShardedIndex(addresses, authkey or SHARD_AUTHKEY)
+    index.check(version, n_positions)
+    print(f"Searching {n_positions} items on {len(addresses)} shards")
+    return index
+
+
+def serve_local(features, positions, version, shard, shards, authkey, ready):
+    """Child process of LocalShards: serve one shard on an ephemeral localhost port"""
+    server = ShardServer(features, positions, version, shard, shards)
+    listener = Listener(("127.0.0.1", 0), authkey=authkey)
+    ready.send(listener.address)
+    server.serve(listener)
+
+
+class LocalShards:
+    """Shard servers in child processes on localhost, for development and tests"""
+
+    def __init__(self, features, shards=2, version=None, authkey=None):
+        self.authkey = authkey or os.urandom(16)
+        self.processes, self.addresses = [], []
+        # Spawned, not forked: the parent may be a threaded web app
+        context = multiprocessing.get_context("spawn")
+        features = np.asarray(features, dtype=np.float32)
+        try:
+            for shard, positions in enumerate(partition(len(features), shards)):
+                parent, child = context.Pipe()
+                process = context.Process(target=serve_local, daemon=True,
+                                          args=(features[positions], positions, version, shard, shards,
+                                                self.authkey, child))
+                process.start()
+                self.processes.append(process)
+                if not parent.poll(60):
+                    raise RuntimeError(f"Shard {shard} did not start")
+                self.addresses.append(parent.recv())
+        except BaseException:
+            self.close()
+            raise
+
+    def connect(self, deadline_ms=SHARD_DEADLINE_MS):
+        return ShardedIndex(self.addresses, self.authkey, deadline_ms)
+
+    def close(self):
+        for process in self.processes:
+            process.terminate()
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_store(backbone):
+    """Features, searched rows and version of a backbone's store"""
+    from dedup import CLUSTERS_PATH, load_clusters
+    from evaluate import load_index
+
+    version = store_version(backbone)
+    features, filenames = load_index(backbone.path("Images_features.pkl"), backbone.path("filenames.pkl"))
+    clusters = load_clusters(len(filenames), backbone.path(CLUSTERS_PATH))
+    rows = clusters["representatives"] if clusters else np.arange(len(filenames))
+    return features, rows, version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split the catalogue into shards and serve them")
+    parser.add_argument("command", choices=["split", "serve", "local"])
+    parser.add_argument("--backbone", help="Use this backbone's feature store (default: $BACKBONE or resnet50)")
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument("--shard", type=int, help="Shard served by this process (serve)")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (serve)")
+    parser.add_argument("--port", type=int, help="Port to listen on (serve)")
+    parser.add_argument("--directory", help=f"Shard files; defaults to {SHARDS_DIR}/ in the feature store")
+    args = parser.parse_args()
+    backbone = get_backbone(args.backbone)
+    args.directory = args.directory or backbone.path(SHARDS_DIR)
+
+    if args.command == "split":
+        features, rows, version = load_store(backbone)
+        began = time.perf_counter()
+        paths = split(features, rows, args.shards, version, args.directory)
+        print(f"Split {len(rows)} items of {version} into {len(paths)} shards in {time.perf_counter() - began:.1f}s:")
+        for path in paths:
+            print(f"  {path}")
+
+    elif args.command == "serve":
+        if args.shard is None or args.port is None:
+            parser.error("serve needs --shard and --port")
+        if not SHARD_AUTHKEY:
+            parser.error("Set SHARD_AUTHKEY to the secret shared with the app")
+        data = pkl.load(open(shard_path(args.directory, args.shard, args.shards), "rb"))
+        server = ShardServer(data["features"], data["positions"], data["version"], data["shard"], data["shards"])
+        listener = Listener((args.host, args.port), authkey=SHARD_AUTHKEY.encode())
+        print(f"Serving shard {args.shard} of {args.shards} ({len(data['positions'])} items of {data['version']}) "
+              f"on {args.host}:{args.port}")
+        server.serve(listener)
+
+    else:
+        features, rows, version = load_store(backbone)
+        authkey = SHARD_AUTHKEY or os.urandom(8).hex()
+        shards = LocalShards(np.asarray(features, dtype=np.float32)[rows], args.shards, version, authkey.encode())
+        print("Shards running; serve the app with:")
+        print(f"  SEARCH_MODE=sharded SHARD_AUTHKEY={authkey} "
+              f"SHARD_ADDRESSES={','.join(f'{h}:{p}' for h, p in shards.addresses)}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            shards.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import io
+import os
+import threading
+import time
+from PIL import Image
+import app as app_module
+from admission import AdmissionController, Overloaded
+from search_index import SearchIndex
+
+def jpeg(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color=(73, 109, 137)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+def test_queue_limits():
+    print("\n=== Testing inference admission ===")
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.2)
+    controller.acquire()
+    outcome = []
+
+    def waiter():
+        try:
+            with controller.slot():
+                outcome.append("admitted")
+        except Overloaded as e:
+            outcome.append(e.reason)
+
+    # One request waits in the queue; the next is shed at once
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    while controller.stats()["queued"] == 0:
+        time.sleep(0.01)
+    try:
+        controller.acquire()
+        assert False, "A full queue should shed"
+    except Overloaded as e:
+        assert e.reason == "queue_full" and e.retry_after >= 1
+    thread.join()
+    assert outcome == ["timeout"], outcome
+
+    # A freed slot goes to the waiting request
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    while controller.stats()["queued"] == 0:
+        time.sleep(0.01)
+    controller.release()
+    thread.join()
+    assert outcome[-1] == "admitted"
+
+    stats = controller.stats()
+    assert stats["in_flight"] == 0 and stats["queued"] == 0
+    assert stats["admitted"] == 2 and stats["shed"] == {"queue_full": 1, "timeout": 1}
+    print(f"✅ {stats}")
+
+def test_upload_shedding():
+    print("\n=== Testing /upload shedding ===")
+    existing_uploads = set(os.listdir("uploads"))
+    client = app_module.app.test_client()
+    token = client.post("/api/auth/login", json={"username": "test_user", "password": "password123"}).json["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    saved = app_module.admission, app_module.model
+    app_module.admission = AdmissionController(max_concurrent=1, max_queue=0, max_pixels=1000 * 1000)
+    # Never called: the request is shed before inference
+    app_module.model = object()
+    saved_index = app_module.index_handle.swap(SearchIndex([], [], neighbors=object()))
+    try:
+        huge = client.post("/upload", headers=headers, data={"file": (io.BytesIO(jpeg(1200, 1000)), "huge.jpg")})
+        assert huge.status_code == 413, huge.json
+        text = client.post("/upload", headers=headers, data={"file": (io.BytesIO(b"not an image"), "shirt.jpg")})
+        assert text.status_code == 400
+
+        app_module.admission.acquire()
+        busy = client.post("/upload", headers=headers, data={"file": (io.BytesIO(jpeg(320, 240)), "shirt.jpg")})
+        assert busy.status_code == 503
+        assert int(busy.headers["Retry-After"]) >= 1 and busy.json["reason"] == "queue_full"
+        stream = client.post("/upload/stream", headers=headers,
+                             data={"file": (io.BytesIO(jpeg(320, 240)), "shirt.jpg")})
+        assert stream.status_code == 503
+
+        metrics = client.get("/api/metrics").json["admission"]
+        assert metrics["shed"]["queue_full"] == 2 and metrics["in_flight"] == 1
+        assert metrics["rejected"] == {"too_large": 0, "too_many_pixels": 1, "not_an_image": 1}
+        print(f"✅ {metrics}")
+    finally:
+        app_module.admission, app_module.model = saved
+        app_module.index_handle.swap(saved_index)
+        for name in set(os.listdir("uploads")) - existing_uploads:
+            os.remove(os.path.join("uploads", name))
+
+if __name__ == "__main__":
+    test_queue_limits()
+    test_upload_shedding()
@@ -0,0 +1,82 @@
+import asyncio
+import io
+import os
+import cloudinary
+import jwt
+from PIL import Image
+from asgi_app import app, application
+from auth import JWT_SECRET
+from benchmarks.fake_cloudinary import start_fake_cloudinary
+
+UPLOADS = 8
+CDN_LATENCY = 0.5
+
+def test_native_and_fallback_routes():
+    print("\n=== Testing ASGI route dispatch ===")
+    def scope(method, path):
+        return {"type": "http", "method": method, "path": path}
+
+    assert application.is_native(scope("POST", "/upload"))
+    assert application.is_native(scope("GET", "/api/images/abc"))
+    assert not application.is_native(scope("OPTIONS", "/upload")), "Preflight should go to flask_cors"
+    assert not application.is_native(scope("POST", "/generate-report"))
+    assert not application.is_native(scope("GET", "/images/10000.jpg"))
+    print("✅ I/O routes are native, the rest falls back to Flask")
+
+def test_async_upload_flow():
+    print("\n=== Testing async login, upload and history ===")
+    fake_cloudinary = start_fake_cloudinary(latency=CDN_LATENCY)
+    cloudinary.config(upload_prefix=f"http://127.0.0.1:{fake_cloudinary.server_address[1]}")
+    existing_uploads = set(os.listdir("uploads"))
+
+    async def flow():
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            response = await client.post("/api/auth/login", json={"username": "test_user", "password": "password123"})
+            assert response.status_code == 200
+            headers = {"Authorization": f"Bearer {(await response.get_json())['token']}"}
+            assert (await client.post("/api/auth/login", json={"username": "test_user", "password": "nope"})).status_code == 401
+
+            buffer = io.BytesIO()
+            Image.new("RGB", (320, 240), color=(73, 109, 137)).save(buffer, "JPEG")
+
+            async def upload(i):
+                from quart.datastructures import FileStorage
+                files = {"file": FileStorage(io.BytesIO(buffer.getvalue()), filename=f"shirt_{i}.jpg", name="file")}
+                return await client.post("/upload", headers=headers, files=files)
+
+            # Cloudinary waits are overlapped rather than serialised
+            started = asyncio.get_running_loop().time()
+            responses = await asyncio.gather(*(upload(i) for i in range(UPLOADS)))
+            elapsed = asyncio.get_running_loop().time() - started
+            bodies = [await response.get_json() for response in responses]
+            assert all(response.status_code == 200 for response in responses)
+            assert all(body["image_url"].startswith("https://res.cloudinary.test/") for body in bodies)
+            assert elapsed < UPLOADS * CDN_LATENCY / 2, f"Uploads took {elapsed:.2f}s"
+
+            history = await (await client.get("/api/images?limit=50", headers=headers)).get_json()
+            ids = {image["_id"] for image in history["images"]}
+            assert {body["image_id"] for body in bodies} <= ids
+
+            image_id = bodies[0]["image_id"]
+            assert (await client.get(f"/api/images/{image_id}", headers=headers)).status_code == 200
+            assert (await client.delete(f"/api/images/{image_id}", headers=headers)).status_code == 200
+            assert (await client.get(f"/api/images/{image_id}", headers=headers)).status_code == 404
+            assert (await client.get("/api/images")).status_code == 401
+            # A signed token without a user_id is rejected, not a server error
+            no_user = jwt.encode({"exp": 4102444800}, JWT_SECRET, algorithm="HS256")
+            assert (await client.get("/api/images", headers={"Authorization": f"Bearer {no_user}"})).status_code == 401
+            return elapsed
+
+    try:
+        elapsed = asyncio.run(flow())
+        print(f"✅ {UPLOADS} concurrent uploads with {CDN_LATENCY}s CDN latency in {elapsed:.2f}s")
+    finally:
+        cloudinary.config(upload_prefix=None)
+        fake_cloudinary.shutdown()
+        for name in set(os.listdir("uploads")) - existing_uploads:
+            os.remove(os.path.join("uploads", name))
+
+if __name__ == "__main__":
+    test_native_and_fallback_routes()
+    test_async_upload_flow()
@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import numpy as np
+from backbones import BACKBONES, check_store, get_backbone, write_meta
+from profiles import get_taste, update_taste
+
+def expect_refusal(backbone, features):
+    try:
+        check_store(backbone, features)
+    except ValueError as e:
+        return str(e)
+    assert False, f"{backbone.version} should refuse this store"
+
+def test_versioned_stores():
+    print("\n=== Testing versioned feature stores ===")
+    resnet, mobilenet = get_backbone("resnet50"), get_backbone("mobilenet_v3_large")
+    assert get_backbone("resnet50@160").version == "resnet50-160-v1"
+    assert len({backbone.version for backbone in BACKBONES.values()}) == len(BACKBONES)
+    assert mobilenet.path("Images_features.pkl") == os.path.join("features", "mobilenet_v3_large-224-v1",
+                                                                 "Images_features.pkl")
+    working_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        os.chdir(root)
+        try:
+            # The original root store has no metadata and is still accepted
+            check_store(resnet, [np.zeros(2048)])
+            assert "feature_meta.json" in expect_refusal(mobilenet, [np.zeros(960)])
+
+            os.makedirs(mobilenet.store_dir)
+            write_meta(mobilenet, 1)
+            check_store(mobilenet, [np.zeros(960)])
+            assert "2048-d" in expect_refusal(mobilenet, [np.zeros(2048)])
+
+            # A store written by another backbone is refused
+            with open(resnet.path("feature_meta.json"), "w") as f:
+                json.dump({"version": "resnet50-160-v1"}, f)
+            assert "does not match" in expect_refusal(resnet, [np.zeros(2048)])
+        finally:
+            os.chdir(working_dir)
+    print("✅ Mismatched stores are refused")
+
+def test_taste_vector_versions():
+    print("\n=== Testing taste vectors across backbones ===")
+    rng = np.random.default_rng(0)
+    old, new = "resnet50-224-v1", "mobilenet_v3_large-224-v1"
+    update_taste("backbone_user", rng.random(2048), feature_version=old)
+    update_taste("backbone_user", rng.random(2048), feature_version=old)
+    assert get_taste("backbone_user", old)[1] == 2
+    assert get_taste("backbone_user", new) == (None, 0), "Another backbone's taste vector can't be queried"
+
+    embedding = rng.random(960)
+    assert update_taste("backbone_user", embedding, feature_version=new) == 1, "A new backbone starts afresh"
+    taste, count = get_taste("backbone_user", new)
+    assert count == 1 and np.allclose(taste, embedding / np.linalg.norm(embedding), atol=1e-5)
+    # Deleting an upload of the old backbone leaves the new profile alone
+    assert update_taste("backbone_user", rng.random(2048), remove=True, feature_version=old) == 1
+    print("✅ Taste vectors are kept per feature version")
+
+if __name__ == "__main__":
+    test_versioned_stores()
+    test_taste_vector_versions()
@@ -0,0 +1,71 @@
+import os
+import pickle as pkl
+import tempfile
+import numpy as np
+from binary_index import BinaryIndex, build, encode, load_binary_index, measure_recall, popcount
+from evaluate import blocked_neighbors
+
+def clustered_features(n=4000, dim=256, seed=0):
+    """Unit vectors around 40 centres, like catalogue features of 40 product types"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((40, dim))
+    features = centres[rng.integers(0, 40, size=n)] + 0.8 * rng.standard_normal((n, dim))
+    return (features / np.linalg.norm(features, axis=1, keepdims=True)).astype(np.float32)
+
+def test_popcount():
+    print("\n=== Testing packed popcount ===")
+    rng = np.random.default_rng(0)
+    words = rng.integers(0, 2**63, size=1000, dtype=np.int64).astype(np.uint64) * np.uint64(3)
+    assert popcount(words).tolist() == [bin(int(w)).count("1") for w in words]
+
+    # BinaryIndex.hamming (byte-lane SWAR, or popcount on NumPy 2.0+) agrees per code
+    codes = words.reshape(125, 8)
+    index = BinaryIndex(codes, None, None, np.zeros((125, 1)))
+    query = codes[0]
+    expected = [sum(bin(int(w ^ q)).count("1") for w, q in zip(code, query)) for code in codes]
+    assert index.hamming(query).tolist() == expected
+    print("✅ popcount and Hamming distances match bin().count")
+
+def test_binary_search_recall():
+    print("\n=== Testing binary prefilter recall ===")
+    features = clustered_features()
+    rows = np.arange(0, len(features), 2)  # e.g. cluster representatives
+    queries = features[1::2][:200]
+    _, exact, _ = blocked_neighbors(features[rows], queries, 5)
+
+    for method in ("itq", "sign"):
+        data = build(features, rows, bits=256, method=method)
+        assert data["codes"].shape == (len(rows), 4) and data["codes"].dtype == np.uint64
+        index = BinaryIndex(data["codes"], data["mean"], data["projection"], features[rows])
+        report = measure_recall(index, queries, exact, 5, (20, 200, len(rows)))
+        recalls = [result["recall_at_k"] for result in report]
+        assert recalls == sorted(recalls), f"Recall should grow with the candidates: {report}"
+        assert recalls[1] >= 0.8, report
+        assert recalls[2] == 1.0, "Re-ranking every item is exact search"
+        print(f"✅ {method}: {report}")
+
+    # With every item re-ranked, kneighbors is exact search
+    index.candidates = len(rows)
+    distances, indices = index.kneighbors(queries[:3], n_neighbors=5)
+    exact_distances, exact_indices, _ = blocked_neighbors(features[rows], queries[:3], 5)
+    assert np.array_equal(indices, exact_indices)
+    assert np.allclose(distances, exact_distances, atol=1e-4)
+
+def test_load_checks_rows():
+    print("\n=== Testing binary index file ===")
+    features = clustered_features(n=600)
+    rows = np.arange(300)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "binary_index.pkl")
+        with open(path, "wb") as f:
+            pkl.dump(build(features, rows, bits=128, method="itq"), f)
+        index = load_binary_index(features, rows, path)
+        assert index.bits == 128
+        assert np.array_equal(index.codes, encode(features[rows], index.mean, index.projection))
+        assert load_binary_index(features, np.arange(1, 301), path) is None, "Other rows must not load"
+    print("✅ index loads only for the rows it was built for")
+
+if __name__ == "__main__":
+    test_popcount()
+    test_binary_search_recall()
+    test_load_checks_rows()
@@ -0,0 +1,223 @@
+import io
+import os
+import pickle as pkl
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+import app as app_module
+import catalogue_delta
+import contact_sheet
+import middleware
+from catalogue_delta import DERIVED_INDEXES, StaleLog, compact, encode_features, follow, mutate, open_log
+from colour_index import BINS
+from models import pack_recommendations, unpack_recommendations
+from search_index import IndexHandle, load_search_index
+from test_index_reload import TemporaryStore, write_store
+
+def unit(vector):
+    return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+def names(results):
+    return [os.path.basename(filename) for _, filename in results]
+
+def test_delta_segment_and_log():
+    print("\n=== Testing the catalogue delta and its log ===")
+    rng = np.random.default_rng(5)
+    with tempfile.TemporaryDirectory() as directory:
+        backbone = TemporaryStore(directory)
+        write_store(backbone, 20, seed=0)
+        index = load_search_index(backbone)
+        other_worker = load_search_index(backbone)
+        features = np.asarray(index.features)
+
+        added, replacement = unit(rng.random(16)), unit(rng.random(16))
+        mutate(index, backbone, {"op": "upsert", "filename": "20000.jpg", "features": encode_features(added)})
+        mutate(index, backbone, {"op": "delete", "filename": "10003.jpg"})
+        mutate(index, backbone, {"op": "upsert", "filename": "10005.jpg", "features": encode_features(replacement)})
+        assert names(index.search(added, 1)) == ["20000.jpg"]
+        assert "10003.jpg" not in names(index.search(features[3], 20))
+        assert index.search(replacement, 1)[0][0] < 1e-5 and names(index.search(replacement, 1)) == ["10005.jpg"]
+        assert index.search(features[5], 1)[0][0] > 1e-3, "The replaced features are tombstoned"
+        assert not index.delta.contains("10003.jpg") and index.delta.contains("20000.jpg")
+
+        # Another worker catches up from the log; a line still being written waits
+        with open(open_log(backbone).path, "a") as f:
+            f.write('{"op": "delete", "filen')
+        assert other_worker.delta.catch_up(open_log(backbone), other_worker.version) == 3
+        assert names(other_worker.search(added, 1)) == ["20000.jpg"]
+        with open(open_log(backbone).path, "a") as f:
+            f.write('ame": "10007.jpg"}\n')
+        assert other_worker.delta.catch_up(open_log(backbone), other_worker.version) == 1
+        index.delta.catch_up(open_log(backbone), index.version)
+
+        # A restart replays the log
+        restarted = load_search_index(backbone)
+        assert restarted.delta.stats() == {"added": 2, "removed": 3, "mutations": 4}
+        assert names(restarted.search(added, 1)) == ["20000.jpg"]
+
+        # Compaction writes the mutated catalogue as a new store with an empty log
+        version = compact(index, backbone)
+        compacted = load_search_index(backbone)
+        assert compacted.version == version != index.version
+        assert len(compacted.filenames) == 19 and compacted.delta.stats()["mutations"] == 0
+        assert names(compacted.search(added, 1)) == ["20000.jpg"]
+        assert not {"10003.jpg", "10007.jpg"} & set(names(compacted.search(features[3], 19)))
+        try:
+            other_worker.delta.catch_up(open_log(backbone), other_worker.version)
+            assert False, "The old store's log is gone"
+        except StaleLog:
+            pass
+
+        # A store rebuilt by preprocess.py starts a new log
+        mutate(compacted, backbone, {"op": "delete", "filename": "10000.jpg"})
+        write_store(backbone, 20, seed=1)
+        rebuilt = load_search_index(backbone)
+        assert rebuilt.delta.stats()["mutations"] == 0 and open_log(backbone).base() == rebuilt.version
+        print(f"✅ {compacted.describe()}")
+
+def test_compaction_drops_derived_indexes():
+    print("\n=== Testing derived indexes after compaction ===")
+    with tempfile.TemporaryDirectory() as directory:
+        backbone = TemporaryStore(directory)
+        write_store(backbone, 20, seed=0)
+        # One cluster per pair of items, and per-row pHash and colour indexes
+        pkl.dump({"threshold": 0.97, "cluster_ids": np.arange(20) // 2, "representatives": np.arange(0, 20, 2)},
+                 open(backbone.path("clusters.pkl"), "wb"))
+        pkl.dump({"hashes": np.arange(20, dtype=np.uint64)}, open(backbone.path("phash_index.pkl"), "wb"))
+        pkl.dump({"histograms": np.ones((20, BINS), dtype=np.float16)}, open(backbone.path("colour_index.pkl"), "wb"))
+        index = load_search_index(backbone)
+        assert len(index.index_filenames) == 10 and index.catalogue_matcher is not None
+        assert index.colour_index is not None
+
+        # Replacing an item keeps the item count but moves it to the last row
+        replacement = unit(np.random.default_rng(5).random(16))
+        mutate(index, backbone, {"op": "upsert", "filename": "10002.jpg", "features": encode_features(replacement)})
+        compact(index, backbone)
+        compacted = load_search_index(backbone)
+        assert len(compacted.filenames) == 20 and os.path.basename(compacted.filenames[2]) == "10003.jpg"
+        assert len(compacted.index_filenames) == 20, "clusters.pkl points at the old rows"
+        assert compacted.catalogue_matcher is None and compacted.colour_index is None
+        assert not any(os.path.exists(backbone.path(name)) for name in DERIVED_INDEXES)
+        assert os.path.exists(backbone.path("clusters.pkl.stale"))
+        print("✅ Stale derived indexes moved aside")
+
+def test_failed_reload_backs_off():
+    print("\n=== Testing reload backoff after a compaction elsewhere ===")
+    with tempfile.TemporaryDirectory() as directory:
+        backbone = TemporaryStore(directory)
+        write_store(backbone, 20, seed=0)
+        index = load_search_index(backbone)
+        handle = IndexHandle(index)
+        with open_log(backbone).locked():
+            open_log(backbone).start("compacted-elsewhere")
+        attempts = []
+
+        def failing_loader():
+            attempts.append(time.monotonic())
+            raise ValueError("Shards are of another store version")
+
+        saved = catalogue_delta.CATALOGUE_RELOAD_BACKOFF_MAX
+        catalogue_delta.CATALOGUE_RELOAD_BACKOFF_MAX = 0.4
+        try:
+            follow(handle, backbone, failing_loader, interval=0.05)
+            time.sleep(1.5)
+        finally:
+            catalogue_delta.CATALOGUE_RELOAD_BACKOFF_MAX = saved
+        assert handle.current is index
+        # Every 0.05s without backoff; 0.1, 0.2, 0.4, 0.4... with it
+        assert 2 <= len(attempts) <= 6, attempts
+        print(f"✅ {len(attempts)} reload attempts in 1.5s")
+
+class MeanColourModel:
+    """Stands in for the CNN: the mean colour of the image, repeated to 16 features"""
+
+    def predict(self, batch, verbose=0):
+        return np.tile(batch.mean(axis=(1, 2)) + 200, 6)[:, :16]
+
+def jpeg(colour, image_format="JPEG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), colour).save(buffer, image_format)
+    return buffer.getvalue()
+
+def test_admin_catalogue_api():
+    print("\n=== Testing /api/admin/catalogue ===")
+    client = app_module.app.test_client()
+    headers = {"X-Admin-Token": "secret"}
+    with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as images:
+        backbone = TemporaryStore(directory)
+        write_store(backbone, 20, seed=0)
+        saved = (middleware.ADMIN_TOKEN, app_module.backbone, app_module.model, catalogue_delta.CATALOGUE_IMAGES,
+                 catalogue_delta.CATALOGUE_COMPACT_ITEMS)
+        middleware.ADMIN_TOKEN, app_module.backbone, app_module.model = "secret", backbone, MeanColourModel()
+        catalogue_delta.CATALOGUE_IMAGES, catalogue_delta.CATALOGUE_COMPACT_ITEMS = images, 0
+        saved_index = app_module.index_handle.swap(load_search_index(backbone))
+        try:
+            upload = {"file": (io.BytesIO(jpeg((200, 20, 20))), "30000.jpg")}
+            assert client.post("/api/admin/catalogue", data=upload).status_code == 401
+            response = client.post("/api/admin/catalogue", headers=headers,
+                                   data={"file": (io.BytesIO(jpeg((200, 20, 20))), "30000.jpg")})
+            assert response.status_code == 201, response.json
+            assert os.path.isfile(os.path.join(images, "30000.jpg"))
+            query = app_module.extract_features_from_images(os.path.join(images, "30000.jpg"), app_module.model)
+            with app_module.index_handle.lease() as index:
+                assert names(index.search(query, 1)) == ["30000.jpg"]
+
+            # A PNG item is recommended, stored in history and drawn on the contact sheet under its own name
+            png = client.post("/api/admin/catalogue", headers=headers,
+                              data={"file": (io.BytesIO(jpeg((20, 200, 20), "PNG")), "60001.png")})
+            assert png.status_code == 201, png.json
+            query = app_module.extract_features_from_images(os.path.join(images, "60001.png"), app_module.model)
+            with app_module.index_handle.lease() as index:
+                recommendations = app_module.nearest_items(index, query)
+            assert recommendations[0]["filename"] == "60001.png"
+            assert unpack_recommendations(pack_recommendations(recommendations))[0]["filename"] == "60001.png"
+            for rec in recommendations[1:]:
+                Image.new("RGB", (60, 80)).save(os.path.join(images, rec["filename"]))
+            sheet = contact_sheet.describe([rec["filename"] for rec in recommendations])
+            assert sheet["tiles"][0]["filename"] == "60001.png"
+            saved_sheet_images = contact_sheet.contact_sheet_cache.image_dir
+            contact_sheet.contact_sheet_cache.image_dir = images
+            try:
+                assert client.get(sheet["url"]).status_code == 200
+            finally:
+                contact_sheet.contact_sheet_cache.image_dir = saved_sheet_images
+
+            again = client.post("/api/admin/catalogue", headers=headers,
+                                data={"file": (io.BytesIO(jpeg((20, 20, 200))), "30000.jpg")})
+            assert again.status_code == 409
+            replaced = client.put("/api/admin/catalogue/30000.jpg", headers=headers,
+                                  data={"file": (io.BytesIO(jpeg((20, 20, 200))), "blue.jpg")})
+            assert replaced.status_code == 200 and replaced.json["delta"]["added"] == 2
+            bad = client.put("/api/admin/catalogue/notes.txt", headers=headers,
+                             data={"file": (io.BytesIO(jpeg((20, 20, 200))), "blue.jpg")})
+            assert bad.status_code == 400
+
+            assert client.delete("/api/admin/catalogue/30000.jpg", headers=headers).status_code == 200
+            assert not os.path.exists(os.path.join(images, "30000.jpg"))
+            assert client.delete("/api/admin/catalogue/30000.jpg", headers=headers).status_code == 404
+            assert client.delete("/api/admin/catalogue/10002.jpg", headers=headers).status_code == 200
+
+            app_module.SEARCH_MODE = "sharded"
+            try:
+                assert client.post("/api/admin/catalogue/compact", headers=headers).status_code == 409
+            finally:
+                app_module.SEARCH_MODE = "exact"
+
+            generation = app_module.index_handle.current.generation
+            compacted = client.post("/api/admin/catalogue/compact?wait=true", headers=headers)
+            assert compacted.status_code == 200, compacted.json
+            current = app_module.index_handle.current
+            assert current.generation > generation and len(current.filenames) == 20
+            assert "60001.png" in map(os.path.basename, current.filenames)
+            print(f"✅ {compacted.json['index']['current']}")
+        finally:
+            app_module.index_handle.swap(saved_index)
+            (middleware.ADMIN_TOKEN, app_module.backbone, app_module.model, catalogue_delta.CATALOGUE_IMAGES,
+             catalogue_delta.CATALOGUE_COMPACT_ITEMS) = saved
+
+if __name__ == "__main__":
+    test_delta_segment_and_log()
+    test_compaction_drops_derived_indexes()
+    test_failed_reload_backs_off()
+    test_admin_catalogue_api()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+from PIL import Image
+from contact_sheet import ContactSheetCache, describe, layout, parse_sheet_args
+from image_variants import VariantError
+
+COLOURS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255)]
+
+def make_catalogue(directory):
+    """Write five solid-colour 3:4 product shots named like the catalogue"""
+    ids = []
+    for i, colour in enumerate(COLOURS):
+        item = str(10000 + i)
+        Image.new("RGB", (600, 800), color=colour).save(os.path.join(directory, f"{item}.jpg"), "JPEG", quality=95)
+        ids.append(item)
+    return ids
+
+def test_layout_from_recommendations():
+    print("\n=== Testing contact sheet layout ===")
+    sheet = describe([f"{10000 + i}.jpg" for i in range(5)], width=200, columns=3)
+    assert sheet["width"] == 600 and sheet["height"] == 2 * 267
+    assert [(tile["x"], tile["y"]) for tile in sheet["tiles"]] == [(0, 0), (200, 0), (400, 0), (0, 267), (200, 267)]
+    assert sheet["url"].startswith("/contact-sheet?ids=10000%2C10001")
+    assert describe([]) is None
+    print(f"✅ Layout {sheet['width']}x{sheet['height']} with {len(sheet['tiles'])} tiles")
+
+def test_parse_sheet_args():
+    print("\n=== Testing contact sheet parameters ===")
+    assert parse_sheet_args({"ids": "10000.jpg, 10001"}) == (["10000", "10001"], 200, "jpeg", 5)
+    for bad in ({}, {"ids": "../secret"}, {"ids": "10000.gif"}, {"ids": ",".join(["1"] * 25)}, {"ids": "1", "cols": "0"}):
+        try:
+            parse_sheet_args(bad)
+            assert False, f"{bad} should be rejected"
+        except VariantError as e:
+            print(f"✅ Rejected {bad}: {e}")
+
+def test_sheet_rendered_once_with_tiles_at_coordinates():
+    print("\n=== Testing contact sheet rendering and caching ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        ids = make_catalogue(tmp)
+        cache = ContactSheetCache(image_dir=tmp, cache_dir=os.path.join(tmp, "sheets"))
+
+        path, etag, mimetype = cache.get_sheet(ids, 100, "webp", 5)
+        assert mimetype == "image/webp"
+        with Image.open(path) as sheet:
+            sheet = sheet.convert("RGB")
+            for tile, colour in zip(layout(ids, 100, 5)["tiles"], COLOURS):
+                centre = sheet.getpixel((tile["x"] + tile["w"] // 2, tile["y"] + tile["h"] // 2))
+                assert all(abs(a - b) < 30 for a, b in zip(centre, colour)), (tile["id"], centre)
+
+        mtime = os.stat(path).st_mtime_ns
+        again, same_etag, _ = cache.get_sheet(ids, 100, "webp", 5)
+        assert again == path and same_etag == etag and os.stat(path).st_mtime_ns >= mtime
+        assert cache.get_sheet(list(reversed(ids)), 100, "webp", 5)[1] != etag
+
+        # Replacing a catalogue image renders the sheet again
+        Image.new("RGB", (600, 800), color=(0, 0, 0)).save(os.path.join(tmp, f"{ids[0]}.jpg"), "JPEG", quality=90)
+        replaced, replaced_etag, _ = cache.get_sheet(ids, 100, "webp", 5)
+        assert replaced_etag != etag
+        with Image.open(replaced) as sheet:
+            assert max(sheet.convert("RGB").getpixel((50, 66))) < 30
+
+        # Catalogue items added as PNG keep their extension in the id
+        Image.new("RGB", (600, 800), color=(255, 0, 255)).save(os.path.join(tmp, "60001.png"))
+        sheet = describe([f"{ids[1]}.jpg", "60001.png"], width=100)
+        assert [tile["filename"] for tile in sheet["tiles"]] == [f"{ids[1]}.jpg", "60001.png"]
+        png_ids, _, _, _ = parse_sheet_args({"ids": f"{ids[1]},60001.png"})
+        assert png_ids == [ids[1], "60001.png"]
+        png_path, _, _ = cache.get_sheet(png_ids, 100, "jpeg", 5)
+        with Image.open(png_path) as png_sheet:
+            centre = png_sheet.convert("RGB").getpixel((150, 66))
+            assert centre[0] > 200 and centre[1] < 50 and centre[2] > 200, centre
+
+        try:
+            cache.get_sheet(ids + ["99999"], 100, "webp", 5)
+            assert False, "Unknown id should fail"
+        except FileNotFoundError:
+            pass
+        print(f"✅ Sheet cached with ETag {etag[:12]}")
+
+if __name__ == "__main__":
+    test_layout_from_recommendations()
+    test_parse_sheet_args()
+    test_sheet_rendered_once_with_tiles_at_coordinates()
@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+import database
+from migrate import INDEXES, migrate
+
+def test_pool_metrics():
+    print("\n=== Testing connection pool metrics ===")
+    metrics = database.PoolMetrics()
+    event = SimpleNamespace(address=("localhost", 27017), reason="timeout")
+
+    def checkout(wait):
+        metrics.connection_check_out_started(event)
+        time.sleep(wait)
+        metrics.connection_checked_out(event)
+
+    threads = [threading.Thread(target=checkout, args=(0.01 * i,)) for i in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.connection_check_out_started(event)
+    metrics.connection_check_out_failed(event)
+
+    stats = metrics.snapshot()
+    assert stats["checkouts"] == 4 and stats["in_use"] == 4 and stats["waiting"] == 0
+    assert stats["checkout_failures"] == {"timeout": 1}
+    assert stats["max_waiting"] >= 2
+    assert 30 <= stats["wait_ms"]["max"] < 200, stats["wait_ms"]
+    for _ in range(4):
+        metrics.connection_checked_in(event)
+    assert metrics.snapshot()["in_use"] == 0
+    print(f"✅ {stats}")
+
+def test_memory_db_and_migration():
+    print("\n=== Testing in-memory database and migration ===")
+    db = database.MemoryDB()
+    assert db["user_profiles"] is db["user_profiles"], "Collections should be reused by name"
+    db["user_profiles"].insert_one({"user_id": "u1"})
+    assert db["user_profiles"].find_one({"user_id": "u1"})
+
+    created = migrate(db)
+    assert len(created) == sum(len(indexes) for indexes in INDEXES.values())
+    assert db["users"].indexes == {"username": True}
+    migrate(db)  # Running the migration again is harmless
+
+    # The module-level handles resolve to the process' database
+    assert database.users_collection.find_one({"username": "test_user"}) is not None
+    if database.using_memory_db():
+        # The fallback database is migrated too
+        try:
+            database.users_collection.insert_one({"username": "test_user", "password": "x"})
+            assert False, "Usernames should be unique in the in-memory database"
+        except database.DuplicateKeyError:
+            pass
+    print(f"✅ {len(created)} indexes, users: {database.users_collection!r}")
+
+def test_client_is_per_process():
+    print("\n=== Testing client creation after fork ===")
+    if not hasattr(os, "fork"):
+        print("fork() not available, skipping")
+        return
+    database.get_db()
+    parent_pid = database._pid
+    read_fd, write_fd = os.pipe()
+    child = os.fork()
+    if child == 0:
+        try:
+            stale = database._pid == os.getpid()
+            database.get_db()
+            os.write(write_fd, f"{int(stale)} {database._pid}".encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    stale, child_pid = os.read(read_fd, 100).decode().split()
+    os.waitpid(child, 0)
+    assert stale == "0", "A forked worker must not reuse the parent's client"
+    assert int(child_pid) == child and parent_pid == os.getpid()
+    print(f"✅ Parent {parent_pid} and child {child_pid} each connect their own client")
+
+if __name__ == "__main__":
+    test_pool_metrics()
+    test_memory_db_and_migration()
+    test_client_is_per_process()
@@ -0,0 +1,52 @@
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+import app as app_module
+from dedup import find_clusters
+from search_index import SearchIndex
+
+def catalogue_with_duplicates(seed=0):
+    """30 distinct products; products 0-4 also have 3 near-identical shots each"""
+    rng = np.random.default_rng(seed)
+    products = rng.normal(size=(30, 64))
+    products /= np.linalg.norm(products, axis=1, keepdims=True)
+    shots = [products[p] + 0.01 * rng.normal(size=64) for p in range(5) for _ in range(3)]
+    features = np.vstack([products, shots])
+    return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+def test_find_clusters():
+    print("\n=== Testing near-duplicate clustering ===")
+    features = catalogue_with_duplicates()
+    # A block size that doesn't divide the catalogue exercises the block edges
+    cluster_ids, representatives = find_clusters(features, threshold=0.97, block_size=7)
+
+    assert len(representatives) == 30, f"Expected 30 clusters, got {len(representatives)}"
+    for p in range(5):
+        shots = range(30 + 3 * p, 33 + 3 * p)
+        assert all(cluster_ids[s] == cluster_ids[p] for s in shots)
+    assert len(set(cluster_ids[5:30])) == 25
+    assert sorted(cluster_ids[representatives]) == list(range(30)), "One representative per cluster"
+    print(f"✅ {len(features)} items in {len(representatives)} clusters")
+
+def test_search_collapses_clusters():
+    print("\n=== Testing deduplicated search ===")
+    features = catalogue_with_duplicates()
+    filenames = [f"images/{10000 + i}.jpg" for i in range(len(features))]
+    cluster_ids, representatives = find_clusters(features, threshold=0.97)
+
+    neighbors = NearestNeighbors(algorithm="brute", metric="euclidean").fit(features[representatives])
+    index = SearchIndex(features, filenames, representatives, neighbors)
+    # A shot of product 2 matches its own cluster, which is left out
+    query = features[36]
+    recommendations = app_module.nearest_items(index, query, 5, exclude_query=True)
+    items = [int(rec["filename"][:-4]) - 10000 for rec in recommendations]
+    assert len(items) == 5
+    assert cluster_ids[2] not in cluster_ids[items], "The query's own cluster should be excluded"
+    assert len(set(cluster_ids[items])) == 5, "Each cluster should fill one slot at most"
+
+    # A query near no catalogue item keeps its nearest result
+    assert len(app_module.nearest_items(index, -query, 5, exclude_query=True)) == 5
+    print(f"✅ {recommendations}")
+
+if __name__ == "__main__":
+    test_find_clusters()
+    test_search_collapses_clusters()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import numpy as np
+from PIL import Image
+import app as app_module
+from admission import AdmissionController
+from colour_index import ColourIndex, colour_histogram, histogram_files
+from search_index import SearchIndex
+
+COLOURS = [(200, 30, 30), (30, 160, 40), (30, 50, 190), (220, 200, 40), (120, 40, 150), (20, 20, 20)]
+
+def garment(colour, seed, size=(300, 400)):
+    """A block of colour on a white studio background"""
+    rng = np.random.default_rng(seed)
+    pixels = np.full((size[1], size[0], 3), 255, dtype=np.uint8)
+    shade = np.clip(np.array(colour) + rng.integers(-15, 16, size=3), 0, 255)
+    pixels[80:320, 60:240] = shade
+    return Image.fromarray(pixels.astype(np.uint8))
+
+def patched(**values):
+    saved = {name: getattr(app_module, name) for name in values}
+    for name, value in values.items():
+        setattr(app_module, name, value)
+    return saved
+
+def test_colour_histogram_ignores_background():
+    print("\n=== Testing colour histograms ===")
+    red, blue = colour_histogram(garment(COLOURS[0], 0)), colour_histogram(garment(COLOURS[2], 0))
+    assert np.isclose(np.linalg.norm(red), 1.0)
+    # The white background would make every product shot look alike
+    assert np.linalg.norm(red - blue) > 1.0
+    assert np.linalg.norm(red - colour_histogram(garment(COLOURS[0], 1))) < 0.5
+    print("✅ Garment colours dominate the histogram")
+
+def test_degraded_tiers():
+    print("\n=== Testing degraded recommendation tiers ===")
+    with tempfile.TemporaryDirectory() as catalogue_dir:
+        filenames = []
+        for i in range(24):
+            path = os.path.join(catalogue_dir, f"{10000 + i}.jpg")
+            garment(COLOURS[i % len(COLOURS)], i).save(path, "JPEG")
+            filenames.append(path)
+        upload = os.path.join(catalogue_dir, "red_shirt.jpg")
+        garment(COLOURS[0], 99).save(upload, "JPEG")
+        rows = np.arange(len(filenames))
+        # Items 0-11 are shirts, the rest jeans
+        article_positions = {"Shirts": rows[:12], "Jeans": rows[12:]}
+
+        features = np.zeros((len(filenames), 1))
+        saved = patched(model=None, admission=app_module.admission)
+        saved_index = app_module.index_handle.swap(
+            SearchIndex(features, filenames, colour_index=ColourIndex(histogram_files(filenames)),
+                        article_positions=article_positions))
+        try:
+            recommendations, embedding, tier = app_module.find_recommendations(upload, "Shirt")
+            assert tier == "colour" and embedding is None
+            items = [int(rec["filename"][:-4]) - 10000 for rec in recommendations]
+            assert len(items) == 5 and all(i < 12 for i in items), "Colour search stays within the category"
+            assert items[:2] == [0, 6], f"Red shirts first: {items}"
+
+            app_module.index_handle.swap(SearchIndex(features, filenames, article_positions=article_positions))
+            recommendations, _, tier = app_module.find_recommendations(upload, "Jeans")
+            assert tier == "category"
+            assert [rec["filename"] for rec in recommendations] == [f"{10012 + i}.jpg" for i in range(5)]
+            assert all(rec["confidence"] == 50 for rec in recommendations)
+            assert app_module.find_recommendations(upload, "Fashion Item") == ([], None, "none")
+
+            # A shed request gets the colour tier instead of 503
+            app_module.index_handle.swap(SearchIndex(features, filenames, neighbors=object(),
+                                                     colour_index=ColourIndex(histogram_files(filenames)),
+                                                     article_positions=article_positions))
+            app_module.model = object()
+            app_module.admission = AdmissionController(max_concurrent=1, max_queue=0)
+            app_module.admission.acquire()
+            _, _, tier = app_module.find_recommendations(upload, "Shirt")
+            assert tier == "colour"
+            assert app_module.admission.stats()["shed"]["queue_full"] == 1
+            assert app_module.tier_counts["colour"] >= 2
+        finally:
+            patched(**saved)
+            app_module.index_handle.swap(saved_index)
+    print(f"✅ {app_module.tier_counts}")
+
+if __name__ == "__main__":
+    test_colour_histogram_ignores_background()
+    test_degraded_tiers()
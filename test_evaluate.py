@@ -0,0 +1,59 @@
+import os
+import tempfile
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+from evaluate import blocked_neighbors, load_category_codes, evaluate
+
+def make_catalogue(n_items=2000, dim=64, seed=1):
+    """Random unit-norm features shaped like Images_features.pkl"""
+    rng = np.random.default_rng(seed)
+    features = rng.normal(size=(n_items, dim)).astype(np.float32)
+    features /= np.linalg.norm(features, axis=1, keepdims=True)
+    filenames = [os.path.join("images", f"{10000 + i}.jpg") for i in range(n_items)]
+    return features, filenames
+
+def test_blocked_neighbors_matches_sklearn():
+    """Blocked search must rank exactly like the NearestNeighbors used by app.py"""
+    print("\n=== Testing blocked neighbour search ===")
+    features, _ = make_catalogue()
+    neighbors = NearestNeighbors(n_neighbors=6, algorithm="brute", metric="euclidean")
+    neighbors.fit(features)
+
+    expected_dist, expected_idx = neighbors.kneighbors(features[:300])
+    dist, idx, latencies = blocked_neighbors(features, features[:300], n_neighbors=6, block_size=64)
+
+    assert (idx == expected_idx).all(), "Neighbour order differs from sklearn"
+    assert np.allclose(dist, expected_dist, atol=1e-3), "Distances differ from sklearn"
+    assert len(latencies) == 300
+    print("✅ Blocked search matches sklearn brute force")
+
+def test_category_codes_and_report():
+    """Categories are mapped once and every labelled item is evaluated"""
+    print("\n=== Testing full-catalogue evaluation ===")
+    features, filenames = make_catalogue()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        styles_path = os.path.join(tmp, "styles.csv")
+        with open(styles_path, "w") as f:
+            f.write("id,gender,masterCategory\n")
+            # Leave the last 100 items without metadata
+            for i in range(len(filenames) - 100):
+                f.write(f"{10000 + i},Men,{['Apparel', 'Footwear'][i % 2]}\n")
+
+        codes, labels = load_category_codes(filenames, styles_path)
+
+    assert labels == ["Apparel", "Footwear"]
+    assert (codes[-100:] == -1).all() and (codes[:-100] >= 0).all()
+
+    report = evaluate(features, filenames, codes, labels, block_size=256, latency_samples=10)
+    print(f"Precision@5: {report['precision_at_k']}, 3-of-5: {report['match_rate']}")
+
+    assert report["queries"] == len(filenames) - 100
+    assert set(report["per_category"]) == {"Apparel", "Footwear"}
+    assert 0.0 <= report["match_rate"] <= 1.0
+    assert report["latency_ms"]["single_query"]["p50"] > 0
+    print("✅ Evaluation report computed")
+
+if __name__ == "__main__":
+    test_blocked_neighbors_matches_sklearn()
+    test_category_codes_and_report()
@@ -0,0 +1,74 @@
+import os
+import uuid
+from PIL import Image
+from app import app
+
+def page_assets():
+    """Requests a results page makes: API docs plus catalogue and upload images"""
+    upload_name = f"cache_test_{uuid.uuid4().hex}.jpg"
+    Image.new("RGB", (800, 1000), color=(40, 90, 160)).save(os.path.join("uploads", upload_name), "JPEG")
+    catalogue = sorted(os.listdir("images"))[:5]
+    return upload_name, ["/swagger.json", f"/uploads/{upload_name}"] + [f"/images/{name}" for name in catalogue]
+
+def load_page(client, urls, validators=None):
+    """Fetch every asset, replaying validators from an earlier load like a browser cache"""
+    responses = {}
+    for url in urls:
+        headers = {}
+        if validators and url in validators:
+            headers["If-None-Match"] = validators[url]
+        responses[url] = client.get(url, headers=headers)
+    return responses
+
+def test_repeated_page_load_saves_bytes():
+    print("\n=== Testing conditional requests on a repeated page load ===")
+    client = app.test_client()
+    upload_name, urls = page_assets()
+    try:
+        first = load_page(client, urls)
+        for url, response in first.items():
+            assert response.status_code == 200, f"{url}: {response.status_code}"
+            assert response.headers.get("ETag"), f"{url} has no ETag"
+            assert response.headers.get("Last-Modified"), f"{url} has no Last-Modified"
+            assert response.headers.get("Cache-Control"), f"{url} has no Cache-Control"
+        # Catalogue images can be replaced online, so they are revalidated rather than immutable
+        assert first[urls[-1]].headers["Cache-Control"] == "public, no-cache"
+
+        validators = {url: response.headers["ETag"] for url, response in first.items()}
+        second = load_page(client, urls, validators)
+
+        first_bytes = sum(len(response.data) for response in first.values())
+        second_bytes = sum(len(response.data) for response in second.values())
+        for url, response in second.items():
+            assert response.status_code == 304, f"{url}: {response.status_code}"
+
+        print(f"First load: {first_bytes} bytes, repeated load: {second_bytes} bytes")
+        print(f"✅ Saved {first_bytes - second_bytes} bytes ({len(urls)} requests answered with 304)")
+        assert second_bytes == 0 and first_bytes > 0
+    finally:
+        os.remove(os.path.join("uploads", upload_name))
+
+def test_etag_is_stable_content_hash():
+    print("\n=== Testing content-hash ETags ===")
+    client = app.test_client()
+    first = client.get("/swagger.json").headers["ETag"]
+    second = client.get("/swagger.json").headers["ETag"]
+    assert first == second
+    stale = client.get("/swagger.json", headers={"If-None-Match": '"not-the-current-etag"'})
+    assert stale.status_code == 200
+    print(f"✅ swagger.json ETag {first}")
+
+def test_range_request():
+    print("\n=== Testing Range support ===")
+    client = app.test_client()
+    full = client.get("/swagger.json")
+    partial = client.get("/swagger.json", headers={"Range": "bytes=0-99"})
+    assert partial.status_code == 206
+    assert partial.data == full.data[:100]
+    assert partial.headers["Content-Range"].startswith("bytes 0-99/")
+    print(f"✅ Range request returned {partial.headers['Content-Range']}")
+
+if __name__ == "__main__":
+    test_repeated_page_load_saves_bytes()
+    test_etag_is_stable_content_hash()
+    test_range_request()
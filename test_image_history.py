@@ -0,0 +1,48 @@
+from bson.binary import Binary
+import database
+from write_buffer import write_buffer
+from models import (get_image_by_id, get_user_images, pack_recommendations, save_uploaded_image,
+                    unpack_recommendations)
+
+RECOMMENDATIONS = [
+    {"filename": "10001.jpg", "category": "Fashion Item", "confidence": 93},
+    {"filename": "blue_tshirt.jpg", "category": "T-Shirt", "confidence": 87.5},
+]
+
+def test_compact_recommendations():
+    print("\n=== Testing compact recommendation storage ===")
+    packed = pack_recommendations(RECOMMENDATIONS)
+    assert packed["ids"] == [10001, "blue_tshirt.jpg"]
+    assert isinstance(packed["scores"], Binary) and len(packed["scores"]) == 4  # two float16 scores
+    assert unpack_recommendations(packed) == RECOMMENDATIONS
+    # Documents written before the compact layout keep working
+    assert unpack_recommendations(RECOMMENDATIONS) == RECOMMENDATIONS
+    assert unpack_recommendations(None) == []
+    # Leading zeros would be lost as an int
+    padded = pack_recommendations([{"filename": "0123.jpg", "confidence": 80}])
+    assert padded["ids"] == ["0123.jpg"]
+    assert unpack_recommendations(padded)[0]["filename"] == "0123.jpg"
+    print(f"✅ {packed}")
+
+def test_history_summary():
+    print("\n=== Testing image history projection ===")
+    saved = save_uploaded_image("history_user", "shirt.jpg", "/uploads/shirt.jpg", "Shirt", RECOMMENDATIONS)
+    assert saved["recommendations"] == RECOMMENDATIONS
+
+    write_buffer.flush()
+    stored = database.uploaded_images_collection.find_one({"user_id": "history_user"})
+    assert isinstance(stored["recommendations"], dict), "Recommendations should be stored packed"
+
+    images = get_user_images("history_user")
+    assert len(images) == 1
+    assert set(images[0]) == {"_id", "filename", "image_url", "category", "uploaded_at"}, images[0]
+
+    full = get_user_images("history_user", summary=False)[0]
+    assert full["recommendations"] == RECOMMENDATIONS
+    image = get_image_by_id(images[0]["_id"])
+    assert image["recommendations"] == RECOMMENDATIONS and image["user_id"] == "history_user"
+    print(f"✅ summary: {images[0]}")
+
+if __name__ == "__main__":
+    test_compact_recommendations()
+    test_history_summary()
@@ -0,0 +1,42 @@
+import io
+import numpy as np
+from PIL import Image
+from image_loader import load_image
+from benchmarks.decode_bench import load_img_array, synthetic_jpeg
+
+def test_matches_load_img():
+    print("\n=== Testing reduced-scale decoding ===")
+    photo = synthetic_jpeg(1800, 2400, seed=1)
+    fast = load_image(io.BytesIO(photo))
+    reference = load_img_array(io.BytesIO(photo))
+    assert fast.shape == (224, 224, 3) and fast.dtype == np.float32
+    difference = np.abs(fast - reference).mean()
+    assert difference < 8, f"Draft decode drifted from load_img: {difference:.2f}"
+
+    # Formats without DCT scaling decode exactly as before
+    png = io.BytesIO()
+    Image.open(io.BytesIO(photo)).resize((600, 800)).save(png, "PNG")
+    png.seek(0)
+    assert np.array_equal(load_image(png), load_img_array(io.BytesIO(png.getvalue())))
+    print(f"✅ Mean absolute difference {difference:.2f}")
+
+def test_exif_orientation():
+    print("\n=== Testing EXIF orientation ===")
+    # Stored landscape, tagged "rotate 90 CW": a phone photo held upright
+    pixels = np.zeros((600, 1200, 3), dtype=np.uint8)
+    pixels[:, :600] = (255, 0, 0)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    photo = io.BytesIO()
+    Image.fromarray(pixels).save(photo, "JPEG", exif=exif.tobytes(), quality=95)
+    photo.seek(0)
+
+    img = load_image(photo)
+    # After rotation the red half is on top
+    assert img[:100, :, 0].mean() > 200 and img[:100, :, 1].mean() < 50
+    assert img[-100:, :, 0].mean() < 50
+    print("✅ Rotated upright")
+
+if __name__ == "__main__":
+    test_matches_load_img()
+    test_exif_orientation()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+from PIL import Image
+from image_variants import VariantCache, VariantError, parse_variant_args
+
+def make_image(directory, name="10000.jpg", size=(1200, 1600)):
+    """Write a full-resolution JPEG like the catalogue photos"""
+    path = os.path.join(directory, name)
+    Image.new("RGB", size, color=(180, 40, 90)).save(path, "JPEG", quality=95)
+    return path
+
+def test_parse_variant_args():
+    print("\n=== Testing variant parameters ===")
+    assert parse_variant_args({}) == (None, None)
+    assert parse_variant_args({"w": "200", "fmt": "WebP"}) == (200, "webp")
+    assert parse_variant_args({"fmt": "jpg"}) == (None, "jpeg")
+    for bad in ({"w": "abc"}, {"w": "201"}, {"fmt": "gif"}):
+        try:
+            parse_variant_args(bad)
+            assert False, f"{bad} should be rejected"
+        except VariantError as e:
+            print(f"✅ Rejected {bad}: {e}")
+
+def test_variant_generated_once_and_cached():
+    print("\n=== Testing variant generation and reuse ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        source = make_image(tmp)
+        cache = VariantCache(os.path.join(tmp, "cache"), max_bytes=10 * 1024 * 1024)
+
+        path, etag, mimetype = cache.get(source, 200, "webp")
+        assert mimetype == "image/webp"
+        with Image.open(path) as img:
+            assert img.size == (200, 267), img.size
+        mtime = os.stat(path).st_mtime_ns
+
+        again, same_etag, _ = cache.get(source, 200, "webp")
+        assert again == path and same_etag == etag
+        assert os.stat(path).st_size > 0 and mtime <= os.stat(path).st_mtime_ns
+
+        _, other_etag, _ = cache.get(source, 400, "webp")
+        assert other_etag != etag
+        print(f"✅ Variant cached at {os.path.relpath(path, tmp)} with ETag {etag[:12]}")
+
+def test_exif_rotated_variant_width():
+    print("\n=== Testing variants of EXIF-rotated photos ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        # A landscape-stored phone photo shown as portrait (orientation 6: rotate 90 degrees)
+        source = os.path.join(tmp, "rotated.jpg")
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        Image.new("RGB", (4000, 3000), color=(180, 40, 90)).save(source, "JPEG", quality=90, exif=exif.tobytes())
+        cache = VariantCache(os.path.join(tmp, "cache"), max_bytes=10 * 1024 * 1024)
+        path, _, _ = cache.get(source, 1000, "jpeg")
+        with Image.open(path) as img:
+            assert img.size == (1000, 1333), img.size
+        print(f"✅ Rotated variant is {img.size[0]}x{img.size[1]}")
+
+def test_cache_evicts_least_recently_used():
+    print("\n=== Testing bounded cache eviction ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = [make_image(tmp, f"{10000 + i}.jpg") for i in range(6)]
+        cache = VariantCache(os.path.join(tmp, "cache"), max_bytes=1)
+        first, _, _ = cache.get(sources[0], 800, "jpeg")
+        variant_size = os.path.getsize(first)
+        cache.max_bytes = variant_size * 3
+
+        paths = [first] + [cache.get(source, 800, "jpeg")[0] for source in sources[1:]]
+
+        assert cache.size() <= cache.max_bytes
+        assert os.path.exists(paths[-1]), "Newest variant must survive eviction"
+        assert not os.path.exists(paths[0]), "Oldest variant should have been evicted"
+        print(f"✅ Cache holds {cache.size()} bytes (limit {cache.max_bytes})")
+
+if __name__ == "__main__":
+    test_parse_variant_args()
+    test_variant_generated_once_and_cached()
+    test_exif_rotated_variant_width()
+    test_cache_evicts_least_recently_used()
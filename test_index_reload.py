@@ -0,0 +1,99 @@
+import os
+import pickle as pkl
+import tempfile
+import time
+import numpy as np
+import app as app_module
+import middleware
+from backbones import Backbone, write_meta
+from search_index import IndexHandle, SearchIndex, load_search_index
+
+class TemporaryStore(Backbone):
+    """A 16-d backbone whose feature store is a temporary directory"""
+
+    def __init__(self, directory):
+        super().__init__("test", "ResNet50", "resnet50", 224, 16)
+        self.directory = directory
+
+    @property
+    def store_dir(self):
+        return self.directory
+
+def write_store(backbone, n_items, seed, n_filenames=None):
+    rng = np.random.default_rng(seed)
+    features = rng.random((n_items, backbone.dim)).astype(np.float32)
+    features /= np.linalg.norm(features, axis=1, keepdims=True)
+    filenames = [f"images/{10000 + i}.jpg" for i in range(n_filenames or n_items)]
+    pkl.dump(features, open(backbone.path("Images_features.pkl"), "wb"))
+    pkl.dump(filenames, open(backbone.path("filenames.pkl"), "wb"))
+    write_meta(backbone, n_items)
+
+def test_swap_drains_old_index():
+    print("\n=== Testing index swap and drain ===")
+    old, new = SearchIndex([], []), SearchIndex([], [])
+    handle = IndexHandle(old)
+    with handle.lease() as leased:
+        assert leased is old
+        assert handle.swap(new) is old
+        # New queries get the new index while the old one finishes its query
+        with handle.lease() as second:
+            assert second is new
+        assert handle.stats()["draining"][0]["in_flight"] == 1
+    assert handle.draining == [] and old.leases == 0
+    assert handle.stats()["current"]["generation"] == 2
+    print("✅ Old index released once its last query returned")
+
+def test_reload_from_store():
+    print("\n=== Testing background reload ===")
+    with tempfile.TemporaryDirectory() as directory:
+        backbone = TemporaryStore(directory)
+        write_store(backbone, 20, seed=0)
+        handle = IndexHandle(load_search_index(backbone))
+        loader = lambda: load_search_index(backbone)
+
+        write_store(backbone, 30, seed=1)
+        assert handle.reload(loader, wait=True)
+        assert len(handle.current.filenames) == 30 and handle.current.generation == 2
+
+        # A broken store is rejected and the loaded index keeps serving
+        write_store(backbone, 30, seed=2, n_filenames=25)
+        handle.reload(loader, wait=True)
+        assert len(handle.current.filenames) == 30 and handle.current.generation == 2
+        assert handle.reloads == {"succeeded": 1, "failed": 1} and "25 filenames" in handle.last_error
+
+        # The watcher picks up a store rewritten on disk
+        handle.watch(backbone, loader, interval=0.05)
+        time.sleep(0.2)
+        write_store(backbone, 40, seed=3)
+        deadline = time.monotonic() + 10
+        while len(handle.current.filenames) != 40 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert len(handle.current.filenames) == 40
+        print(f"✅ {handle.stats()}")
+
+def test_admin_reload_endpoint():
+    print("\n=== Testing /api/admin/reload-index ===")
+    client = app_module.app.test_client()
+    saved_token = middleware.ADMIN_TOKEN
+    middleware.ADMIN_TOKEN = None
+    try:
+        assert client.post("/api/admin/reload-index").status_code == 403
+        middleware.ADMIN_TOKEN = "secret"
+        assert client.post("/api/admin/reload-index", headers={"X-Admin-Token": "wrong"}).status_code == 401
+
+        current = app_module.index_handle.current
+        response = client.post("/api/admin/reload-index?wait=true", headers={"X-Admin-Token": "secret"})
+        if response.status_code == 500:
+            # The repository's feature store may be Git LFS pointers
+            assert app_module.index_handle.current is current
+        else:
+            assert response.status_code == 200 and app_module.index_handle.current is not current
+        assert client.get("/api/metrics").json["index"]["reloads"] == app_module.index_handle.reloads
+        print(f"✅ {response.json}")
+    finally:
+        middleware.ADMIN_TOKEN = saved_token
+
+if __name__ == "__main__":
+    test_swap_drains_old_index()
+    test_reload_from_store()
+    test_admin_reload_endpoint()
@@ -0,0 +1,72 @@
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+import app as app_module
+from app import app
+from models import delete_image, get_image_by_id, save_uploaded_image
+from profiles import get_taste, update_taste
+from search_index import SearchIndex
+from write_buffer import write_buffer
+import database
+
+def unit(vector):
+    return vector / np.linalg.norm(vector)
+
+def test_taste_vector():
+    print("\n=== Testing incremental taste vector ===")
+    rng = np.random.default_rng(0)
+    embeddings = [unit(rng.random(64)) for _ in range(3)]
+    for embedding in embeddings:
+        update_taste("taste_user", embedding)
+
+    taste, count = get_taste("taste_user")
+    assert count == 3
+    assert np.allclose(taste, unit(np.mean(embeddings, axis=0)), atol=1e-5)
+
+    assert update_taste("taste_user", embeddings[0], remove=True) == 2
+    taste, count = get_taste("taste_user")
+    assert np.allclose(taste, unit(np.mean(embeddings[1:], axis=0)), atol=1e-5)
+
+    update_taste("taste_user", embeddings[1], remove=True)
+    update_taste("taste_user", embeddings[2], remove=True)
+    assert get_taste("taste_user") == (None, 0)
+    print("✅ running centroid matches the mean of the uploads")
+
+def test_personal_endpoint():
+    print("\n=== Testing /api/recommend/personal ===")
+    rng = np.random.default_rng(1)
+    catalogue = np.array([unit(rng.random(64)) for _ in range(20)])
+    neighbors = NearestNeighbors(n_neighbors=6, algorithm="brute", metric="euclidean").fit(catalogue)
+    saved_index = app_module.index_handle.swap(
+        SearchIndex(catalogue, [f"images/{10000 + i}.jpg" for i in range(20)], neighbors=neighbors))
+    client = app.test_client()
+    try:
+        login = client.post("/api/auth/login", json={"username": "guest", "password": "style123"}).json
+        headers = {"Authorization": f"Bearer {login['token']}"}
+        user_id = login["user"]["_id"]
+
+        response = client.get("/api/recommend/personal", headers=headers)
+        assert response.status_code == 404, response.json
+
+        embedding = unit(catalogue[3] + 0.01 * rng.random(64))
+        saved = save_uploaded_image(user_id, "look.jpg", "/uploads/look.jpg", "Fashion Item", [], embedding)
+        write_buffer.flush()
+        stored = database.uploaded_images_collection.find_one({"filename": "look.jpg", "user_id": user_id})
+        assert len(stored["embedding"]) == 64 * 2, "Embedding should be stored as float16"
+        assert "embedding" not in get_image_by_id(saved["_id"])
+
+        response = client.get("/api/recommend/personal?limit=3", headers=headers)
+        assert response.status_code == 200, response.json
+        body = response.json
+        assert [rec["filename"] for rec in body["recommendations"]][0] == "10003.jpg", body
+        assert len(body["recommendations"]) == 3 and body["based_on_uploads"] == 1
+        assert client.get("/api/recommend/personal?limit=0", headers=headers).status_code == 400
+
+        assert delete_image(saved["_id"], user_id)
+        assert client.get("/api/recommend/personal", headers=headers).status_code == 404
+        print(f"✅ {body['recommendations']}")
+    finally:
+        app_module.index_handle.swap(saved_index)
+
+if __name__ == "__main__":
+    test_taste_vector()
+    test_personal_endpoint()
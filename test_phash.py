@@ -0,0 +1,81 @@
+import io
+import os
+import tempfile
+import numpy as np
+from PIL import Image, ImageFilter
+import app as app_module
+from phash import CatalogueMatcher, HashIndex, hamming, hash_files, phash, precompute_neighbours
+from search_index import SearchIndex
+
+def product_photo(seed, size=(600, 800)):
+    """Smooth random shapes on a white background, like a product shot"""
+    rng = np.random.default_rng(seed)
+    pixels = np.full((size[1] // 8, size[0] // 8, 3), 255, dtype=np.uint8)
+    for _ in range(6):
+        y, x = rng.integers(0, pixels.shape[0] - 20), rng.integers(0, pixels.shape[1] - 20)
+        h, w = rng.integers(10, 60, size=2)
+        pixels[y:y + h, x:x + w] = rng.integers(0, 200, size=3)
+    return Image.fromarray(pixels).resize(size, Image.BILINEAR).filter(ImageFilter.GaussianBlur(4))
+
+def test_multi_index_search():
+    print("\n=== Testing multi-index Hamming search ===")
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2**63, size=5000, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+    index = HashIndex(hashes)
+    for row in rng.integers(0, len(hashes), size=50):
+        query = int(hashes[row])
+        for bit in rng.choice(64, size=rng.integers(0, 7), replace=False):
+            query ^= 1 << int(bit)
+        expected = sorted((int(r), int(d)) for r, d in enumerate(hamming(hashes, query)) if d <= 6)
+        assert sorted(index.search(query, 6)) == expected
+        assert index.search(query, 6)[0][0] == row
+    print("✅ multi-index results match a brute-force scan")
+
+def test_catalogue_copy_skips_model():
+    print("\n=== Testing pHash short-circuit for catalogue copies ===")
+    with tempfile.TemporaryDirectory() as catalogue_dir:
+        filenames = []
+        for i in range(12):
+            path = os.path.join(catalogue_dir, f"{10000 + i}.jpg")
+            product_photo(i).save(path, "JPEG", quality=90)
+            filenames.append(path)
+        hashes = hash_files(filenames)
+
+        # Re-encoded, resized copy of item 4
+        copy = io.BytesIO()
+        Image.open(filenames[4]).resize((300, 400)).save(copy, "JPEG", quality=60)
+        copy_path = os.path.join(catalogue_dir, "upload.jpg")
+        with open(copy_path, "wb") as f:
+            f.write(copy.getvalue())
+        assert hamming(hashes, phash(copy_path))[4] <= 6
+
+        rng = np.random.default_rng(0)
+        features = rng.random((12, 32)).astype(np.float32)
+        features /= np.linalg.norm(features, axis=1, keepdims=True)
+        neighbours, distances = precompute_neighbours(features, np.arange(12))
+        assert 4 not in neighbours[4], "An item should not be recommended for itself"
+
+        matcher = CatalogueMatcher(hashes, neighbours, distances)
+        assert matcher.match(copy_path)[0] == 4
+        unrelated = os.path.join(catalogue_dir, "other.jpg")
+        product_photo(99).save(unrelated, "JPEG")
+        assert matcher.match(unrelated) is None
+
+        saved_index = app_module.index_handle.swap(SearchIndex(features, filenames, catalogue_matcher=matcher))
+        saved_model = app_module.model
+        app_module.model = None
+        try:
+            recommendations, embedding, tier = app_module.find_recommendations(copy_path)
+            assert tier == "catalogue_copy"
+            assert [rec["filename"] for rec in recommendations] == [f"{10000 + i}.jpg" for i in neighbours[4]]
+            assert np.allclose(embedding, features[4])
+            # Other uploads still need the model (not loaded here)
+            assert app_module.find_recommendations(unrelated) == ([], None, "none")
+        finally:
+            app_module.index_handle.swap(saved_index)
+            app_module.model = saved_model
+        print(f"✅ {recommendations}")
+
+if __name__ == "__main__":
+    test_multi_index_search()
+    test_catalogue_copy_skips_model()
@@ -0,0 +1,47 @@
+import numpy as np
+from evaluate import evaluate_query_cache
+from query_cache import SemanticCache
+
+def unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+def reshot(vector, rng, noise=0.1):
+    """The same embedding perturbed like a second photo of the garment"""
+    perturbation = rng.standard_normal(len(vector))
+    return unit(vector + noise * perturbation / np.linalg.norm(perturbation))
+
+def test_semantic_cache():
+    print("\n=== Testing semantic query cache ===")
+    rng = np.random.default_rng(0)
+    queries = unit(rng.standard_normal((50, 256)))
+    cache = SemanticCache(max_entries=20, similarity=0.98)
+    for i, query in enumerate(queries):
+        assert cache.get(query) is None
+        cache.put(query, [f"{i}.jpg"])
+
+    # Only the 20 most recent queries are kept
+    assert cache.stats()["entries"] == 20
+    hits = sum(cache.get(reshot(query, rng)) == [f"{i}.jpg"] for i, query in enumerate(queries[30:], 30))
+    assert hits >= 17, f"Re-shots of cached queries should mostly hit, got {hits}/20"
+    assert cache.get(reshot(queries[0], rng)) is None, "Evicted query should miss"
+    assert cache.get(unit(rng.standard_normal(256))) is None
+    print(f"✅ {hits}/20 re-shots hit, stats: {cache.stats()}")
+
+def test_query_cache_evaluation():
+    print("\n=== Testing query cache evaluation ===")
+    rng = np.random.default_rng(1)
+    centres = unit(rng.standard_normal((10, 128)))
+    codes = np.repeat(np.arange(10), 100).astype(np.int32)
+    features = unit(centres[codes] + 0.6 * rng.standard_normal((1000, 128)) / np.sqrt(128))
+
+    report = evaluate_query_cache(features, codes, repeats=0.3, noise=0.1, cache_size=2000)
+    assert report["queries"] == 1300 and report["reshots"] == 300
+    assert report["reshot_hit_rate"] > 0.8, report
+    assert report["distinct_item_hit_rate"] < 0.05, report
+    on_hits = report["on_hits"]
+    assert on_hits["overlap_at_k"] > 0.5 and on_hits["cached_precision_at_k"] > 0.9, report
+    print(f"✅ {report}")
+
+if __name__ == "__main__":
+    test_semantic_cache()
+    test_query_cache_evaluation()
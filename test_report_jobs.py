@@ -0,0 +1,123 @@
+import os
+import re
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from app import json_flag
+from database import uploaded_images_collection
+from report_jobs import DONE, ReportJobs, iter_user_images, write_user_report
+
+def fake_uploads(count):
+    for i in range(count):
+        yield {
+            "filename": f"upload_{i}.jpg",
+            "category": "Shirt",
+            "uploaded_at": datetime(2025, 4, 6, 12, 30),
+            "recommendations": [
+                {"filename": f"{10000 + j}.jpg", "category": "Tshirt", "confidence": 90 - j} for j in range(5)
+            ],
+        }
+
+def check_pdf(path):
+    """Every xref entry must point at its object; returns the page count"""
+    data = open(path, "rb").read()
+    assert data.startswith(b"%PDF-") and data.rstrip().endswith(b"%%EOF")
+    xref = int(re.search(rb"startxref\n(\d+)", data).group(1))
+    assert data[xref:xref + 4] == b"xref"
+    count = int(re.match(rb"xref\n0 (\d+)\n", data[xref:]).group(1))
+    entries = re.findall(rb"(\d{10}) 00000 n ", data[xref:])
+    assert len(entries) == count - 1
+    for number, offset in enumerate(entries, 1):
+        assert data[int(offset):].startswith(f"{number} 0 obj".encode()), f"Bad offset for object {number}"
+    return int(re.search(rb"/Type /Pages /Kids \[[^\]]*\] /Count (\d+)", data).group(1))
+
+def test_large_report_streams_to_disk():
+    print("\n=== Testing streamed multi-analysis report ===")
+    workdir = tempfile.mkdtemp()
+    try:
+        small_path = os.path.join(workdir, "small.pdf")
+        write_user_report(small_path, fake_uploads(100), 100, include_images=False)
+
+        path = os.path.join(workdir, "large.pdf")
+        tracemalloc.start()
+        started = time.perf_counter()
+        done, pages = write_user_report(path, fake_uploads(3000), 3000, include_images=False)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert done == 3000 and check_pdf(path) == pages
+        assert os.path.getsize(path) > 20 * os.path.getsize(small_path)
+        assert peak < 2 * 1024 * 1024, f"Peak traced memory {peak} bytes"
+        print(f"✅ {done} analyses, {pages} pages, {os.path.getsize(path)} bytes in {elapsed:.2f}s "
+              f"(peak {peak / 1024:.0f} KB)")
+    finally:
+        shutil.rmtree(workdir)
+
+def test_report_job_lifecycle():
+    print("\n=== Testing report job queue ===")
+    import report_jobs
+    workdir = tempfile.mkdtemp()
+    original = report_jobs.iter_user_images, report_jobs.count_user_images
+    report_jobs.iter_user_images = lambda user_id: fake_uploads(120)
+    report_jobs.count_user_images = lambda user_id: 120
+    jobs = ReportJobs(job_dir=workdir, workers=1)
+    try:
+        job = jobs.submit("user_1", include_images=False)
+        assert jobs.get(job["id"])["user_id"] == "user_1"
+        jobs.shutdown(wait=True)
+
+        job = jobs.get(job["id"])
+        assert job["status"] == DONE, job
+        assert job["done"] == job["total"] == 120
+        assert check_pdf(jobs.output_path(job["id"])) == job["pages"]
+        assert not os.path.exists(jobs.output_path(job["id"]) + ".part")
+        assert jobs.get("../etc") is None
+
+        jobs.ttl = -1
+        jobs.cleanup()
+        assert jobs.get(job["id"]) is None and not os.path.exists(jobs.output_path(job["id"]))
+        print(f"✅ Job finished: {job['pages']} pages, {job['size']} bytes")
+    finally:
+        report_jobs.iter_user_images, report_jobs.count_user_images = original
+        jobs.shutdown()
+        shutil.rmtree(workdir)
+
+def test_pages_survive_concurrent_uploads():
+    print("\n=== Testing keyset pages while the user uploads ===")
+    started = datetime(2025, 4, 6, 12, 0)
+    # Pairs of uploads share a timestamp, so _id breaks the ties
+    stored = [{"_id": ObjectId(), "user_id": "keyset_user", "filename": f"look_{i}.jpg", "category": "Shirt",
+               "uploaded_at": started + timedelta(minutes=i // 2), "recommendations": []} for i in range(10)]
+    for doc in stored:
+        uploaded_images_collection.insert_one(doc)
+    try:
+        images = iter_user_images("keyset_user", batch_size=3)
+        read = [next(images)["filename"] for _ in range(3)]
+        # A new upload and a deleted, already read one would shift offset pages
+        uploaded_images_collection.insert_one({"_id": ObjectId(), "user_id": "keyset_user", "filename": "new.jpg",
+                                               "uploaded_at": started + timedelta(hours=1), "recommendations": []})
+        uploaded_images_collection.delete_one({"_id": stored[-1]["_id"]})
+        read += [image["filename"] for image in images]
+        assert read == [f"look_{i}.jpg" for i in range(9, -1, -1)], read
+        print(f"✅ Read {len(read)} uploads once each, newest first")
+    finally:
+        for doc in list(uploaded_images_collection.find({"user_id": "keyset_user"})):
+            uploaded_images_collection.delete_one({"_id": doc["_id"]})
+
+def test_include_images_flag():
+    print("\n=== Testing the include_images flag ===")
+    assert json_flag({}, "include_images", True) is True
+    for value, expected in ((False, False), ("false", False), ("False", False), ("0", False), (True, True),
+                            ("true", True), (1, True)):
+        assert json_flag({"include_images": value}, "include_images", True) is expected, value
+    print("✅ String and boolean flags parsed")
+
+if __name__ == "__main__":
+    test_large_report_streams_to_disk()
+    test_report_job_lifecycle()
+    test_pages_survive_concurrent_uploads()
+    test_include_images_flag()
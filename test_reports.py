@@ -0,0 +1,109 @@
+import os
+import re
+import shutil
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from PIL import Image
+import reports
+from image_variants import VariantCache
+from reports import (ReportCache, ThumbnailStore, collect_thumbnails, compile_layout, generate_pdf_report,
+                     render_report, report_cache, report_key)
+
+RECOMMENDATIONS = [
+    {"filename": f"{10000 + i}.jpg", "category": "Shirt", "confidence": 95 - i} for i in range(5)
+]
+
+def test_render_report():
+    print("\n=== Testing compiled report rendering ===")
+    pdf = render_report(RECOMMENDATIONS, "Shirt", "Casual", generated_on=datetime(2025, 4, 6, 12, 30))
+    assert pdf.startswith(b"%PDF-") and pdf.rstrip().endswith(b"%%EOF")
+
+    layout = compile_layout(len(RECOMMENDATIONS))
+    assert compile_layout(len(RECOMMENDATIONS)) is layout, "Layout should be compiled once"
+    assert "Fashion Style Analysis Report" in layout.static_content
+    assert [element[0] for element in layout.variable][:3] == ["generated_on", "category", "style"]
+
+    # Non latin-1 input must not break the core fonts
+    assert render_report(RECOMMENDATIONS, "Kurta क", "Ethnic").startswith(b"%PDF-")
+    print(f"✅ Rendered {len(pdf)} byte report")
+
+def test_repeated_report_served_from_cache():
+    print("\n=== Testing report cache ===")
+    report_cache.clear()
+    now = datetime(2025, 4, 6, 12, 30, 5)
+    first, key = generate_pdf_report(RECOMMENDATIONS, "Shirt", "Casual", generated_on=now)
+    second, same_key = generate_pdf_report(list(RECOMMENDATIONS), "Shirt", "Casual",
+                                           generated_on=datetime(2025, 4, 6, 12, 30, 50))
+    assert key == same_key and first is second
+
+    _, other_key = generate_pdf_report(RECOMMENDATIONS, "Shirt", "Formal", generated_on=now)
+    assert other_key != key
+    assert report_key(RECOMMENDATIONS[:4], "Shirt", "Casual", generated_on=now) != key
+    # The printed timestamp is part of the report, so a later request renders it again
+    later, later_key = generate_pdf_report(RECOMMENDATIONS, "Shirt", "Casual", generated_on=datetime(2025, 4, 9, 8, 0))
+    assert later_key != key and later != first
+    print(f"✅ Cache stats: {report_cache.stats()}")
+
+def test_cache_is_bounded_lru():
+    print("\n=== Testing LRU bound ===")
+    cache = ReportCache(max_entries=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.put("c", b"3")
+    assert cache.get("b") is None, "Least recently used entry should be evicted"
+    assert cache.get("a") == b"1" and cache.get("c") == b"3"
+    print(f"✅ {cache.stats()}")
+
+def test_report_with_thumbnails():
+    print("\n=== Testing report thumbnails ===")
+    workdir = tempfile.mkdtemp()
+    original_store = reports.thumbnail_store
+    try:
+        image_dir = os.path.join(workdir, "images")
+        os.makedirs(image_dir)
+        for i, rec in enumerate(RECOMMENDATIONS):
+            Image.new("RGB", (1200, 1600), (40 * i, 80, 120)).save(os.path.join(image_dir, rec["filename"]), quality=95)
+        store = ThumbnailStore(image_dir, cache=VariantCache(os.path.join(workdir, "variants")))
+        reports.thumbnail_store = store
+
+        thumbnails = collect_thumbnails(RECOMMENDATIONS)
+        assert len(thumbnails) == len(RECOMMENDATIONS)
+        assert all(info["w"] == 100 for _, _, info in thumbnails), "Thumbnails should be the small variants"
+        assert collect_thumbnails(RECOMMENDATIONS)[0][2] is thumbnails[0][2], "Parsed thumbnails should be reused"
+        assert len(collect_thumbnails(RECOMMENDATIONS, max_bytes=reports.TEXT_OVERHEAD_BYTES)) == 0
+
+        text_only = render_report(RECOMMENDATIONS, "Shirt", "Casual")
+        started = time.perf_counter()
+        pdf = render_report(RECOMMENDATIONS, "Shirt", "Casual", include_images=True)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        assert pdf.count(b"/Subtype /Image") == len(RECOMMENDATIONS)
+        assert len(pdf) <= reports.REPORT_MAX_BYTES and len(pdf) > len(text_only)
+        assert elapsed_ms < 100, f"Report took {elapsed_ms:.1f}ms"
+
+        # A missing catalogue image leaves its slot empty instead of failing
+        missing = [{"filename": "missing.jpg", "category": "Shirt", "confidence": 50}] + RECOMMENDATIONS
+        assert [slot for slot, _, _ in collect_thumbnails(missing)] == [1, 2, 3, 4]
+        assert render_report(missing, "Shirt", "Casual", include_images=True).count(b"/Subtype /Image") == 4
+
+        # A repeated item draws the same image object, which must be in the page resources
+        repeated = render_report(RECOMMENDATIONS[:2] + RECOMMENDATIONS[:1], "Shirt", "Casual", include_images=True)
+        pages = zlib.decompress(re.search(rb"/Filter /FlateDecode /Length \d+>>\nstream\n(.*?)endstream", repeated,
+                                          re.S).group(1))
+        drawn = set(re.findall(rb"/I(\d+) Do", pages))
+        assert drawn == set(re.findall(rb"/I(\d+) \d+ 0 R", repeated)) == {b"1", b"2"}
+        assert repeated.count(b"/Subtype /Image") == 2
+
+        assert report_key(RECOMMENDATIONS, "Shirt", "Casual", True) != report_key(RECOMMENDATIONS, "Shirt", "Casual")
+        print(f"✅ {len(pdf)} byte report with thumbnails in {elapsed_ms:.1f}ms (text only: {len(text_only)} bytes)")
+    finally:
+        reports.thumbnail_store = original_store
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    test_render_report()
+    test_repeated_report_served_from_cache()
+    test_cache_is_bounded_lru()
+    test_report_with_thumbnails()
@@ -0,0 +1,120 @@
+import os
+import pickle as pkl
+import signal
+import tempfile
+import time
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+import shard_search
+from backbones import Backbone, store_version, write_meta
+from search_index import load_search_index
+from shard_search import LocalShards, ShardsUnavailable, partition, split
+
+def catalogue(n_items, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    features = rng.random((n_items, dim)).astype(np.float32)
+    return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+def test_scatter_gather_matches_exact():
+    print("\n=== Testing scatter-gather search ===")
+    features = catalogue(300)
+    queries = catalogue(10, seed=1)
+    exact_distances, exact_positions = NearestNeighbors(algorithm="brute").fit(features).kneighbors(queries, 5)
+    with LocalShards(features, shards=3, version="v1") as shards:
+        index = shards.connect(deadline_ms=5000)
+        distances, positions = index.kneighbors(queries, 5)
+        assert np.array_equal(positions, exact_positions)
+        assert np.allclose(distances, exact_distances, atol=1e-5)
+
+        index.check("v1", 300)
+        for version, items in (("v2", 300), ("v1", 200)):
+            try:
+                index.check(version, items)
+                assert False, "Shards of another store should be refused"
+            except ValueError:
+                pass
+        print(f"✅ {index.stats()}")
+
+def test_slow_shard_deadline():
+    print("\n=== Testing the shard deadline ===")
+    features = catalogue(300)
+    with LocalShards(features, shards=3) as shards:
+        index = shards.connect(deadline_ms=300)
+        # Warm up the connections
+        index.deadline = 5
+        index.kneighbors(features[:1], 5)
+        index.deadline = 0.3
+
+        stalled = shards.processes[1]
+        os.kill(stalled.pid, signal.SIGSTOP)
+        try:
+            began = time.perf_counter()
+            _, positions = index.kneighbors(features[:4], 5)
+            assert time.perf_counter() - began < 2, "A stalled shard should not hold up the query"
+            assert not set(positions.ravel()) & set(partition(300, 3)[1]), "Only the other shards answer"
+            assert positions[0][0] == 0 and positions[3][0] == 3
+            stats = index.stats()
+            assert stats["partial"] == 1 and stats["timeouts"] == [0, 1, 0]
+        finally:
+            os.kill(stalled.pid, signal.SIGCONT)
+
+        # The shard is used again once it answers
+        index.deadline = 5
+        _, positions = index.kneighbors(features[150:151], 1)
+        assert positions[0][0] == 150
+
+        for process in shards.processes:
+            os.kill(process.pid, signal.SIGSTOP)
+        index.deadline = 0.2
+        try:
+            index.kneighbors(features[:1], 5)
+            assert False, "No shard answered"
+        except ShardsUnavailable:
+            pass
+        finally:
+            for process in shards.processes:
+                os.kill(process.pid, signal.SIGCONT)
+        print(f"✅ {index.stats()}")
+
+class TemporaryStore(Backbone):
+    """A 16-d backbone whose feature store is a temporary directory"""
+
+    def __init__(self, directory):
+        super().__init__("test", "ResNet50", "resnet50", 224, 16)
+        self.directory = directory
+
+    @property
+    def store_dir(self):
+        return self.directory
+
+def test_sharded_search_index():
+    print("\n=== Testing SEARCH_MODE=sharded ===")
+    with tempfile.TemporaryDirectory() as directory:
+        backbone = TemporaryStore(directory)
+        features = catalogue(40)
+        pkl.dump(features, open(backbone.path("Images_features.pkl"), "wb"))
+        pkl.dump([f"images/{10000 + i}.jpg" for i in range(40)], open(backbone.path("filenames.pkl"), "wb"))
+        write_meta(backbone, 40)
+        version = store_version(backbone)
+
+        paths = split(features, np.arange(40), 2, version, os.path.join(directory, "shards"))
+        shard_files = [pkl.load(open(path, "rb")) for path in paths]
+        assert [len(data["positions"]) for data in shard_files] == [20, 20]
+        assert np.array_equal(shard_files[1]["features"], features[20:])
+
+        saved = shard_search.SHARD_ADDRESSES, shard_search.SHARD_AUTHKEY
+        with LocalShards(features, shards=2, version=version) as shards:
+            shard_search.SHARD_ADDRESSES = ",".join(f"{host}:{port}" for host, port in shards.addresses)
+            shard_search.SHARD_AUTHKEY = shards.authkey
+            try:
+                index = load_search_index(backbone, "sharded")
+                assert [os.path.basename(f) for _, f in index.search(features[27], 3)][0] == "10027.jpg"
+                assert index.describe()["shards"]["shards"] == 2
+            finally:
+                shard_search.SHARD_ADDRESSES, shard_search.SHARD_AUTHKEY = saved
+        print(f"✅ {index.describe()}")
+
+if __name__ == "__main__":
+    test_scatter_gather_matches_exact()
+    test_slow_shard_deadline()
+    test_sharded_search_index()
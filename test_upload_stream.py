@@ -0,0 +1,55 @@
+import io
+import json
+import os
+import cloudinary
+from PIL import Image
+from app import app
+from benchmarks.fake_cloudinary import start_fake_cloudinary
+
+def parse_events(body):
+    """(event, data) pairs of a Server-Sent Events body"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_upload_stream_events():
+    print("\n=== Testing streamed /upload ===")
+    fake_cloudinary = start_fake_cloudinary()
+    cloudinary.config(upload_prefix=f"http://127.0.0.1:{fake_cloudinary.server_address[1]}")
+    existing_uploads = set(os.listdir("uploads"))
+    client = app.test_client()
+    try:
+        token = client.post("/api/auth/login", json={"username": "test_user", "password": "password123"}).json["token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        buffer = io.BytesIO()
+        Image.new("RGB", (320, 240), color=(73, 109, 137)).save(buffer, "JPEG")
+
+        response = client.post("/upload/stream", headers=headers,
+                               data={"file": (io.BytesIO(buffer.getvalue()), "shirt.jpg")})
+        assert response.status_code == 200
+        assert response.mimetype == "text/event-stream"
+        events = parse_events(response.get_data(as_text=True))
+        assert [name for name, _ in events] == ["recommendations", "image_url", "saved", "done"], events
+
+        done = events[-1][1]
+        assert done["status"] == "success"
+        assert done["recommendations"] == events[0][1]["recommendations"]
+        assert done["image_url"] == events[1][1]["image_url"]
+        assert done["image_id"] == events[2][1]["image_id"]
+
+        plain = client.post("/upload", headers=headers, data={"file": (io.BytesIO(buffer.getvalue()), "shirt.jpg")})
+        assert set(plain.json) == set(done), "Final event should match the /upload response"
+
+        missing = client.post("/upload/stream", headers=headers, data={})
+        assert missing.status_code == 400
+        print(f"✅ Events: {[name for name, _ in events]}")
+    finally:
+        cloudinary.config(upload_prefix=None)
+        fake_cloudinary.shutdown()
+        for name in set(os.listdir("uploads")) - existing_uploads:
+            os.remove(os.path.join("uploads", name))
+
+if __name__ == "__main__":
+    test_upload_stream_events()
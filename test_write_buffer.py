@@ -0,0 +1,88 @@
+import time
+from write_buffer import WriteBehindBuffer, write_buffer
+from models import delete_image, get_image_by_id, get_user_images, save_uploaded_image
+
+class RecordingCollection:
+    """Collection that records each bulk_write batch"""
+
+    def __init__(self):
+        self.batches = []
+        self.inserted = []
+
+    def bulk_write(self, requests, ordered=True):
+        self.batches.append(requests)
+
+    def insert_one(self, doc):
+        self.inserted.append(doc)
+
+def test_batches_and_coalescing():
+    print("\n=== Testing write-behind batching ===")
+    collections = {"uploaded_images": RecordingCollection(), "users": RecordingCollection()}
+    buffer = WriteBehindBuffer(batch_size=10, flush_interval=0.05, enabled=True, get_db=lambda: collections)
+
+    ids = [buffer.insert("uploaded_images", {"n": i}) for i in range(25)]
+    assert len(set(ids)) == 25
+    for _ in range(3):
+        buffer.update_one("users", {"_id": "test123"}, {"$set": {"last_login": time.time()}})
+    buffer.update_one("users", {"_id": "guest123"}, {"$set": {"last_login": time.time()}})
+    assert buffer.stats["coalesced"] == 2
+
+    deadline = time.time() + 2
+    while buffer.stats["written"] < 27 and time.time() < deadline:
+        time.sleep(0.01)
+    buffer.close()
+
+    inserts = collections["uploaded_images"].batches
+    assert sum(len(batch) for batch in inserts) == 25
+    assert len(inserts) <= 4, f"25 inserts should take a few batches, not {len(inserts)}"
+    assert sum(len(batch) for batch in collections["users"].batches) == 2
+    print(f"✅ insert batches: {[len(batch) for batch in inserts]}, stats: {buffer.stats}")
+
+def test_close_flushes():
+    print("\n=== Testing flush on close ===")
+    collections = {"uploaded_images": RecordingCollection()}
+    buffer = WriteBehindBuffer(batch_size=1000, flush_interval=60, enabled=True, get_db=lambda: collections)
+    for i in range(5):
+        buffer.insert("uploaded_images", {"n": i})
+    assert not collections["uploaded_images"].batches
+    buffer.close()
+    assert [len(batch) for batch in collections["uploaded_images"].batches] == [5]
+    # Writes after close go straight to the database
+    buffer.insert("uploaded_images", {"n": 5})
+    assert [doc["n"] for doc in collections["uploaded_images"].inserted] == [5]
+    print("✅ queued writes flushed on close")
+
+def test_read_your_writes():
+    print("\n=== Testing read-your-writes with queued uploads ===")
+    write_buffer.flush()
+    interval = write_buffer.flush_interval
+    write_buffer.flush_interval = 60
+    try:
+        saved = [save_uploaded_image("ryw_user", f"look_{i}.jpg", f"/uploads/look_{i}.jpg", "Fashion Item")
+                 for i in range(3)]
+        time.sleep(0.01)
+        assert write_buffer.pending("uploaded_images", {"user_id": "ryw_user"}), "Uploads should still be queued"
+
+        images = get_user_images("ryw_user")
+        assert [image["filename"] for image in images] == ["look_2.jpg", "look_1.jpg", "look_0.jpg"], images
+        assert [image["filename"] for image in get_user_images("ryw_user", limit=2, skip=1)] == ["look_1.jpg", "look_0.jpg"]
+        assert get_image_by_id(saved[0]["_id"])["filename"] == "look_0.jpg"
+
+        write_buffer.flush()
+        assert not write_buffer.pending("uploaded_images", {"user_id": "ryw_user"})
+        assert [image["_id"] for image in get_user_images("ryw_user")] == [image["_id"] for image in reversed(saved)]
+
+        save_uploaded_image("ryw_user", "look_3.jpg", "/uploads/look_3.jpg", "Fashion Item")
+        names = [image["filename"] for image in get_user_images("ryw_user", limit=3)]
+        assert names == ["look_3.jpg", "look_2.jpg", "look_1.jpg"], names
+        assert delete_image(saved[1]["_id"], "ryw_user")
+        assert len(get_user_images("ryw_user")) == 3
+    finally:
+        write_buffer.flush_interval = interval
+        write_buffer.flush()
+    print("✅ queued uploads are visible in the user's history")
+
+if __name__ == "__main__":
+    test_batches_and_coalescing()
+    test_close_flushes()
+    test_read_your_writes()
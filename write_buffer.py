@@ -0,0 +1,214 @@
+"""
+Write-behind buffer for MongoDB
+
+Upload records and last-login updates are queued and written in batches
+(one bulk_write per collection) by a background thread, as soon as
+WRITE_BATCH_SIZE operations are waiting or WRITE_FLUSH_INTERVAL_MS after
+the first one was queued. Queued documents already carry their _id, so
+callers can return it immediately, and models.py overlays queued uploads on
+history reads so users always see their own uploads. The buffer belongs to
+one process and is flushed when the process exits.
+"""
+import atexit
+import copy
+import os
+import threading
+
+from bson.objectid import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import database
+
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '100'))
+WRITE_FLUSH_INTERVAL_MS = int(os.getenv('WRITE_FLUSH_INTERVAL_MS', '100'))
+# Operations kept for retry while MongoDB is unreachable; the oldest are dropped beyond this
+WRITE_MAX_PENDING = int(os.getenv('WRITE_MAX_PENDING', '10000'))
+# WRITE_BEHIND=0 writes every operation synchronously, as before
+WRITE_BEHIND = os.getenv('WRITE_BEHIND', '1') != '0'
+
+INSERT, UPDATE = "insert", "update"
+
+
+class WriteBehindBuffer:
+    """Queue of inserts and updates flushed to the database in batches"""
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL_MS / 1000,
+                 max_pending=WRITE_MAX_PENDING, enabled=WRITE_BEHIND, get_db=database.get_db):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self.get_db = get_db
+        self.stats = {"queued": 0, "written": 0, "coalesced": 0, "batches": 0, "errors": 0, "dropped": 0}
+        self._ops = []        # (collection, INSERT, document) or (collection, UPDATE, (query, update))
+        self._inflight = []   # Operations taken by the flush that is writing them right now
+        self._updates = {}    # (collection, query) -> update document of a queued update
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._closed = False
+
+    def _start(self):
+        """Start the flush thread of this process (called with the condition held)"""
+        if self._pid != os.getpid():
+            # A forked worker gets a copy of the parent's queue but not its thread;
+            # the parent still owns (and writes) those operations
+            self._ops, self._inflight, self._updates = [], [], {}
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="write-behind", daemon=True).start()
+
+    def _queue(self, op):
+        self._start()
+        self._ops.append(op)
+        self.stats["queued"] += 1
+        self._cond.notify_all()
+
+    def insert(self, collection, doc):
+        """
+        Queue a document insert
+
+        Args:
+            collection (str): Collection name
+            doc (dict): Document; an ObjectId _id is added if it has none
+
+        Returns:
+            The document's _id
+        """
+        doc.setdefault("_id", ObjectId())
+        if not self.enabled or self._closed:
+            self.get_db()[collection].insert_one(doc)
+            return doc["_id"]
+        with self._cond:
+            # Shallow copy so the caller can reformat its dict for the response
+            self._queue((collection, INSERT, copy.copy(doc)))
+        return doc["_id"]
+
+    def update_one(self, collection, query, update):
+        """
+        Queue an update of one document
+
+        A "$set" update of a document that already has a queued "$set" update
+        is merged into it, so e.g. repeated logins write last_login once.
+
+        Args:
+            collection (str): Collection name
+            query (dict): Filter selecting the document
+            update (dict): Update operators
+        """
+        if not self.enabled or self._closed:
+            self.get_db()[collection].update_one(query, update)
+            return
+        key = (collection, repr(sorted(query.items())))
+        with self._cond:
+            queued = self._updates.get(key)
+            if queued is not None and set(queued) == set(update) == {"$set"}:
+                queued["$set"].update(update["$set"])
+                self.stats["coalesced"] += 1
+                return
+            update = {operator: dict(fields) for operator, fields in update.items()}
+            self._updates[key] = update
+            self._queue((collection, UPDATE, (query, update)))
+
+    def pending(self, collection, query):
+        """
+        Copies of queued (not yet written) documents matching a query
+
+        Args:
+            collection (str): Collection name
+            query (dict): Field equality filter
+
+        Returns:
+            list: Matching documents, oldest first
+        """
+        with self._cond:
+            docs = [doc for name, kind, doc in self._inflight + self._ops if name == collection and kind == INSERT]
+        return [dict(doc) for doc in docs if all(doc.get(k) == v for k, v in query.items())]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._ops or self._closed)
+                if self._closed:
+                    return
+                # Give the batch until the interval is up to fill
+                self._cond.wait_for(lambda: len(self._ops) >= self.batch_size or self._closed,
+                                    timeout=self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """
+        Write all queued operations now
+
+        Returns:
+            int: Number of operations written
+        """
+        with self._flush_lock:
+            with self._cond:
+                ops, self._ops, self._updates = self._ops, [], {}
+                self._inflight = ops
+            try:
+                written, retry = self._write(ops)
+            finally:
+                with self._cond:
+                    self._inflight = []
+            if retry:
+                with self._cond:
+                    self._ops = retry + self._ops
+                    overflow = len(self._ops) - self.max_pending
+                    if overflow > 0:
+                        print(f"Write-behind buffer full, dropping {overflow} operations")
+                        del self._ops[:overflow]
+                        self.stats["dropped"] += overflow
+            return written
+
+    def _write(self, ops):
+        """Write operations grouped by collection; returns (written, operations to retry)"""
+        by_collection = {}
+        for op in ops:
+            by_collection.setdefault(op[0], []).append(op)
+
+        written, retry = 0, []
+        for name, collection_ops in by_collection.items():
+            try:
+                collection = self.get_db()[name]
+                if hasattr(collection, "bulk_write"):
+                    requests = [InsertOne(payload) if kind == INSERT else UpdateOne(*payload)
+                                for _, kind, payload in collection_ops]
+                    # Unordered: the operations are independent, and one bad document
+                    # must not stop the rest of the batch
+                    collection.bulk_write(requests, ordered=False)
+                else:
+                    # The in-memory fallback collection has no bulk_write
+                    for _, kind, payload in collection_ops:
+                        if kind == INSERT:
+                            collection.insert_one(payload)
+                        else:
+                            collection.update_one(*payload)
+                written += len(collection_ops)
+            except BulkWriteError as e:
+                # Rejected documents (e.g. duplicate keys) would fail again; the rest were written
+                failed = len(e.details.get("writeErrors", []))
+                print(f"Write-behind: {failed} of {len(collection_ops)} writes to {name} failed: {e}")
+                written += len(collection_ops) - failed
+                self.stats["errors"] += failed
+            except Exception as e:
+                print(f"Write-behind: could not write {len(collection_ops)} operations to {name}, will retry: {e}")
+                retry.extend(collection_ops)
+                self.stats["errors"] += 1
+                continue
+            self.stats["batches"] += 1
+        self.stats["written"] += written
+        return written, retry
+
+    def close(self):
+        """Stop the flush thread and write everything still queued"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._pid == os.getpid():
+            self.flush()
+
+
+write_buffer = WriteBehindBuffer()
+atexit.register(write_buffer.close)